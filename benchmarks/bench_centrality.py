@@ -0,0 +1,173 @@
+"""
+Compares the linear-time sentence centrality of summarizer.rank_sentences with the original similarity matrix path.
+
+For documents of increasing length, with random embeddings of the size produced by the default encoder, checks that
+both pick the same sentences and prints the time and peak memory each one takes, to show where the linear path
+starts to pay off. Run from the repository root:
+
+    python benchmarks/bench_centrality.py
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from sklearn.metrics.pairwise import cosine_similarity  # noqa: E402
+
+from summarizer import calculate_centrality_scores, rank_sentences  # noqa: E402
+
+
+def legacy_top_sentences(
+    sentences: List[str], embeddings: np.ndarray, num_sentences: int
+) -> List[str]:
+    """
+    The original scoring: the row sums of the full cosine similarity matrix, followed by a full sort.
+
+    Args:
+        sentences (list): A list of sentences.
+        embeddings (numpy.ndarray): The embedding of each sentence.
+        num_sentences (int): The number of top sentences to extract.
+
+    Returns:
+        list: A list of the top-scoring sentences.
+    """
+    similarity_matrix = cosine_similarity(embeddings, embeddings)
+    scores = similarity_matrix.sum(axis=1)
+    ranked_sentences = sorted(
+        ((scores[i], s) for i, s in enumerate(sentences)), reverse=True
+    )
+    return [sentence for _, sentence in ranked_sentences[:num_sentences]]
+
+
+def measure(function: Callable[[], List[str]], runs: int) -> Tuple[float, float]:
+    """
+    Returns the best time of several runs of a function and the peak memory it allocates.
+
+    Args:
+        function (callable): The function, without arguments.
+        runs (int): The number of timed runs.
+
+    Returns:
+        tuple: The fastest run in seconds and the peak allocated memory in MB.
+    """
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best, peak / 2**20
+
+
+def same_selection(
+    embeddings: np.ndarray, legacy: List[str], linear: List[str]
+) -> bool:
+    """
+    Checks that both paths picked the same sentences, allowing different picks only among scores that are equal up
+    to floating point rounding.
+
+    Args:
+        embeddings (numpy.ndarray): The embedding of each sentence.
+        legacy (list): The sentences picked by the original path.
+        linear (list): The sentences picked by the linear path.
+
+    Returns:
+        bool: True if the selections agree.
+    """
+    if legacy == linear:
+        return True
+    scores = calculate_centrality_scores(embeddings.astype(np.float64))
+    legacy_scores = [scores[int(sentence.split()[-1])] for sentence in legacy]
+    linear_scores = [scores[int(sentence.split()[-1])] for sentence in linear]
+    return np.allclose(legacy_scores, linear_scores, rtol=1e-5, atol=1e-5)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="runs per size")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=[3, 10, 30, 100, 300, 1000, 3000, 10000],
+        help="numbers of sentences per document",
+    )
+    parser.add_argument("--dim", type=int, default=768, help="embedding size")
+    parser.add_argument(
+        "--num-sentences", type=int, default=3, help="sentences per summary"
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(
+        "{:>9}{:>14}{:>14}{:>10}{:>14}{:>14}".format(
+            "sentences",
+            "matrix (ms)",
+            "linear (ms)",
+            "speedup",
+            "matrix (MB)",
+            "linear (MB)",
+        )
+    )
+    crossover = None
+    mismatches = []
+    for size in args.sizes:
+        # Sentence embeddings share a common direction, like those of a real article
+        embeddings = (
+            rng.standard_normal((size, args.dim)) + rng.standard_normal(args.dim)
+        ).astype(np.float32)
+        sentences = ["sentence {}".format(i) for i in range(size)]
+
+        legacy = legacy_top_sentences(sentences, embeddings, args.num_sentences)
+        linear = rank_sentences(sentences, embeddings, args.num_sentences)
+        if not same_selection(embeddings, legacy, linear):
+            mismatches.append(size)
+
+        legacy_time, legacy_memory = measure(
+            lambda: legacy_top_sentences(sentences, embeddings, args.num_sentences),
+            args.runs,
+        )
+        linear_time, linear_memory = measure(
+            lambda: rank_sentences(sentences, embeddings, args.num_sentences),
+            args.runs,
+        )
+        if crossover is None and linear_time < legacy_time:
+            crossover = size
+        print(
+            "{:>9}{:>14.3f}{:>14.3f}{:>9.1f}x{:>14.2f}{:>14.2f}".format(
+                size,
+                legacy_time * 1000,
+                linear_time * 1000,
+                legacy_time / linear_time,
+                legacy_memory,
+                linear_memory,
+            )
+        )
+
+    if crossover is not None:
+        print("The linear path is faster from {} sentences on.".format(crossover))
+    if mismatches:
+        print(
+            "The selected sentences differ for: {}".format(
+                ", ".join(str(size) for size in mismatches)
+            )
+        )
+        sys.exit(1)
+    print("Both paths select the same sentences for every size.")
+
+
+if __name__ == "__main__":
+    main()
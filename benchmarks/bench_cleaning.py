@@ -0,0 +1,157 @@
+"""
+Compares preprocess.remove_unwanted_words with the original sequence of re.sub calls it replaced.
+
+Checks that both give the same output for every sample article body in benchmarks/fixtures/articles, and for long
+live-blog style pages built by repeating them, and prints the time each one takes. Run from the repository root:
+
+    python benchmarks/bench_cleaning.py
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from preprocess import remove_unwanted_words  # noqa: E402
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "articles"
+)
+
+# The patterns exactly as they were written in preprocess.py, including the non-raw "\b"
+LEGACY_PATTERNS = [
+    "(?i)(?<=\.).*?Subscreva as newsletters.*?\.",
+    "(?i)Leia Também[\s\S]*",
+    "(?i)Ver Twitter",
+    "(?i)PartilharPartilhar no FacebookTwitterEmailWhatsappPartilhar[\s\S]*",
+    "\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b",  # remove emails
+    "(?i)(?<=\.).*?FacebookTwitterWhatsAppE-mailPartilharComentar",
+    "(?i)FecharSubscrever newsletter[\s\S]*?Subscrever",
+    "(?i)Partilhar este artigoFacebookTwitterWhatsAppE-mailPartilharComentários[\s\S]*",
+    "(?i)Para continuar a ler[\s\S]*",
+    "(?i)Os leitores são a força e a vida do jornal[\s\S]*",
+    "(?i)(?<=\.).*?FacebookTwitterPartilharComentar",
+    "(?:(?<=\.)|^)*[\s\S]*FacebookTwitterPartilharComentar",
+    "\(\.\.\.\)",
+    "(?i)\bpub\b",
+    "(?i)Enviar Comentário[\s\S]*",
+    "(?:(?<=\.)|^)*[\s\S]*LogoutEm Destaque",
+]
+
+
+def legacy_remove_unwanted_words(string: str) -> str:
+    """
+    The original implementation of preprocess.remove_unwanted_words.
+
+    Args:
+        string (str): The input string to clean.
+
+    Returns:
+        str: The cleaned string.
+    """
+    string = string.replace("\xa0", " ")
+    cleaned_string = string
+    for pattern in LEGACY_PATTERNS:
+        cleaned_string = re.sub(pattern, " ", cleaned_string)
+    return cleaned_string
+
+
+def load_samples(repeats: List[int]) -> Dict[str, str]:
+    """
+    Loads the sample article bodies and builds longer pages out of them.
+
+    Args:
+        repeats (list): How many copies of all the samples each long page has.
+
+    Returns:
+        dict: A mapping of sample name to article body.
+    """
+    samples = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as fixture:
+            samples[os.path.splitext(os.path.basename(path))[0]] = fixture.read()
+
+    # Live-blog pages are many articles' worth of plain text without boilerplate markers
+    plain_text = " ".join(
+        legacy_remove_unwanted_words(body).strip() for body in samples.values()
+    )
+    for repeat in repeats:
+        samples["long_x{}".format(repeat)] = " ".join([plain_text] * repeat)
+    return samples
+
+
+def time_function(function: Callable[[str], str], text: str, runs: int) -> float:
+    """
+    Returns the best time of several runs of a cleaning function.
+
+    Args:
+        function (callable): The cleaning function.
+        text (str): The text to clean.
+        runs (int): The number of runs.
+
+    Returns:
+        float: The fastest run, in seconds.
+    """
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="runs per sample")
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        nargs="*",
+        default=[1, 4],
+        help="sizes of the long pages, in copies of all the samples",
+    )
+    args = parser.parse_args()
+
+    samples = load_samples(args.repeats)
+
+    print(
+        "{:<24}{:>10}{:>14}{:>14}{:>10}".format(
+            "sample", "chars", "legacy (ms)", "engine (ms)", "speedup"
+        )
+    )
+    mismatches = []
+    for name, body in samples.items():
+        if legacy_remove_unwanted_words(body) != remove_unwanted_words(body):
+            mismatches.append(name)
+
+        legacy_time = time_function(legacy_remove_unwanted_words, body, args.runs)
+        engine_time = time_function(remove_unwanted_words, body, args.runs)
+        print(
+            "{:<24}{:>10}{:>14.3f}{:>14.3f}{:>9.1f}x".format(
+                name,
+                len(body),
+                legacy_time * 1000,
+                engine_time * 1000,
+                legacy_time / engine_time,
+            )
+        )
+
+    if mismatches:
+        print(
+            "Output differs from the original implementation for: {}".format(
+                ", ".join(mismatches)
+            )
+        )
+        sys.exit(1)
+    print("Output is identical to the original implementation for every sample.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Compares the encoder backends of model_registry on the sample articles in benchmarks/fixtures.
+
+Each backend runs in its own process, so its load time and memory are measured from a clean start. For every sample
+article the sentences picked by summarizer.extract_top_sentences are checked against the "torch" backend, and the
+encoding time per article and the process RSS are printed. Run from the repository root:
+
+    python benchmarks/bench_encoder.py
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from config import load_parameters  # noqa: E402
+from memory import get_peak_rss_mb, get_rss_mb  # noqa: E402
+from model_registry import BACKENDS, get_load_stats, get_model  # noqa: E402
+from nlp_resources import preload  # noqa: E402
+from scraper import get_article_extractor  # noqa: E402
+from summarizer import (  # noqa: E402
+    calculate_similarity_scores,
+    extract_top_sentences,
+    preprocess_text,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_documents() -> Dict[str, str]:
+    """
+    Loads the sample article bodies and the bodies of the saved article pages.
+
+    Returns:
+        dict: A mapping of sample name to article body.
+    """
+    documents = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "articles", "*.txt"))):
+        with open(path, "r", encoding="utf-8") as fixture:
+            documents[os.path.basename(path)] = fixture.read()
+
+    extractor = get_article_extractor()
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "html", "*.html"))):
+        outlet = os.path.splitext(os.path.basename(path))[0]
+        url = "https://{}/".format(extractor.outlets[outlet]["domains"][0])
+        with open(path, "rb") as fixture:
+            documents[os.path.basename(path)] = extractor.extract(fixture.read(), url)[
+                1
+            ]
+    return documents
+
+
+def run_backend(
+    model_name: str, backend: str, num_sentences: int, runs: int
+) -> Dict[str, Any]:
+    """
+    Summarizes every sample article with one backend. Runs in a fresh worker process.
+
+    Args:
+        model_name (str): The Hugging Face name or local path of the model.
+        backend (str): The encoder backend.
+        num_sentences (int): The number of sentences of each summary.
+        runs (int): The number of timed encodings of each article.
+
+    Returns:
+        dict: The load statistics, encoding times, memory usage and selected sentences.
+    """
+    preload(download=False)
+    sentence_lists = {
+        name: preprocess_text(body) for name, body in load_documents().items()
+    }
+
+    model = get_model(model_name, backend)
+    summaries = {}
+    encode_seconds = []
+    for name, sentences in sentence_lists.items():
+        if not sentences:
+            continue
+        best = float("inf")
+        for _ in range(runs):
+            start = time.perf_counter()
+            embeddings = model.encode(sentences)
+            best = min(best, time.perf_counter() - start)
+        encode_seconds.append(best)
+        summaries[name] = extract_top_sentences(
+            sentences, calculate_similarity_scores(embeddings), num_sentences
+        )
+
+    return {
+        "load": get_load_stats()[(model_name, backend)],
+        "encode_ms": 1000 * sum(encode_seconds) / len(encode_seconds),
+        "rss_mb": get_rss_mb(),
+        "peak_rss_mb": get_peak_rss_mb(),
+        "summaries": summaries,
+    }
+
+
+def main() -> None:
+    parameters = load_parameters()
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--model",
+        default=parameters["sentence_transfomer"],
+        help="Hugging Face name or local path of the model",
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="*",
+        default=list(BACKENDS),
+        choices=BACKENDS,
+        help="backends to compare, the first one is the reference",
+    )
+    parser.add_argument("--runs", type=int, default=3, help="runs per article")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for backend in args.backends:
+        # A new process per backend, so each one starts without any model in memory
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            future = executor.submit(
+                run_backend, args.model, backend, parameters["num_sentences"], args.runs
+            )
+            try:
+                results[backend] = future.result()
+            except Exception as e:
+                print("Skipping backend {}: {!r}".format(backend, e))
+
+    if not results:
+        sys.exit(1)
+
+    reference_backend = next(iter(results))
+    reference = results[reference_backend]["summaries"]
+    print("Model: {}, reference backend: {}".format(args.model, reference_backend))
+    print(
+        "{:<12}{:>10}{:>14}{:>16}{:>12}{:>16}{:>10}".format(
+            "backend",
+            "load (s)",
+            "model (MB)",
+            "encode (ms)",
+            "RSS (MB)",
+            "peak RSS (MB)",
+            "parity",
+        )
+    )
+    mismatches: List[str] = []
+    for backend, result in results.items():
+        matching = [
+            name
+            for name, summary in result["summaries"].items()
+            if reference.get(name) == summary
+        ]
+        mismatches.extend(
+            "{} ({})".format(name, backend)
+            for name in result["summaries"]
+            if name not in matching
+        )
+        print(
+            "{:<12}{:>10.2f}{:>14.1f}{:>16.2f}{:>12.1f}{:>16.1f}{:>10}".format(
+                backend,
+                result["load"]["load_seconds"],
+                result["load"]["model_rss_mb"],
+                result["encode_ms"],
+                result["rss_mb"],
+                result["peak_rss_mb"],
+                "{}/{}".format(len(matching), len(result["summaries"])),
+            )
+        )
+
+    if mismatches:
+        print(
+            "Summaries differ from the reference for: {}".format(", ".join(mismatches))
+        )
+        sys.exit(1)
+    print("Every backend picks the same summary sentences as the reference.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+"""
+Runs the bot end to end without network access and records how long each step takes.
+
+The saved article page of every outlet in benchmarks/fixtures/html is served by a recorded fetcher and the
+submissions come from the FakeReddit of tests/fake_reddit.py, so no request leaves the machine. Two kinds of
+measurements are made, each in a fresh process so peak memory is measured from a clean start:
+
+    stages   the latency of every step of one article: fetch, parse, clean, sentence split, embed, rank,
+             keywords and template render
+    modes    the throughput in articles per second of sum_bot_init in each processing mode
+
+The results are written to a JSON file, which can be compared with the results of another commit. Run from the
+repository root:
+
+    python benchmarks/bench_pipeline.py --output before.json
+    python benchmarks/bench_pipeline.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+# The fake Reddit client lives with the tests
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests")
+)
+
+
+import fetcher  # noqa: E402
+import sum_bot  # noqa: E402
+import summarizer  # noqa: E402
+from fake_reddit import FakeReddit, FakeSubmission  # noqa: E402
+from memory import get_peak_rss_mb  # noqa: E402
+from model_registry import get_load_stats  # noqa: E402
+from preprocess import Document  # noqa: E402
+from scraper import get_article_extractor, parse_html  # noqa: E402
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "html"
+)
+
+STAGES = ["fetch", "parse", "clean", "split", "embed", "rank", "keywords", "render"]
+MODES = ["serial", "batch", "pipeline"]
+
+# Metrics where a higher value is better, every other metric is better when lower
+HIGHER_IS_BETTER = ("articles_per_second",)
+
+
+class RecordedFetcher:
+    """
+    Serves the saved page of an article's outlet instead of downloading it.
+
+    Args:
+        pages (dict): A mapping of outlet name to the html of its saved page.
+    """
+
+    def __init__(self, pages: Dict[str, bytes]):
+        self.pages = pages
+        self.extractor = get_article_extractor()
+
+    def fetch(self, url: str) -> bytes:
+        return self.pages[self.extractor.get_outlet(url)]
+
+    def fetch_all(self, urls: List[str]) -> Dict[str, Any]:
+        return {url: self.fetch(url) for url in urls}
+
+    def close(self) -> None:
+        pass
+
+
+def load_pages() -> Dict[str, bytes]:
+    """
+    Loads the saved article page of every outlet.
+
+    Returns:
+        dict: A mapping of outlet name to the html of its page.
+    """
+    pages = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES_DIR, name), "rb") as fixture:
+                pages[os.path.splitext(name)[0]] = fixture.read()
+    return pages
+
+
+def article_urls(outlets: List[str], repeats: int) -> List[str]:
+    """
+    Builds a distinct article URL on the website of each outlet, repeats times.
+
+    Args:
+        outlets (list): The outlet names.
+        repeats (int): The number of articles of each outlet.
+
+    Returns:
+        list: The URLs.
+    """
+    extractor = get_article_extractor()
+    return [
+        "https://{}/artigo-{}.html".format(
+            extractor.outlets[outlet]["domains"][0], repeat
+        )
+        for repeat in range(repeats)
+        for outlet in outlets
+    ]
+
+
+def configure(args: argparse.Namespace, work_dir: str, urls: List[str]) -> None:
+    """
+    Points the bot at the recorded pages, the benchmark model and a scratch folder for its databases.
+
+    Args:
+        args (argparse.Namespace): The benchmark options.
+        work_dir (str): The scratch folder.
+        urls (list): The article URLs, whose websites are whitelisted.
+    """
+    # Every module shares the parameters loaded by config
+    parameters = sum_bot.PARAMETERS
+    parameters["sentence_transfomer"] = args.model
+    parameters["encoder_backend"] = args.backend
+    parameters["mode"] = args.worker
+    parameters["subreddits"] = ["benchmark"]
+    parameters["num_posts"] = len(urls)
+    parameters["whitelist"] = sorted({fetcher.get_domain(url) for url in urls})
+    parameters["nltk"] = dict(parameters["nltk"], download=False)
+    parameters["processed_posts"] = {
+        "path": os.path.join(work_dir, "processed_posts.db"),
+        "legacy_log": None,
+    }
+    # Every article is processed from scratch
+    parameters["summary_cache"] = dict(parameters["summary_cache"], enabled=False)
+    parameters["html_cache"] = dict(parameters["html_cache"], enabled=False)
+    parameters["embedding_cache"] = dict(
+        parameters["embedding_cache"], enabled=args.embedding_cache, path=None
+    )
+    parameters["metrics"] = dict(parameters["metrics"], path=None)
+    parameters["reply_queue"] = dict(
+        parameters["reply_queue"], path=os.path.join(work_dir, "reply_queue.db")
+    )
+    parameters["claims"] = dict(
+        parameters["claims"], backend="sqlite", path=os.path.join(work_dir, "claims.db")
+    )
+    fetcher.set_fetcher(RecordedFetcher(load_pages()))
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """
+    Summarizes a list of durations.
+
+    Args:
+        values (list): The durations, in seconds.
+
+    Returns:
+        dict: The mean, median, 95th percentile and total, in milliseconds.
+    """
+    ordered = sorted(values)
+    return {
+        "mean_ms": 1000 * statistics.mean(ordered),
+        "p50_ms": 1000 * statistics.median(ordered),
+        "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "total_ms": 1000 * sum(ordered),
+    }
+
+
+def time_stages(urls: List[str]) -> Dict[str, List[float]]:
+    """
+    Processes every article step by step, timing each step.
+
+    Args:
+        urls (list): The article URLs.
+
+    Returns:
+        dict: A mapping of stage name to the duration of that stage for each article.
+    """
+    durations: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+
+    def timed(stage: str, function: Callable, *function_args: Any) -> Any:
+        start = time.perf_counter()
+        result = function(*function_args)
+        durations[stage].append(time.perf_counter() - start)
+        return result
+
+    for url in urls:
+        html_content = timed("fetch", fetcher.fetch_html, url)
+        title, body = timed("parse", parse_html, html_content, url)
+        document = timed("clean", Document, body)
+        sentences = timed("split", lambda: document.sentences)
+        embeddings = timed("embed", summarizer.generate_sentence_embeddings, sentences)
+        summary_sentences = timed(
+            "rank",
+            summarizer.rank_sentences,
+            sentences,
+            embeddings,
+            sum_bot.PARAMETERS["num_sentences"],
+            sum_bot.PARAMETERS["summary_in_article_order"],
+        )
+        keywords = timed("keywords", summarizer.get_relevant_keywords, document)
+        timed(
+            "render",
+            sum_bot.build_post_message,
+            title,
+            url,
+            keywords,
+            " ".join(summary_sentences),
+        )
+    return durations
+
+
+def run_worker(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Makes one measurement, in the process started for it.
+
+    Args:
+        args (argparse.Namespace): The benchmark options, args.worker is "stages" or a processing mode.
+
+    Returns:
+        dict: The results of the measurement.
+    """
+    # Keep the benchmark out of the bot's status log
+    logging.getLogger().setLevel(logging.WARNING)
+
+    outlets = sorted(load_pages())
+    urls = article_urls(outlets, args.repeats)
+    with tempfile.TemporaryDirectory() as work_dir:
+        configure(args, work_dir, urls)
+        sum_bot.init_resources()
+        sum_bot.init_nlp_resources()
+        load_seconds = sum(stats["load_seconds"] for stats in get_load_stats().values())
+
+        if args.worker == "stages":
+            # The first pass warms up lazily built state like compiled patterns and the YAKE extractor
+            time_stages(article_urls(outlets, 1))
+            start = time.perf_counter()
+            durations = time_stages(urls)
+            seconds = time.perf_counter() - start
+            result: Dict[str, Any] = {
+                "stages": {stage: summarize(durations[stage]) for stage in STAGES}
+            }
+            replies = len(urls)
+        else:
+            reddit = FakeReddit(
+                [
+                    FakeSubmission("b{}".format(index), url, "benchmark")
+                    for index, url in enumerate(urls)
+                ]
+            )
+            start = time.perf_counter()
+            sum_bot.sum_bot_init(reddit)
+            seconds = time.perf_counter() - start
+            replies = len(reddit.replies)
+            result = {}
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    result.update(
+        {
+            "articles": replies,
+            "failed": len(urls) - replies,
+            "seconds": seconds,
+            "articles_per_second": replies / seconds if seconds else 0.0,
+            "model_load_seconds": load_seconds,
+            "peak_rss_mb": get_peak_rss_mb(),
+            # The largest process started by the run, like the workers of process stages
+            "children_peak_rss_mb": children,
+        }
+    )
+    return result
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """
+    Flattens the nested numeric results into dotted metric names.
+
+    Args:
+        results (dict): The results.
+        prefix (str): The name of the enclosing section.
+
+    Returns:
+        dict: A mapping of metric name to value.
+    """
+    metrics = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten(value, prefix + key + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[prefix + key] = value
+    return metrics
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> int:
+    """
+    Prints how the latency, throughput and memory changed since the baseline results.
+
+    Args:
+        current (dict): The results of this run.
+        baseline (dict): The results to compare with.
+        tolerance (float): The relative change that counts as a regression.
+
+    Returns:
+        int: The number of regressed metrics.
+    """
+    current_metrics = flatten({"stages": current["stages"], "modes": current["modes"]})
+    baseline_metrics = flatten(
+        {"stages": baseline.get("stages", {}), "modes": baseline.get("modes", {})}
+    )
+    print(
+        "\nCompared with {} ({}):".format(
+            baseline.get("commit") or "baseline", baseline.get("timestamp", "")
+        )
+    )
+    print("{:<44}{:>12}{:>12}{:>10}".format("metric", "baseline", "current", "change"))
+
+    regressions = 0
+    for name, value in current_metrics.items():
+        if not name.endswith(("mean_ms", "articles_per_second", "peak_rss_mb")):
+            continue
+        base = baseline_metrics.get(name)
+        if not base:
+            continue
+        change = (value - base) / base
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(
+            "{:<44}{:>12.2f}{:>12.2f}{:>+9.0%}{}".format(
+                name, base, value, change, flag
+            )
+        )
+    return regressions
+
+
+def get_commit() -> str:
+    """
+    Returns the current git commit, if the repository is available.
+
+    Returns:
+        str: The short commit hash, or an empty string.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--model",
+        default=sum_bot.PARAMETERS["sentence_transfomer"],
+        help="Hugging Face name or local path of the model",
+    )
+    parser.add_argument(
+        "--backend",
+        default=sum_bot.PARAMETERS["encoder_backend"],
+        help="encoder backend",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="articles of each outlet per run"
+    )
+    parser.add_argument(
+        "--modes", nargs="*", default=MODES, choices=MODES, help="modes to run"
+    )
+    parser.add_argument(
+        "--embedding-cache",
+        action="store_true",
+        help="keep the embedding cache enabled, repeated articles are then not encoded again",
+    )
+    parser.add_argument(
+        "--output", default="bench_pipeline.json", help="file to write the results to"
+    )
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative change of a metric that counts as a regression",
+    )
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker_output, "w") as stream:
+            json.dump(run_worker(args), stream)
+        return
+
+    results: Dict[str, Any] = {
+        "commit": get_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "model": args.model,
+        "backend": args.backend,
+        "repeats": args.repeats,
+        "embedding_cache": args.embedding_cache,
+        "stages": {},
+        "modes": {},
+    }
+    runs: List[Tuple[str, str]] = [("stages", "stages")] + [
+        ("modes", mode) for mode in args.modes
+    ]
+    for section, worker in runs:
+        with tempfile.NamedTemporaryFile(suffix=".json") as worker_output:
+            command = [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--model",
+                args.model,
+                "--backend",
+                args.backend,
+                "--repeats",
+                str(args.repeats),
+                "--worker",
+                worker,
+                "--worker-output",
+                worker_output.name,
+            ]
+            if args.embedding_cache:
+                command.append("--embedding-cache")
+            subprocess.run(command, check=True)
+            with open(worker_output.name) as stream:
+                result = json.load(stream)
+
+        if section == "stages":
+            results["stages"] = result.pop("stages")
+            results["stages"]["all"] = result
+        else:
+            results["modes"][worker] = result
+
+    print(
+        "{:<10}{:>12}{:>12}{:>12}".format("stage", "mean (ms)", "p50 (ms)", "p95 (ms)")
+    )
+    for stage in STAGES:
+        stats = results["stages"][stage]
+        print(
+            "{:<10}{:>12.2f}{:>12.2f}{:>12.2f}".format(
+                stage, stats["mean_ms"], stats["p50_ms"], stats["p95_ms"]
+            )
+        )
+    print(
+        "\n{:<10}{:>10}{:>8}{:>14}{:>16}{:>20}".format(
+            "run",
+            "articles",
+            "failed",
+            "articles/s",
+            "peak RSS (MB)",
+            "workers RSS (MB)",
+        )
+    )
+    for name, stats in [("stages", results["stages"]["all"])] + list(
+        results["modes"].items()
+    ):
+        print(
+            "{:<10}{:>10}{:>8}{:>14.2f}{:>16.1f}{:>20.1f}".format(
+                name,
+                stats["articles"],
+                stats["failed"],
+                stats["articles_per_second"],
+                stats["peak_rss_mb"],
+                stats["children_peak_rss_mb"],
+            )
+        )
+
+    with open(args.output, "w") as stream:
+        json.dump(results, stream, indent=2)
+    print("\nResults written to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare) as stream:
+            baseline = json.load(stream)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
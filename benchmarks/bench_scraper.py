@@ -0,0 +1,298 @@
+"""
+Compares scraper.parse_html with the original implementation it replaced.
+
+Checks that both give the same title and body for the article pages of every outlet, and prints the time each one
+takes, also with the new extractor on the html.parser backend to separate the gain of lxml from the gain of parsing
+only the outlet's article blocks. Run from the repository root:
+
+    python benchmarks/bench_scraper.py
+
+The pages in benchmarks/fixtures/html are synthetic: they only contain the blocks of their own outlet, so their
+output is always identical. Real pages can differ on purpose: the original implementation searched the classes of
+every outlet, so a block with another outlet's generic class such as "content" was added to the body, and the new
+one only searches the outlet's own classes. Real pages recorded in benchmarks/fixtures/recorded, one per outlet,
+show those differences. They are saved with --record and the URL of an article of each outlet:
+
+    python benchmarks/bench_scraper.py --record https://observador.pt/... https://www.publico.pt/...
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, List, Tuple, Union
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from scraper import ArticleExtractor, get_article_extractor  # noqa: E402
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "html"
+)
+RECORDED_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "recorded"
+)
+
+
+def legacy_parse_html(html_content: Union[str, bytes]) -> Tuple[str, str]:
+    """
+    The original implementation of scraper.parse_html.
+
+    Args:
+        html_content (str or bytes): The HTML of the article page.
+
+    Returns:
+        Tuple[str, str]: The title and body of the article.
+    """
+    soup = BeautifulSoup(html_content, "html.parser")
+    title_element = soup.title
+    title = title_element.get_text()
+
+    class_types = {
+        "cnn_portugal": "article-conteudo",
+        "sic_noticias_lead": "g-article-lead lead",
+        "sic_noticias": "full-article-fragment full-article-body first full-article-body-legacy",
+        "observador": "article-body-content",
+        "noticias_ao_minuto": "news-main-text content",
+        "publico_lead": "story__blurb lead",
+        "publico": "story__body",
+        "dn": "t-af1-content-1",
+        "dinheiro_vivo": "t-article-body-1",
+        "dineheiro_vivo_lead": "t-ah-desc",
+        "jn": "t-article-content-inner",
+        "dnoticias": "article--body",
+        "dnoticias_lead": "article--header",
+        "rr": "slab-400",
+        "rr_lead": "rr-lead",
+        "jornalnegocios": "texto paywall",
+        "sapo_24": "content",
+        "tsf_lead": "t-ah-desc",
+    }
+    excluding_classes = [
+        "relacionados-no-texto",
+        "t-content-responsive-1",
+        "article--footer",
+        "relatedLink",
+        "related-article",
+        "t-a-subscribe-1 js-contentcollapse-root",
+        "t-grp-title-5",
+        "t-a-info-share",
+        "t-abc-footer",
+        "t-a-multimedia-1",
+        "t-a-info-authoring",
+        "t-a-info-share-comment",
+        "t-a-audioplayer-1",
+        "t-af-share-2",
+        "t-af-comments-1",
+        "t-af-callout-5 js-contentcollapse-root newslettercapping",
+        "t-af-multimedia-1",
+        "t-af1-c1-sb js-a-content-sb-elm-ref",
+    ]
+
+    try:
+        lead_paragraph = soup.find("p", class_=class_types.values())
+        news_lead = ""
+        for element in lead_paragraph:
+            news_lead += element.get_text()
+    except BaseException:
+        pass
+
+    related_link_divs = soup.find_all(
+        ["div", "aside", "footer"], class_=excluding_classes
+    )
+    for div in related_link_divs:
+        div.decompose()
+
+    news_elements = soup.find_all("div", class_=class_types.values())
+
+    news_text = ""
+    for element in news_elements:
+        news_text += element.get_text().strip()
+
+    news_body = news_lead + news_text
+    news_body = re.sub(r"\.(?=[A-Z\"])", ". ", news_body).strip()
+    return title, news_body
+
+
+def load_pages(
+    extractor: ArticleExtractor, directory: str = FIXTURES_DIR
+) -> Dict[str, Tuple[str, bytes]]:
+    """
+    Loads the saved article page of every outlet, as the fetcher returns them.
+
+    Args:
+        extractor (ArticleExtractor): The extractor, for the domains of the outlets.
+        directory (str): The folder of the pages, named after their outlet.
+
+    Returns:
+        dict: A mapping of outlet name to the (url, html) of its page.
+    """
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        outlet = os.path.splitext(os.path.basename(path))[0]
+        url = "https://{}/artigo-de-teste.html".format(
+            extractor.outlets[outlet]["domains"][0]
+        )
+        with open(path, "rb") as fixture:
+            pages[outlet] = (url, fixture.read())
+    return pages
+
+
+def record_pages(extractor: ArticleExtractor, urls: List[str]) -> None:
+    """
+    Downloads real article pages and saves each one in benchmarks/fixtures/recorded, named after its outlet.
+
+    Args:
+        extractor (ArticleExtractor): The extractor, to find the outlet of each URL.
+        urls (list): The URLs of the articles, one per outlet.
+    """
+    from fetcher import fetch_html
+
+    os.makedirs(RECORDED_DIR, exist_ok=True)
+    for url in urls:
+        outlet = extractor.get_outlet(url)
+        if outlet is None:
+            print("Skipping {}, it isn't from a known outlet".format(url))
+            continue
+        with open(os.path.join(RECORDED_DIR, outlet + ".html"), "wb") as page:
+            page.write(fetch_html(url))
+        print("Recorded {} for {}".format(url, outlet))
+
+
+def time_function(function: Callable[[], Tuple[str, str]], runs: int) -> float:
+    """
+    Returns the best time of several runs of an extraction.
+
+    Args:
+        function (callable): The extraction, without arguments.
+        runs (int): The number of runs.
+
+    Returns:
+        float: The fastest run, in seconds.
+    """
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare(
+    pages: Dict[str, Tuple[str, bytes]],
+    extractor: ArticleExtractor,
+    html_parser_extractor: ArticleExtractor,
+    runs: int,
+) -> List[str]:
+    """
+    Prints the time each implementation takes on every page.
+
+    Args:
+        pages (dict): A mapping of outlet name to the (url, html) of its page.
+        extractor (ArticleExtractor): The extractor on the default backend.
+        html_parser_extractor (ArticleExtractor): The extractor on the html.parser backend.
+        runs (int): The number of runs per page.
+
+    Returns:
+        list: The outlets whose page gives a different title or body than the original implementation.
+    """
+    mismatches = []
+    if not pages:
+        return mismatches
+    print(
+        "{:<22}{:>8}{:>14}{:>18}{:>14}{:>10}".format(
+            "outlet", "KB", "legacy (ms)", "html.parser (ms)", "engine (ms)", "speedup"
+        )
+    )
+    total_legacy = total_engine = 0.0
+    for outlet, (url, html_content) in pages.items():
+        if legacy_parse_html(html_content) != extractor.extract(html_content, url):
+            mismatches.append(outlet)
+
+        legacy_time = time_function(lambda: legacy_parse_html(html_content), runs)
+        html_parser_time = time_function(
+            lambda: html_parser_extractor.extract(html_content, url), runs
+        )
+        engine_time = time_function(lambda: extractor.extract(html_content, url), runs)
+        total_legacy += legacy_time
+        total_engine += engine_time
+        print(
+            "{:<22}{:>8.0f}{:>14.2f}{:>18.2f}{:>14.2f}{:>9.1f}x".format(
+                outlet,
+                len(html_content) / 1024,
+                legacy_time * 1000,
+                html_parser_time * 1000,
+                engine_time * 1000,
+                legacy_time / engine_time,
+            )
+        )
+    print(
+        "Total: {:.1f} ms -> {:.1f} ms ({:.1f}x)".format(
+            total_legacy * 1000, total_engine * 1000, total_legacy / total_engine
+        )
+    )
+    return mismatches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="runs per page")
+    parser.add_argument(
+        "--record",
+        nargs="+",
+        metavar="URL",
+        help="download these articles to benchmarks/fixtures/recorded first, one per outlet",
+    )
+    args = parser.parse_args()
+
+    extractor = get_article_extractor()
+    html_parser_extractor = ArticleExtractor(
+        extractor.outlets, extractor.excluding_classes, parser="html.parser"
+    )
+    if args.record:
+        record_pages(extractor, args.record)
+
+    print("Parser backend: {}".format(extractor.parser))
+    mismatches = []
+    missing = []
+    for name, directory in (("Synthetic", FIXTURES_DIR), ("Recorded", RECORDED_DIR)):
+        pages = load_pages(extractor, directory)
+        print("\n{} pages:".format(name))
+        mismatches += [
+            "{} ({})".format(outlet, name.lower())
+            for outlet in compare(pages, extractor, html_parser_extractor, args.runs)
+        ]
+        if name == "Recorded":
+            missing = sorted(set(extractor.outlets) - set(pages))
+            if missing:
+                print(
+                    "No recorded page for: {}. Record them with --record to check the output on real pages.".format(
+                        ", ".join(missing)
+                    )
+                )
+
+    if mismatches:
+        print(
+            "Output differs from the original implementation for: {}. Recorded pages differ when they have blocks "
+            "with the classes of other outlets, see conf/outlet_selectors.yml.".format(
+                ", ".join(mismatches)
+            )
+        )
+        sys.exit(1)
+    print("Output is identical to the original implementation for every page.")
+    if missing:
+        print(
+            "Only the synthetic pages were checked for {} of the {} outlets.".format(
+                len(missing), len(extractor.outlets)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
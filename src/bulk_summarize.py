@@ -0,0 +1,505 @@
+"""
+Summarizes a corpus of saved articles offline, e.g. for backfills, evaluations or tuning num_sentences.
+
+The articles are read from JSONL files, with one object per line with an optional "id" and a "url" and either the
+page ("html"), the path of the saved page ("html_path", relative to the JSONL file), the article text ("text") or
+nothing, in which case the page is downloaded, and from folders of saved pages (*.html, *.htm). They go through the
+same parsing, summarization and keyword extraction as the bot's replies, in a pool of worker processes that each
+load the model once.
+
+Each result is appended to the output JSONL file as soon as it is ready, which is also the checkpoint: a run that is
+started again with the same output skips the articles already in it. A corpus can be split across several machines
+with --num-shards and --shard-index, every article is assigned to a shard by a hash of its ID. With --from-cache
+the pages are only read from the HTML cache of the bot, and with no inputs every page in it is summarized again,
+e.g. after changing the outlet selectors or the cleaning patterns. Run from the repository root:
+
+    python src/bulk_summarize.py articles.jsonl saved_pages/ --output summaries.jsonl
+    python src/bulk_summarize.py articles.jsonl --output shard0.jsonl --num-shards 4 --shard-index 0
+    python src/bulk_summarize.py --from-cache --output summaries.jsonl
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO
+
+from config import PARAMETERS
+from html_cache import HtmlCache
+from metrics import REGISTRY
+from pipeline import _call_in_worker
+
+logger = logging.getLogger(__name__)
+
+# Extensions of the saved pages read from folders
+HTML_EXTENSIONS = (".html", ".htm")
+
+# The canonical URL of a saved page, used to pick the selectors of its outlet
+CANONICAL_PATTERN = re.compile(
+    r"<link\b[^>]*\brel=[\"']canonical[\"'][^>]*>|<meta\b[^>]*\bproperty=[\"']og:url[\"'][^>]*>",
+    re.IGNORECASE,
+)
+URL_ATTRIBUTE_PATTERN = re.compile(
+    r"\b(?:href|content)=[\"']([^\"']+)[\"']", re.IGNORECASE
+)
+
+
+def get_shard(record_id: str, num_shards: int) -> int:
+    """
+    Assigns an article to a shard, the same one on every machine and every run.
+
+    Args:
+        record_id (str): The ID of the article.
+        num_shards (int): The number of shards.
+
+    Returns:
+        int: The index of the shard, between 0 and num_shards - 1.
+    """
+    digest = hashlib.blake2b(record_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % num_shards
+
+
+def read_records(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the articles of a corpus, without loading the saved pages.
+
+    Args:
+        paths (list): JSONL files and folders of saved pages.
+
+    Yields:
+        dict: One article, with its "id" and the fields of its JSONL line or the "html_path" of its saved page.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, directories, files in os.walk(path):
+                directories.sort()
+                for file_name in sorted(files):
+                    if file_name.lower().endswith(HTML_EXTENSIONS):
+                        html_path = os.path.join(root, file_name)
+                        yield {"id": html_path, "html_path": html_path}
+            continue
+
+        with open(path, "r", encoding="utf-8") as stream:
+            for line_number, line in enumerate(stream, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                record.setdefault(
+                    "id", record.get("url") or "{}:{}".format(path, line_number)
+                )
+                record["id"] = str(record["id"])
+                if "html_path" in record:
+                    record["html_path"] = os.path.join(
+                        os.path.dirname(path), record["html_path"]
+                    )
+                yield record
+
+
+def read_cached_records(parameters: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the articles of every page in the HTML cache.
+
+    Args:
+        parameters (dict): The HTML cache settings.
+
+    Yields:
+        dict: One article, with its URL as "id" and "url".
+    """
+    cache = HtmlCache(parameters["path"], offline=True)
+    try:
+        urls = cache.urls()
+    finally:
+        cache.close()
+    for url in urls:
+        yield {"id": url, "url": url}
+
+
+def read_checkpoint(path: str, retry_failed: bool = False) -> Set[str]:
+    """
+    Reads the IDs of the articles already in an output file. A last line left incomplete by an interrupted run is
+    ignored.
+
+    Args:
+        path (str): The path of the output JSONL file.
+        retry_failed (bool): Whether articles that failed are summarized again.
+
+    Returns:
+        set: The IDs of the articles to skip.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, "r", encoding="utf-8") as stream:
+        for line in stream:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            # Later lines replace earlier ones, so a retried article that now succeeds is done
+            if retry_failed and "error" in result:
+                done.discard(result["id"])
+            else:
+                done.add(result["id"])
+    return done
+
+
+def select_records(
+    records: Iterable[Dict[str, Any]],
+    done: Set[str],
+    counts: Dict[str, int],
+    num_shards: int = 1,
+    shard_index: int = 0,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Selects the articles of this run's shard that weren't summarized yet, once each.
+
+    Args:
+        records (iterable): The articles of the corpus.
+        done (set): The IDs of the articles already summarized, extended with the selected ones.
+        counts (dict): The counts of summarize_corpus, whose "skipped" count is increased for the articles already
+            done.
+        num_shards (int): The number of shards the corpus is split into.
+        shard_index (int): The shard summarized by this run.
+
+    Yields:
+        dict: The next article to summarize.
+    """
+    for record in records:
+        if num_shards > 1 and get_shard(record["id"], num_shards) != shard_index:
+            continue
+        if record["id"] in done:
+            counts["skipped"] += 1
+            continue
+        done.add(record["id"])
+        yield record
+
+
+def open_output(path: str) -> TextIO:
+    """
+    Opens the output JSONL file to append results, starting on a new line if an interrupted run left the last one
+    incomplete.
+
+    Args:
+        path (str): The output JSONL file.
+
+    Returns:
+        file: The file, open for appending.
+    """
+    needs_newline = False
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb") as stream:
+            stream.seek(-1, os.SEEK_END)
+            needs_newline = stream.read(1) != b"\n"
+
+    output = open(path, "a", encoding="utf-8")
+    if needs_newline:
+        output.write("\n")
+    return output
+
+
+def get_page_url(html_content: str) -> Optional[str]:
+    """
+    Finds the canonical URL in a saved page.
+
+    Args:
+        html_content (str): The HTML of the page.
+
+    Returns:
+        str: The URL, or None if the page doesn't declare it.
+    """
+    tag = CANONICAL_PATTERN.search(html_content)
+    if tag is None:
+        return None
+    url = URL_ATTRIBUTE_PATTERN.search(tag.group(0))
+    return html.unescape(url.group(1)) if url else None
+
+
+def init_worker(parameters: Dict[str, Any], threads: Optional[int] = None) -> None:
+    """
+    Initializer of the worker processes, loads the NLTK data, the encoder and an in-memory embedding cache once.
+
+    Args:
+        parameters (dict): The parameters of the run, replacing the ones read from conf/parameters.yml.
+        threads (int): The threads torch uses in each worker, None for the torch default.
+    """
+    from embedding_cache import get_embedding_cache
+    from fetcher import get_fetcher
+    from html_cache import get_html_cache
+    from model_registry import set_torch_threads, warm_up
+    from nlp_resources import preload
+
+    PARAMETERS.update(parameters)
+    set_torch_threads(threads)
+
+    # Articles without a page are downloaded, or read from the HTML cache like the bot does
+    get_fetcher(PARAMETERS["fetch"], get_html_cache(PARAMETERS["html_cache"]))
+
+    preload(PARAMETERS["nltk"]["data_path"], PARAMETERS["nltk"]["download"])
+    warm_up([PARAMETERS["sentence_transfomer"]], PARAMETERS["encoder_backend"])
+    # The on-disk store only supports one writer, so each worker keeps its cache in memory
+    get_embedding_cache(
+        dict(
+            PARAMETERS["embedding_cache"],
+            path=None,
+            dtype=PARAMETERS["memory"]["embedding_dtype"],
+            namespace="{}|{}".format(
+                PARAMETERS["sentence_transfomer"], PARAMETERS["encoder_backend"]
+            ),
+        )
+    )
+
+
+def summarize_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Summarizes one article like the bot does, in a worker process.
+
+    Args:
+        record (dict): The article, as read by read_records.
+
+    Returns:
+        dict: The "id", "url", "title", "summary" and "keywords" of the article.
+    """
+    from scraper import parse_html
+    from summarizer import (
+        analyze_document,
+        generate_extractive_summary,
+        get_relevant_keywords,
+    )
+
+    url = record.get("url")
+    title = record.get("title")
+    body = record.get("text")
+    if body is None:
+        html_content = record.get("html")
+        if html_content is None and "html_path" in record:
+            with open(record["html_path"], "rb") as stream:
+                html_content = stream.read()
+            if url is None:
+                url = get_page_url(html_content.decode("utf-8", "replace"))
+        if html_content is None:
+            from fetcher import fetch_html
+
+            html_content = fetch_html(url)
+        title, body = parse_html(html_content, url)
+
+    document = analyze_document(body)
+    return {
+        "id": record["id"],
+        "url": url,
+        "title": title,
+        "summary": generate_extractive_summary(
+            document,
+            PARAMETERS["num_sentences"],
+            PARAMETERS["summary_in_article_order"],
+        ),
+        "keywords": get_relevant_keywords(document),
+    }
+
+
+def summarize_corpus(
+    paths: List[str],
+    output_path: str,
+    workers: int = 4,
+    tasks_per_worker: int = 4,
+    threads_per_worker: Optional[int] = None,
+    num_shards: int = 1,
+    shard_index: int = 0,
+    retry_failed: bool = False,
+    from_cache: bool = False,
+    parameters: Optional[Dict[str, Any]] = None,
+) -> Dict[str, int]:
+    """
+    Summarizes the articles of a corpus in a pool of worker processes, appending each result to a JSONL file.
+
+    Results are written in the order they finish. Articles that fail are written with an "error" instead of a
+    summary.
+
+    Args:
+        paths (list): JSONL files and folders of saved pages, every page in the HTML cache if empty and from_cache.
+        output_path (str): The output JSONL file, also read to skip the articles summarized by earlier runs.
+        workers (int): The number of worker processes.
+        tasks_per_worker (int): Articles queued for each worker, limits how much of the corpus is in memory.
+        threads_per_worker (int): The threads torch uses in each worker, None to split the CPUs between the workers.
+        num_shards (int): The number of shards the corpus is split into.
+        shard_index (int): The shard summarized by this run.
+        retry_failed (bool): Whether articles that failed in earlier runs are summarized again.
+        from_cache (bool): Whether pages are only read from the HTML cache, never downloaded.
+        parameters (dict): Parameters replacing the ones in conf/parameters.yml, e.g. num_sentences.
+
+    Returns:
+        dict: The number of articles "summarized", "failed" and "skipped" because they were already done.
+    """
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    worker_parameters = dict(PARAMETERS, **(parameters or {}))
+    if from_cache:
+        worker_parameters["html_cache"] = dict(
+            worker_parameters["html_cache"], enabled=True, offline=True
+        )
+
+    counts = {"summarized": 0, "failed": 0, "skipped": 0}
+    records = select_records(
+        (
+            read_cached_records(worker_parameters["html_cache"])
+            if from_cache and not paths
+            else read_records(paths)
+        ),
+        read_checkpoint(output_path, retry_failed),
+        counts,
+        num_shards,
+        shard_index,
+    )
+    start = time.perf_counter()
+
+    with open_output(output_path) as output, ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(worker_parameters, threads_per_worker),
+    ) as executor:
+        # Articles being summarized, by their future
+        futures: Dict[Future, Dict[str, Any]] = {}
+
+        def write_result(future: Future) -> None:
+            record = futures.pop(future)
+            result, error, metrics = future.result()
+            REGISTRY.merge(metrics)
+            if error is not None:
+                result = {
+                    "id": record["id"],
+                    "url": record.get("url"),
+                    "error": repr(error),
+                }
+                counts["failed"] += 1
+                logger.error(
+                    "Failed to summarize {} ({!r})".format(record["id"], error)
+                )
+            else:
+                counts["summarized"] += 1
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+
+            finished = counts["summarized"] + counts["failed"]
+            if finished % 100 == 0:
+                logger.info(
+                    "{} articles summarized, {:.2f} articles/s".format(
+                        finished, finished / (time.perf_counter() - start)
+                    )
+                )
+
+        for record in records:
+            # Only the articles the workers can start soon are read, so the corpus is never all in memory
+            while len(futures) >= workers * tasks_per_worker:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    write_result(future)
+            futures[executor.submit(_call_in_worker, summarize_record, record)] = record
+
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                write_result(future)
+
+    elapsed = time.perf_counter() - start
+    stages = REGISTRY.to_dict()["histograms"]["stage_seconds"]["values"]
+    logger.info(
+        "Summarized {} articles in {:.1f}s ({:.2f} articles/s), {} failed, {} already done; {}".format(
+            counts["summarized"],
+            elapsed,
+            (counts["summarized"] + counts["failed"]) / elapsed if elapsed else 0.0,
+            counts["failed"],
+            counts["skipped"],
+            ", ".join(
+                "{} {:.2f}s".format(stage, series["sum"])
+                for stage, series in sorted(stages.items())
+            )
+            or "no stages",
+        )
+    )
+    return counts
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    settings = PARAMETERS["bulk"]
+    parser = argparse.ArgumentParser(
+        description="Summarizes a corpus of saved articles offline"
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="JSONL files and folders of saved pages, every page in the HTML cache if omitted with --from-cache",
+    )
+    parser.add_argument(
+        "--output", required=True, help="JSONL file the results are appended to"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=settings["workers"], help="worker processes"
+    )
+    parser.add_argument(
+        "--threads-per-worker",
+        type=int,
+        default=settings["threads_per_worker"],
+        help="torch threads of each worker, by default the CPUs split between the workers",
+    )
+    parser.add_argument(
+        "--num-sentences",
+        type=int,
+        default=PARAMETERS["num_sentences"],
+        help="sentences of each summary",
+    )
+    parser.add_argument(
+        "--model",
+        default=PARAMETERS["sentence_transfomer"],
+        help="Hugging Face name or local path of the model",
+    )
+    parser.add_argument(
+        "--backend", default=PARAMETERS["encoder_backend"], help="encoder backend"
+    )
+    parser.add_argument(
+        "--num-shards", type=int, default=1, help="shards the corpus is split into"
+    )
+    parser.add_argument(
+        "--shard-index", type=int, default=0, help="shard summarized by this run"
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="summarize again the articles that failed in earlier runs",
+    )
+    parser.add_argument(
+        "--from-cache",
+        action="store_true",
+        help="only read the pages from the HTML cache, without downloading them",
+    )
+    args = parser.parse_args()
+    if not args.inputs and not args.from_cache:
+        parser.error("inputs are required without --from-cache")
+    if not 0 <= args.shard_index < args.num_shards:
+        parser.error("--shard-index must be between 0 and --num-shards - 1")
+
+    summarize_corpus(
+        args.inputs,
+        args.output,
+        workers=args.workers,
+        tasks_per_worker=settings["tasks_per_worker"],
+        threads_per_worker=args.threads_per_worker,
+        num_shards=args.num_shards,
+        shard_index=args.shard_index,
+        retry_failed=args.retry_failed,
+        from_cache=args.from_cache,
+        parameters={
+            "num_sentences": args.num_sentences,
+            "sentence_transfomer": args.model,
+            "encoder_backend": args.backend,
+        },
+    )
@@ -0,0 +1,489 @@
+import abc
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLAIMS_DB = "./claims.db"
+
+# States of a claimed post
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+
+
+def get_instance_id() -> str:
+    """
+    Creates an ID for this bot instance, unique across machines and restarts.
+
+    Returns:
+        str: The host name, process ID and a random suffix.
+    """
+    return "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+class ClaimStore(abc.ABC):
+    """
+    Coordinates several bot instances, so each post is processed and replied to by a single one.
+
+    An instance claims a post before processing it, which gives it a lease on the post for lease_seconds. Once the
+    reply is queued the post is marked done, or failed if it couldn't be summarized, and no instance claims it
+    again. A claim whose lease expired, e.g. because its instance crashed, can be taken by another instance.
+    Marking a post done only succeeds while the claim is still held, so an instance that lost its lease to another
+    one drops its reply instead of posting a duplicate.
+
+    Subclasses store the claims, see SQLiteClaimStore and KeyValueClaimStore.
+
+    Args:
+        owner (str): The ID of this instance, by default get_instance_id().
+        lease_seconds (float): How long a claim is held. Should be longer than processing a post takes.
+    """
+
+    def __init__(self, owner: Optional[str] = None, lease_seconds: float = 900):
+        self.owner = owner or get_instance_id()
+        self.lease_seconds = lease_seconds
+        # Posts claimed by this instance and not finished yet
+        self._held: Set[str] = set()
+        self._held_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _claim(self, post_id: str) -> bool:
+        """
+        Claims a post unless another instance holds an unexpired lease on it or it is finished.
+
+        Args:
+            post_id (str): The ID of the Reddit post.
+
+        Returns:
+            bool: Whether the post was claimed.
+        """
+
+    @abc.abstractmethod
+    def _finish(self, post_id: str, state: str) -> bool:
+        """
+        Marks a post claimed by this instance as finished.
+
+        Args:
+            post_id (str): The ID of the Reddit post.
+            state (str): DONE or FAILED.
+
+        Returns:
+            bool: Whether the claim was still held by this instance.
+        """
+
+    @abc.abstractmethod
+    def _release(self, post_id: str) -> None:
+        """
+        Gives back a claim of this instance, if it still holds it.
+
+        Args:
+            post_id (str): The ID of the Reddit post.
+        """
+
+    @abc.abstractmethod
+    def is_finished(self, post_id: str) -> bool:
+        """
+        Checks whether a post was marked done or failed, by any instance.
+
+        Args:
+            post_id (str): The ID of the Reddit post.
+
+        Returns:
+            bool: Whether the post is finished and no instance will process it again.
+        """
+
+    def claim(self, post_id: str) -> bool:
+        """
+        Claims a post before processing it. Claiming a post this instance already holds renews its lease.
+
+        Args:
+            post_id (str): The ID of the Reddit post.
+
+        Returns:
+            bool: Whether this instance should process the post.
+        """
+        claimed = self._claim(post_id)
+        if claimed:
+            with self._held_lock:
+                self._held.add(post_id)
+        return claimed
+
+    def claim_many(self, post_ids: Iterable[str]) -> List[str]:
+        """
+        Claims several posts.
+
+        Args:
+            post_ids (iterable): The IDs of the Reddit posts.
+
+        Returns:
+            list: The IDs that were claimed, in the given order.
+        """
+        return [post_id for post_id in post_ids if self.claim(post_id)]
+
+    def complete(self, post_id: str) -> bool:
+        """
+        Marks a post as done, once its reply is about to be queued.
+
+        Args:
+            post_id (str): The ID of the Reddit post.
+
+        Returns:
+            bool: Whether the claim was still held. If it wasn't another instance took the post, and the reply must
+            not be posted.
+        """
+        return self._end(post_id, DONE)
+
+    def fail(self, post_id: str) -> bool:
+        """
+        Marks a post as failed, so no instance tries it again.
+
+        Args:
+            post_id (str): The ID of the Reddit post.
+
+        Returns:
+            bool: Whether the claim was still held.
+        """
+        return self._end(post_id, FAILED)
+
+    def _end(self, post_id: str, state: str) -> bool:
+        """
+        Finishes a claim of this instance.
+
+        Args:
+            post_id (str): The ID of the Reddit post.
+            state (str): DONE or FAILED.
+
+        Returns:
+            bool: Whether the claim was still held.
+        """
+        with self._held_lock:
+            self._held.discard(post_id)
+        finished = self._finish(post_id, state)
+        if not finished:
+            logger.warning(
+                "Post {} was claimed by another instance".format(post_id),
+                extra={"submission_id": post_id},
+            )
+        return finished
+
+    def release_all(self) -> None:
+        """Gives back the claims of the posts this instance didn't finish, so other instances can take them now."""
+        with self._held_lock:
+            held, self._held = self._held, set()
+        for post_id in held:
+            self._release(post_id)
+        if held:
+            logger.info("Released {} unfinished claims".format(len(held)))
+
+    def close(self) -> None:
+        """Releases the unfinished claims and closes the store."""
+        self.release_all()
+
+
+class SQLiteClaimStore(ClaimStore):
+    """
+    Claims kept in an SQLite table, for instances on the same machine or sharing a file system with working locks.
+    Each claim is a single statement, made atomic across processes by SQLite's file locks.
+
+    Args:
+        path (str): The path of the SQLite database.
+        owner (str): The ID of this instance.
+        lease_seconds (float): How long a claim is held.
+    """
+
+    def __init__(
+        self,
+        path: str = CLAIMS_DB,
+        owner: Optional[str] = None,
+        lease_seconds: float = 900,
+    ):
+        super().__init__(owner, lease_seconds)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS claims ("
+            "post_id TEXT PRIMARY KEY, owner TEXT NOT NULL, state TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, updated_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS claims_updated_at ON claims (updated_at)"
+        )
+
+    def _claim(self, post_id: str) -> bool:
+        now = time.time()
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "INSERT INTO claims (post_id, owner, state, expires_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (post_id) DO UPDATE SET "
+                    "owner = excluded.owner, expires_at = excluded.expires_at, updated_at = excluded.updated_at "
+                    "WHERE claims.state = ? AND (claims.expires_at < ? OR claims.owner = excluded.owner)",
+                    (
+                        post_id,
+                        self.owner,
+                        CLAIMED,
+                        now + self.lease_seconds,
+                        now,
+                        CLAIMED,
+                        now,
+                    ),
+                ).rowcount
+                == 1
+            )
+
+    def _finish(self, post_id: str, state: str) -> bool:
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "UPDATE claims SET state = ?, updated_at = ? "
+                    "WHERE post_id = ? AND owner = ? AND state = ?",
+                    (state, time.time(), post_id, self.owner, CLAIMED),
+                ).rowcount
+                == 1
+            )
+
+    def _release(self, post_id: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM claims WHERE post_id = ? AND owner = ? AND state = ?",
+                (post_id, self.owner, CLAIMED),
+            )
+
+    def is_finished(self, post_id: str) -> bool:
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "SELECT 1 FROM claims WHERE post_id = ? AND state != ?",
+                    (post_id, CLAIMED),
+                ).fetchone()
+                is not None
+            )
+
+    def compact(self, retention_days: float) -> int:
+        """
+        Removes the posts finished more than retention_days ago.
+
+        Args:
+            retention_days (float): The number of days a finished post is kept.
+
+        Returns:
+            int: The number of removed posts.
+        """
+        cutoff = time.time() - retention_days * 24 * 60 * 60
+        with self._lock:
+            removed = self._connection.execute(
+                "DELETE FROM claims WHERE state != ? AND updated_at < ?",
+                (CLAIMED, cutoff),
+            ).rowcount
+        if removed:
+            logger.info("Removed {} expired claims".format(removed))
+        return removed
+
+    def close(self) -> None:
+        super().close()
+        with self._lock:
+            self._connection.close()
+
+
+class MemoryKeyValueClient:
+    """
+    A key-value store in the memory of the process with the operations KeyValueClaimStore needs, standing in for
+    RedisKeyValueClient in tests and offline runs. Instances sharing a client behave like instances sharing a
+    Redis server.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[str]:
+        """Returns the value of a key, forgetting it if it expired. Must be called with the lock held."""
+        entry = self._values.get(key)
+        if entry is not None and entry[1] <= time.time():
+            del self._values[key]
+            entry = None
+        return entry[0] if entry is not None else None
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._get(key)
+
+    def set_if_absent(self, key: str, value: str, ttl_seconds: float) -> bool:
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._values[key] = (value, time.time() + ttl_seconds)
+            return True
+
+    def compare_and_set(
+        self, key: str, expected: str, value: str, ttl_seconds: float
+    ) -> bool:
+        with self._lock:
+            if self._get(key) != expected:
+                return False
+            self._values[key] = (value, time.time() + ttl_seconds)
+            return True
+
+    def compare_and_delete(self, key: str, expected: str) -> bool:
+        with self._lock:
+            if self._get(key) != expected:
+                return False
+            del self._values[key]
+            return True
+
+
+class RedisKeyValueClient:
+    """
+    The operations KeyValueClaimStore needs, on a Redis server shared by instances on several machines. Needs
+    `pip install redis`.
+
+    Args:
+        url (str): The URL of the server, e.g. redis://localhost:6379/0.
+    """
+
+    # Replace or delete a key only if it still has the expected value, atomically on the server
+    COMPARE_AND_SET = (
+        "if redis.call('GET', KEYS[1]) == ARGV[1] then "
+        "redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3]) return 1 end return 0"
+    )
+    COMPARE_AND_DELETE = (
+        "if redis.call('GET', KEYS[1]) == ARGV[1] then "
+        "return redis.call('DEL', KEYS[1]) end return 0"
+    )
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._compare_and_set = self._client.register_script(self.COMPARE_AND_SET)
+        self._compare_and_delete = self._client.register_script(self.COMPARE_AND_DELETE)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(key)
+
+    def set_if_absent(self, key: str, value: str, ttl_seconds: float) -> bool:
+        return bool(self._client.set(key, value, nx=True, px=int(ttl_seconds * 1000)))
+
+    def compare_and_set(
+        self, key: str, expected: str, value: str, ttl_seconds: float
+    ) -> bool:
+        return bool(
+            self._compare_and_set(
+                keys=[key], args=[expected, value, int(ttl_seconds * 1000)]
+            )
+        )
+
+    def compare_and_delete(self, key: str, expected: str) -> bool:
+        return bool(self._compare_and_delete(keys=[key], args=[expected]))
+
+
+class KeyValueClaimStore(ClaimStore):
+    """
+    Claims kept in a network key-value store shared by instances on several machines. A claim is a key with the
+    state and owner of the post as value, set only if absent and with the lease as expiry, so expired leases are
+    removed by the store itself. Finished posts are kept for retention_days.
+
+    Args:
+        client: A RedisKeyValueClient, a MemoryKeyValueClient or any object with the same methods.
+        owner (str): The ID of this instance.
+        lease_seconds (float): How long a claim is held.
+        retention_days (float): How long finished posts are kept.
+        prefix (str): The prefix of the keys.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        owner: Optional[str] = None,
+        lease_seconds: float = 900,
+        retention_days: float = 7,
+        prefix: str = "sumbot:claim:",
+    ):
+        super().__init__(owner, lease_seconds)
+        self.client = client
+        self.retention_seconds = retention_days * 24 * 60 * 60
+        self.prefix = prefix
+        self._claimed_value = "{}|{}".format(CLAIMED, self.owner)
+
+    def _claim(self, post_id: str) -> bool:
+        key = self.prefix + post_id
+        if self.client.set_if_absent(key, self._claimed_value, self.lease_seconds):
+            return True
+        # Renew a lease this instance already holds
+        return self.client.compare_and_set(
+            key, self._claimed_value, self._claimed_value, self.lease_seconds
+        )
+
+    def _finish(self, post_id: str, state: str) -> bool:
+        key = self.prefix + post_id
+        value = "{}|{}".format(state, self.owner)
+        # The lease may have expired without another instance claiming the post
+        return self.client.compare_and_set(
+            key, self._claimed_value, value, self.retention_seconds
+        ) or self.client.set_if_absent(key, value, self.retention_seconds)
+
+    def _release(self, post_id: str) -> None:
+        self.client.compare_and_delete(self.prefix + post_id, self._claimed_value)
+
+    def is_finished(self, post_id: str) -> bool:
+        value = self.client.get(self.prefix + post_id)
+        return value is not None and value.split("|", 1)[0] != CLAIMED
+
+
+_DEFAULT_STORE: Optional[ClaimStore] = None
+
+
+def get_claim_store(parameters: Optional[Dict] = None) -> ClaimStore:
+    """
+    Returns the process-wide claim store, opening it with the given settings on first use.
+
+    Args:
+        parameters (dict): The store settings, only used when the store is opened. "backend" is "sqlite", "redis"
+            or "memory", "path" is the SQLite database, "url" the Redis server and "instance_id" the ID of this
+            instance, None to create one. "max_claims_per_run" is a setting of the bot and is ignored.
+
+    Returns:
+        ClaimStore: The shared store.
+    """
+    global _DEFAULT_STORE
+    if _DEFAULT_STORE is None:
+        parameters = dict(parameters or {})
+        backend = parameters.pop("backend", "sqlite")
+        path = parameters.pop("path", CLAIMS_DB)
+        url = parameters.pop("url", None)
+        retention_days = parameters.pop("retention_days", 7)
+        parameters["owner"] = parameters.pop("instance_id", None)
+        parameters.pop("max_claims_per_run", None)
+
+        if backend == "sqlite":
+            _DEFAULT_STORE = SQLiteClaimStore(path, **parameters)
+            _DEFAULT_STORE.compact(retention_days)
+        elif backend in ("redis", "memory"):
+            client = (
+                RedisKeyValueClient(url)
+                if backend == "redis"
+                else MemoryKeyValueClient()
+            )
+            _DEFAULT_STORE = KeyValueClaimStore(
+                client, retention_days=retention_days, **parameters
+            )
+        else:
+            raise ValueError("Unknown claims backend: {}".format(backend))
+    return _DEFAULT_STORE
+
+
+def close_claim_store() -> None:
+    """Releases the unfinished claims and closes the process-wide claim store, the next get_claim_store opens it again."""
+    global _DEFAULT_STORE
+    if _DEFAULT_STORE is not None:
+        _DEFAULT_STORE.close()
+        _DEFAULT_STORE = None
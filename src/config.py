@@ -0,0 +1,62 @@
+import os
+from functools import lru_cache
+from typing import Any, Dict
+
+import yaml
+
+# Paths
+PARAMETERS_PATH = "./conf/parameters.yml"
+GLOBALS_PATH = "./conf/local/globals.yml"
+TEMPLATE_PATH = "./conf/post_template.txt"
+
+
+@lru_cache(maxsize=None)
+def load_parameters(path: str = PARAMETERS_PATH) -> Dict[str, Any]:
+    """
+    Reads the bot parameters. The file is read once per process and every module shares the returned dictionary.
+
+    Args:
+        path (str): The path of the parameters file.
+
+    Returns:
+        dict: The parameters.
+    """
+    with open(path, "r") as stream:
+        return yaml.safe_load(stream)
+
+
+@lru_cache(maxsize=None)
+def load_template(path: str = TEMPLATE_PATH) -> str:
+    """
+    Reads the template of the bot's replies, once per process.
+
+    Args:
+        path (str): The path of the template file.
+
+    Returns:
+        str: The template.
+    """
+    with open(path, "r", encoding="utf-8") as stream:
+        return stream.read()
+
+
+def load_globals(path: str = GLOBALS_PATH) -> None:
+    """
+    Sets the environment variables in the globals file, like the Reddit API credentials, if it exists.
+
+    Args:
+        path (str): The path of the globals file.
+    """
+    try:
+        with open(path, "r") as stream:
+            globals_config = yaml.safe_load(stream)
+        # Set environment variables from the globals_config dictionary
+        for key, value in globals_config.items():
+            os.environ[key] = value
+    except FileNotFoundError:
+        print(
+            "No globals.yml file found. Continuing without setting environment variables."
+        )
+
+
+PARAMETERS = load_parameters()
@@ -0,0 +1,341 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def hash_sentence(sentence: str) -> str:
+    """
+    Hashes the text of a sentence.
+
+    Args:
+        sentence (str): The sentence.
+
+    Returns:
+        str: A 32 character hex digest of the sentence.
+    """
+    return hashlib.blake2b(sentence.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """
+    Embeddings kept on disk in a memory-mapped array, with a text index from sentence hash to array row.
+
+    The array has a fixed number of rows used as a ring, so once it is full the oldest embeddings are overwritten.
+    Only one process should write to a store at a time.
+
+    Args:
+        directory (str): The folder of the store.
+        max_entries (int): The number of rows of the array.
+        dtype (str): The type of the array when it is created, "float32" or "float16". An existing array keeps its
+            type.
+    """
+
+    def __init__(
+        self, directory: str, max_entries: int = 100000, dtype: str = "float32"
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self._array_path = os.path.join(directory, "embeddings.npy")
+        self._index_path = os.path.join(directory, "index.txt")
+        self._array: Optional[np.ndarray] = None
+        self._rows: Dict[str, int] = {}
+        self._keys: Dict[int, str] = {}
+        self._next_row = 0
+
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self._array_path):
+            self._array = np.load(self._array_path, mmap_mode="r+")
+            self.max_entries = len(self._array)
+        if os.path.exists(self._index_path):
+            self._load_index()
+        self._index_file = open(self._index_path, "a", encoding="utf-8")
+
+    def _load_index(self) -> None:
+        """Reads the index, where later lines replace earlier ones for the same row."""
+        lines = 0
+        with open(self._index_path, "r", encoding="utf-8") as index_file:
+            for line in index_file:
+                row, key = line.split()
+                self._assign(int(row), key)
+                lines += 1
+
+        # Rewrite the index once most of its lines point to overwritten rows
+        if lines > 2 * self.max_entries:
+            rows = [(row - self._next_row) % self.max_entries for row in self._keys]
+            with open(self._index_path, "w", encoding="utf-8") as index_file:
+                for _, row in sorted(zip(rows, self._keys)):
+                    index_file.write("{} {}\n".format(row, self._keys[row]))
+
+    def _assign(self, row: int, key: str) -> None:
+        """
+        Points a key at a row, forgetting the key that was there before.
+
+        Args:
+            row (int): The array row.
+            key (str): The sentence hash.
+        """
+        old_key = self._keys.get(row)
+        if old_key is not None:
+            del self._rows[old_key]
+        self._rows[key] = row
+        self._keys[row] = key
+        self._next_row = (row + 1) % self.max_entries
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Reads the embedding of a sentence.
+
+        Args:
+            key (str): The sentence hash.
+
+        Returns:
+            numpy.ndarray: A copy of the embedding, or None if it isn't stored.
+        """
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        return np.array(self._array[row])
+
+    def put_many(self, keys: Sequence[str], embeddings: np.ndarray) -> None:
+        """
+        Writes the embeddings of several sentences.
+
+        Args:
+            keys (list): The sentence hashes.
+            embeddings (numpy.ndarray): The embedding of each sentence.
+        """
+        if self._array is None:
+            self._array = np.lib.format.open_memmap(
+                self._array_path,
+                mode="w+",
+                dtype=self.dtype,
+                shape=(self.max_entries, embeddings.shape[1]),
+            )
+        for key, embedding in zip(keys, embeddings):
+            if key in self._rows:
+                continue
+            row = self._next_row
+            self._array[row] = embedding
+            self._assign(row, key)
+            self._index_file.write("{} {}\n".format(row, key))
+        self._index_file.flush()
+
+    def flush(self) -> None:
+        """Writes the changed rows of the array to disk."""
+        if self._array is not None:
+            self._array.flush()
+
+    def close(self) -> None:
+        """Writes the array to disk and closes the index."""
+        self.flush()
+        self._index_file.close()
+
+
+class EmbeddingCache:
+    """
+    Cache of sentence embeddings keyed by a hash of the sentence, so sentences repeated across articles, like news
+    agency copy, disclaimers and quotes, are only encoded once.
+
+    Embeddings are kept in an in-memory LRU of max_entries sentences, backed by an optional DiskEmbeddingStore that
+    keeps them between runs. The namespace identifies the model, a cache is only used with the model it was
+    created for. Embeddings can be kept as float16, which halves the memory and disk they use at the cost of a
+    slight loss of precision in the similarity scores.
+
+    Args:
+        namespace (str): The model the embeddings were created with, e.g. its name and backend.
+        max_entries (int): The maximum number of embeddings kept in memory.
+        path (str): The folder of the on-disk store, None to keep embeddings only in memory.
+        max_disk_entries (int): The maximum number of embeddings kept on disk.
+        dtype (str): The type embeddings are kept as, "float32" or "float16". They are returned as float32.
+    """
+
+    def __init__(
+        self,
+        namespace: str = "",
+        max_entries: int = 10000,
+        path: Optional[str] = None,
+        max_disk_entries: int = 100000,
+        dtype: str = "float32",
+    ):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "encode_seconds": 0.0,
+        }
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._disk: Optional[DiskEmbeddingStore] = None
+        if path is not None:
+            # One folder per namespace, model names may contain "/"
+            directory = os.path.join(path, hash_sentence(namespace))
+            self._disk = DiskEmbeddingStore(directory, max_disk_entries, dtype)
+            with open(os.path.join(directory, "namespace.txt"), "w") as stream:
+                stream.write(namespace)
+
+    def _remember(self, key: str, embedding: np.ndarray) -> None:
+        """
+        Adds an embedding to the in-memory LRU, evicting the least recently used one if it is full.
+
+        Args:
+            key (str): The sentence hash.
+            embedding (numpy.ndarray): The embedding.
+        """
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[np.ndarray]:
+        """
+        Looks up an embedding in memory and then on disk.
+
+        Args:
+            key (str): The sentence hash.
+
+        Returns:
+            numpy.ndarray: The embedding, or None if it isn't cached.
+        """
+        embedding = self._memory.get(key)
+        if embedding is not None:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return embedding
+
+        if self._disk is not None:
+            embedding = self._disk.get(key)
+            if embedding is not None:
+                embedding = embedding.astype(self.dtype, copy=False)
+                self._remember(key, embedding)
+                self.stats["disk_hits"] += 1
+                return embedding
+
+        self.stats["misses"] += 1
+        return None
+
+    def encode(
+        self, sentences: List[str], encode: Callable[[List[str]], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Returns the embeddings of the given sentences, encoding only the ones that aren't cached.
+
+        Args:
+            sentences (list): The sentences.
+            encode (callable): Receives a list of sentences and returns their embeddings.
+
+        Returns:
+            numpy.ndarray: The embedding of each sentence.
+        """
+        if not sentences:
+            return np.empty((0, 0), dtype=np.float32)
+
+        keys = [hash_sentence(sentence) for sentence in sentences]
+        found: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        with self._lock:
+            for key, sentence in zip(keys, sentences):
+                if key in found or key in missing:
+                    continue
+                embedding = self._lookup(key)
+                if embedding is None:
+                    missing[key] = sentence
+                else:
+                    found[key] = embedding
+
+        if missing:
+            start = time.perf_counter()
+            new_embeddings = np.asarray(encode(list(missing.values())), self.dtype)
+            encode_seconds = time.perf_counter() - start
+
+            with self._lock:
+                self.stats["encode_seconds"] += encode_seconds
+                for key, embedding in zip(missing, new_embeddings):
+                    self._remember(key, embedding)
+                    found[key] = embedding
+                if self._disk is not None:
+                    self._disk.put_many(list(missing), new_embeddings)
+
+        return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
+
+    def hit_rate(self) -> float:
+        """
+        Returns the share of sentences answered from the cache since it was opened.
+
+        Returns:
+            float: The hit rate, between 0 and 1.
+        """
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return hits / lookups if lookups else 0.0
+
+    def time_saved(self) -> float:
+        """
+        Estimates the encoding time the cache saved, from the average time spent encoding a missing sentence.
+
+        Returns:
+            float: The saved time, in seconds.
+        """
+        if not self.stats["misses"]:
+            return 0.0
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return hits * self.stats["encode_seconds"] / self.stats["misses"]
+
+    def log_stats(self) -> None:
+        """Logs the hits, misses and estimated time saved of the cache."""
+        logger.info(
+            "Embedding cache: {} memory hits, {} disk hits, {} misses ({:.0%} hit rate), "
+            "~{:.2f}s of encoding saved".format(
+                self.stats["memory_hits"],
+                self.stats["disk_hits"],
+                self.stats["misses"],
+                self.hit_rate(),
+                self.time_saved(),
+            )
+        )
+
+    def flush(self) -> None:
+        """Writes the embeddings added to the on-disk store."""
+        with self._lock:
+            if self._disk is not None:
+                self._disk.flush()
+
+    def close(self) -> None:
+        """Writes and closes the on-disk store."""
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+
+
+_DEFAULT_CACHE: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache(parameters: Optional[Dict] = None) -> Optional[EmbeddingCache]:
+    """
+    Returns the process-wide embedding cache, opening it with the given settings on first use.
+
+    Args:
+        parameters (dict): The cache settings, only used when the cache is opened.
+
+    Returns:
+        EmbeddingCache: The shared cache, or None if it is disabled or wasn't opened.
+    """
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None and parameters is not None:
+        parameters = dict(parameters)
+        if not parameters.pop("enabled", True):
+            return None
+        _DEFAULT_CACHE = EmbeddingCache(**parameters)
+    return _DEFAULT_CACHE
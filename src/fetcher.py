@@ -0,0 +1,266 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import requests
+import tldextract
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from html_cache import HtmlCache
+from metrics import time_stage
+
+logger = logging.getLogger(__name__)
+
+# Default fetch settings, overridden by the "fetch" section of conf/parameters.yml
+DEFAULT_FETCH_PARAMETERS = {
+    "max_workers": 8,
+    "per_domain_concurrency": 2,
+    "timeout": 10,
+    "retries": 3,
+    "backoff_factor": 0.5,
+    "run_timeout": 60,
+    "user_agent": "SumarizadorNoticias/1.0 (+https://www.reddit.com/user/SumarizadorNoticias)",
+}
+
+
+def get_domain(url: str) -> str:
+    """
+    Extracts the registered domain of the given URL, e.g. "sicnoticias.pt".
+
+    Args:
+        url (str): The URL to extract the domain from.
+
+    Returns:
+        str: The domain followed by its public suffix.
+    """
+    ext = tldextract.extract(url)
+    return "{}.{}".format(ext.domain, ext.suffix)
+
+
+class ArticleFetcher:
+    """
+    Downloads article pages concurrently, keeping one keep-alive connection pool and one concurrency limit per news domain.
+
+    Pages are kept in the HTML cache if one is given, and served from it while they are fresh or when the server
+    answers that they didn't change.
+
+    Args:
+        parameters (dict): The fetch settings, see DEFAULT_FETCH_PARAMETERS.
+        html_cache (HtmlCache): The cache of the downloaded pages, None to always download them.
+    """
+
+    def __init__(
+        self, parameters: Optional[Dict] = None, html_cache: Optional[HtmlCache] = None
+    ):
+        self.parameters = dict(DEFAULT_FETCH_PARAMETERS)
+        self.parameters.update(parameters or {})
+        self.html_cache = html_cache
+
+        self._sessions: Dict[str, requests.Session] = {}
+        self._domain_limits: Dict[str, threading.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    def _create_session(self) -> requests.Session:
+        """
+        Creates a session that retries failed requests with exponential backoff.
+
+        Returns:
+            requests.Session: The configured session.
+        """
+        retry = Retry(
+            total=self.parameters["retries"],
+            backoff_factor=self.parameters["backoff_factor"],
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+        )
+        adapter = HTTPAdapter(
+            max_retries=retry,
+            pool_connections=1,
+            pool_maxsize=self.parameters["per_domain_concurrency"],
+        )
+        session = requests.Session()
+        session.headers["User-Agent"] = self.parameters["user_agent"]
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get_domain_resources(self, domain: str):
+        """
+        Returns the session and concurrency limit of a domain, creating them on first use.
+
+        Args:
+            domain (str): The domain of the article.
+
+        Returns:
+            tuple: The domain's requests.Session and threading.Semaphore.
+        """
+        with self._lock:
+            if domain not in self._sessions:
+                self._sessions[domain] = self._create_session()
+                self._domain_limits[domain] = threading.BoundedSemaphore(
+                    self.parameters["per_domain_concurrency"]
+                )
+            return self._sessions[domain], self._domain_limits[domain]
+
+    def fetch(self, url: str) -> bytes:
+        """
+        Downloads a single page, or gets it from the HTML cache.
+
+        Args:
+            url (str): The URL of the page.
+
+        Returns:
+            bytes: The HTML content of the page.
+
+        Raises:
+            requests.RequestException: If the page can't be downloaded after all retries.
+            LookupError: If the HTML cache is offline and doesn't have the page.
+        """
+        cache = self.html_cache
+        page = None
+        if cache is not None:
+            page = cache.get(url)
+            if cache.offline and page is None:
+                raise LookupError("{} is not in the HTML cache".format(url))
+            if page is not None and (cache.offline or cache.is_fresh(page)):
+                cache.stats["hits"] += 1
+                return page.content
+
+        # Ask the server to only send the page if it changed
+        headers = {}
+        if page is not None and page.etag:
+            headers["If-None-Match"] = page.etag
+        if page is not None and page.last_modified:
+            headers["If-Modified-Since"] = page.last_modified
+
+        session, domain_limit = self._get_domain_resources(get_domain(url))
+        with domain_limit, time_stage("fetch"):
+            response = session.get(
+                url, timeout=self.parameters["timeout"], headers=headers
+            )
+        if page is not None and response.status_code == 304:
+            cache.touch(url)
+            cache.stats["revalidated"] += 1
+            return page.content
+
+        response.raise_for_status()
+        if cache is not None:
+            cache.put(
+                url,
+                response.content,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+            cache.stats["downloads"] += 1
+        return response.content
+
+    def fetch_all(self, urls: Iterable[str]) -> Dict[str, Union[bytes, Exception]]:
+        """
+        Downloads several pages at the same time. A slow or failing domain only delays its own pages, and pages that
+        are not downloaded within the run timeout are reported as failed instead of holding up the others.
+
+        Args:
+            urls (iterable): The URLs of the pages.
+
+        Returns:
+            dict: A mapping of each URL to its HTML content, or to the exception raised while downloading it.
+        """
+        urls = list(dict.fromkeys(urls))
+        results: Dict[str, Union[bytes, Exception]] = {}
+        if not urls:
+            return results
+
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.parameters["max_workers"], len(urls))
+        )
+        futures = {url: executor.submit(self.fetch, url) for url in urls}
+        deadline = time.monotonic() + self.parameters["run_timeout"]
+        for url, future in futures.items():
+            try:
+                results[url] = future.result(
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+            except Exception as e:
+                logger.error("Failed to fetch {}: {!r}".format(url, e))
+                results[url] = e
+        # Don't wait for stalled downloads, their socket timeout ends them
+        executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def close(self) -> None:
+        """Closes the connection pools of every domain."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._domain_limits.clear()
+
+
+_DEFAULT_FETCHER: Optional[ArticleFetcher] = None
+
+
+def get_fetcher(
+    parameters: Optional[Dict] = None, html_cache: Optional[HtmlCache] = None
+) -> ArticleFetcher:
+    """
+    Returns the process-wide fetcher, creating it with the given settings on first use.
+
+    Args:
+        parameters (dict): The fetch settings, only used when the fetcher is created.
+        html_cache (HtmlCache): The cache of the downloaded pages, only used when the fetcher is created.
+
+    Returns:
+        ArticleFetcher: The shared fetcher.
+    """
+    global _DEFAULT_FETCHER
+    if _DEFAULT_FETCHER is None:
+        _DEFAULT_FETCHER = ArticleFetcher(parameters, html_cache)
+    return _DEFAULT_FETCHER
+
+
+def set_fetcher(fetcher: Any) -> None:
+    """
+    Replaces the process-wide fetcher, e.g. with a stand-in that serves recorded pages without network access.
+
+    Args:
+        fetcher (ArticleFetcher): The fetcher, or any object with the same fetch, fetch_all and close methods.
+    """
+    global _DEFAULT_FETCHER
+    _DEFAULT_FETCHER = fetcher
+
+
+def fetch_html(url: str) -> bytes:
+    """
+    Downloads a single page with the shared fetcher.
+
+    Args:
+        url (str): The URL of the page.
+
+    Returns:
+        bytes: The HTML content of the page.
+    """
+    return get_fetcher().fetch(url)
+
+
+def fetch_all_html(urls: List[str]) -> Dict[str, Union[bytes, Exception]]:
+    """
+    Downloads several pages at the same time with the shared fetcher.
+
+    Args:
+        urls (list): The URLs of the pages.
+
+    Returns:
+        dict: A mapping of each URL to its HTML content, or to the exception raised while downloading it.
+    """
+    return get_fetcher().fetch_all(urls)
+
+
+def close_fetcher() -> None:
+    """Closes the connection pools of the process-wide fetcher, the next get_fetcher creates it again."""
+    global _DEFAULT_FETCHER
+    if _DEFAULT_FETCHER is not None:
+        _DEFAULT_FETCHER.close()
+        _DEFAULT_FETCHER = None
@@ -0,0 +1,218 @@
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, NamedTuple, Optional
+
+from summary_cache import normalize_url
+
+logger = logging.getLogger(__name__)
+
+HTML_CACHE_DB = "./html_cache.db"
+
+
+class CachedPage(NamedTuple):
+    """A page in the HTML cache."""
+
+    content: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+class HtmlCache:
+    """
+    Persistent cache of the downloaded article pages, compressed with zlib and keyed by normalized URL, so articles
+    can be parsed and summarized again, e.g. after a failure or a change of the outlet selectors or cleaning
+    patterns, without downloading them again.
+
+    Pages downloaded less than fresh_minutes ago are served without a request. Older pages are revalidated with a
+    conditional request using their ETag and Last-Modified headers, so a page that didn't change costs a 304
+    response instead of the whole page. The least recently used pages are evicted once the compressed pages take
+    more than max_megabytes. In offline mode, used by bulk_summarize --from-cache, pages are only served from the
+    cache and never downloaded.
+
+    Args:
+        path (str): The path of the SQLite database.
+        max_megabytes (float): The maximum size of the compressed pages.
+        fresh_minutes (float): How long a downloaded page is served without revalidation.
+        offline (bool): Whether to only serve cached pages, with no network access.
+    """
+
+    def __init__(
+        self,
+        path: str = HTML_CACHE_DB,
+        max_megabytes: float = 200,
+        fresh_minutes: float = 60,
+        offline: bool = False,
+    ):
+        self.max_bytes = int(max_megabytes * 1024 * 1024)
+        self.fresh_seconds = fresh_minutes * 60
+        self.offline = offline
+        self.stats = {"hits": 0, "revalidated": 0, "downloads": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url_key TEXT PRIMARY KEY, url TEXT NOT NULL, content BLOB NOT NULL, "
+                "size INTEGER NOT NULL, etag TEXT, last_modified TEXT, "
+                "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)"
+            )
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """
+        Returns the cached page of a URL and marks it as used.
+
+        Args:
+            url (str): The URL of the page.
+
+        Returns:
+            CachedPage: The page, or None if it isn't cached.
+        """
+        url_key = normalize_url(url)
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT content, etag, last_modified, fetched_at FROM pages WHERE url_key = ?",
+                (url_key,),
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._connection.execute(
+                "UPDATE pages SET accessed_at = ? WHERE url_key = ?",
+                (time.time(), url_key),
+            )
+        return CachedPage(zlib.decompress(row[0]), row[1], row[2], row[3])
+
+    def is_fresh(self, page: CachedPage) -> bool:
+        """
+        Checks whether a page can be served without revalidating it.
+
+        Args:
+            page (CachedPage): The cached page.
+
+        Returns:
+            bool: Whether it was downloaded or revalidated less than fresh_minutes ago.
+        """
+        return time.time() - page.fetched_at < self.fresh_seconds
+
+    def put(
+        self,
+        url: str,
+        content: bytes,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """
+        Stores a downloaded page and evicts the least recently used pages above max_megabytes.
+
+        Args:
+            url (str): The URL of the page.
+            content (bytes): The HTML of the page.
+            etag (str): The ETag header of the response.
+            last_modified (str): The Last-Modified header of the response.
+        """
+        compressed = zlib.compress(content)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    normalize_url(url),
+                    url,
+                    compressed,
+                    len(compressed),
+                    etag,
+                    last_modified,
+                    now,
+                    now,
+                ),
+            )
+            # Keep the most recently used pages that fit in max_bytes
+            self._connection.execute(
+                "DELETE FROM pages WHERE url_key IN (SELECT url_key FROM ("
+                "SELECT url_key, SUM(size) OVER (ORDER BY accessed_at DESC, url_key) AS kept FROM pages"
+                ") WHERE kept > ?)",
+                (self.max_bytes,),
+            )
+
+    def touch(self, url: str) -> None:
+        """
+        Records that a page was revalidated and didn't change.
+
+        Args:
+            url (str): The URL of the page.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE pages SET fetched_at = ? WHERE url_key = ?",
+                (time.time(), normalize_url(url)),
+            )
+
+    def urls(self) -> List[str]:
+        """
+        Returns the URLs of every cached page, e.g. to summarize them all again.
+
+        Returns:
+            list: The URLs, as they were downloaded.
+        """
+        with self._lock:
+            return [
+                row[0]
+                for row in self._connection.execute(
+                    "SELECT url FROM pages ORDER BY url"
+                )
+            ]
+
+    def log_stats(self) -> None:
+        """Logs how the cached pages were served."""
+        logger.info(
+            "HTML cache: {} hits, {} revalidated, {} downloaded, {} misses".format(
+                self.stats["hits"],
+                self.stats["revalidated"],
+                self.stats["downloads"],
+                self.stats["misses"],
+            )
+        )
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            self._connection.close()
+
+
+_DEFAULT_CACHE: Optional[HtmlCache] = None
+
+
+def get_html_cache(parameters: Optional[Dict] = None) -> Optional[HtmlCache]:
+    """
+    Returns the process-wide HTML cache, opening it with the given settings on first use.
+
+    Args:
+        parameters (dict): The cache settings, only used when the cache is opened.
+
+    Returns:
+        HtmlCache: The shared cache, or None if it is disabled.
+    """
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None and parameters is not None:
+        parameters = dict(parameters)
+        if not parameters.pop("enabled", True):
+            return None
+        _DEFAULT_CACHE = HtmlCache(**parameters)
+    return _DEFAULT_CACHE
+
+
+def close_html_cache() -> None:
+    """Closes the process-wide HTML cache, the next get_html_cache opens it again."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is not None:
+        _DEFAULT_CACHE.close()
+        _DEFAULT_CACHE = None
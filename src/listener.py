@@ -0,0 +1,143 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Put on the work queue to tell a worker to stop
+_STOP = object()
+
+# Returned by the stream when it ends
+_END = object()
+
+
+class SubmissionListener:
+    """
+    Listens to the submission stream of several subreddits and hands the selected submissions to a pool of workers
+    through a bounded queue. When the workers fall behind the queue fills up and the stream waits for them.
+
+    Args:
+        reddit (praw.Reddit): The Reddit instance, or a stand-in with the same interface such as the FakeReddit of
+            tests/fake_reddit.py.
+        subreddits (list): The names of the subreddits to listen to.
+        select (callable): Receives a submission and returns the work item for it, or None to skip it.
+        process (callable): Receives a submission and its work item and processes it.
+        num_workers (int): The number of worker threads.
+        queue_size (int): The maximum number of submissions waiting for a worker.
+        poll_seconds (float): Seconds to wait before asking the stream again when it has no new submissions.
+        lock (threading.Lock): Held while the stream calls Reddit, since PRAW instances are not thread safe.
+    """
+
+    def __init__(
+        self,
+        reddit: Any,
+        subreddits: List[str],
+        select: Callable[[Any], Any],
+        process: Callable[[Any, Any], None],
+        num_workers: int = 2,
+        queue_size: int = 20,
+        poll_seconds: float = 5,
+        lock: Optional[threading.Lock] = None,
+    ):
+        self.reddit = reddit
+        self.subreddits = subreddits
+        self.select = select
+        self.process = process
+        self.num_workers = num_workers
+        self.poll_seconds = poll_seconds
+        self.lock = lock or threading.Lock()
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+
+    def _work(self) -> None:
+        """Processes submissions from the queue until told to stop."""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                submission, work_item = item
+                self.process(submission, work_item)
+            except Exception as e:
+                logger.error("Worker failed to process a submission: {!r}".format(e))
+            finally:
+                self._queue.task_done()
+
+    def _enqueue(self, item: Any) -> bool:
+        """
+        Puts an item on the queue, waiting while it is full unless the listener is stopped.
+
+        Args:
+            item: The item to enqueue.
+
+        Returns:
+            bool: True if the item was enqueued, False if the listener was stopped first.
+        """
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self, max_submissions: Optional[int] = None) -> int:
+        """
+        Listens to the stream until it ends, stop is called or max_submissions submissions were queued, then waits
+        for the workers to finish the queued submissions.
+
+        Args:
+            max_submissions (int): Stop after queueing this many submissions. None to listen forever.
+
+        Returns:
+            int: The number of submissions handed to the workers.
+        """
+        workers = [
+            threading.Thread(target=self._work, name="worker-{}".format(index))
+            for index in range(self.num_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        queued = 0
+        stream = self.reddit.subreddit("+".join(self.subreddits)).stream.submissions(
+            pause_after=-1
+        )
+        logger.info(">>> Listening to /r/{}".format("+".join(self.subreddits)))
+        try:
+            while not self._stop_event.is_set():
+                # Each step of the stream may request the next page of submissions
+                with self.lock:
+                    submission = next(stream, _END)
+                if submission is _END:
+                    break
+                # The stream yields None when there are no new submissions, and with pause_after=-1 it doesn't
+                # back off between requests, so wait here instead, waking up early if the listener is stopped
+                if submission is None:
+                    self._stop_event.wait(self.poll_seconds)
+                    continue
+
+                work_item = self.select(submission)
+                if work_item is None:
+                    continue
+                if not self._enqueue((submission, work_item)):
+                    break
+
+                queued += 1
+                if max_submissions is not None and queued >= max_submissions:
+                    break
+        except KeyboardInterrupt:
+            logger.info("Listener interrupted, finishing queued submissions.")
+        finally:
+            for _ in workers:
+                self._queue.put(_STOP)
+            for worker in workers:
+                worker.join()
+
+        return queued
+
+    def stop(self) -> None:
+        """Stops listening. The submissions already queued are still processed."""
+        self._stop_event.set()
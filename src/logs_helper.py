@@ -1,47 +1,131 @@
+import json
+import logging
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Optional
+
 # Paths
+# The processed post IDs before post_store, imported into processed_posts.db on first use
 POSTS_LOG = "./processed_posts.txt"
 ERROR_LOG = "./error.log"
+STATUS_LOG = "status.log"
+
+# Receives the log records of the worker processes, see get_worker_log_queue
+_WORKER_LOG_QUEUE: Optional[Any] = None
+_WORKER_LOG_LISTENER: Optional[QueueListener] = None
 
 
-def load_log():
+def log_error(error_message):
     """
-    Reads the log file containing processed posts and creates it if it doesn't exist.
+    Records an error message in the error log file.
 
-    Returns:
-    list
-        A list of Reddit post IDs that have been processed.
+    Parameters:
+    error_message : str
+        A string containing information about the faulty URL and the encountered exception.
     """
 
-    try:
-        with open(POSTS_LOG, "r", encoding="utf-8") as log_file:
-            return log_file.read().splitlines()
+    with open(ERROR_LOG, "a", encoding="utf-8") as log_file:
+        log_file.write("{}\n".format(error_message))
 
-    except FileNotFoundError:
-        with open(POSTS_LOG, "a", encoding="utf-8") as log_file:
-            return []
 
+# Attributes of every log record, the other ones were passed in "extra"
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
 
-def update_log(post_id):
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as one JSON object per line, with the time, level, logger, message and the fields passed
+    in the "extra" argument of the logging call.
     """
-    Adds the given post ID to the log file containing processed posts.
 
-    Parameters:
-    post_id : str
-        The ID of a Reddit post to be added to the log.
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(
+    path: str = STATUS_LOG,
+    max_bytes: int = 1048576,
+    backup_count: int = 5,
+    structured: bool = True,
+    level: str = "INFO",
+) -> None:
+    """
+    Sends the logs of the bot to a file that is rotated when it reaches max_bytes, keeping backup_count old files.
+
+    Does nothing in worker processes, which re-import the bot when they start: several processes rotating the same
+    file would lose lines, so workers send their logs to the main process instead, see setup_worker_logging.
+
+    Args:
+        path (str): The path of the log file.
+        max_bytes (int): The size at which the file is rotated.
+        backup_count (int): The number of rotated files kept, as path.1, path.2, ...
+        structured (bool): Whether to write one JSON object per line instead of plain text.
+        level (str): The minimum level of the logged records.
     """
+    if multiprocessing.parent_process() is not None:
+        return
 
-    with open(POSTS_LOG, "a", encoding="utf-8") as log_file:
-        log_file.write("{}\n".format(post_id))
+    handler = RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    if structured:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter(
+                "%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"
+            )
+        )
+    logging.basicConfig(level=level, handlers=[handler])
 
 
-def log_error(error_message):
+def get_worker_log_queue() -> Any:
     """
-    Records an error message in the error log file.
+    Returns the queue the worker processes send their log records to, starting the thread that hands them to the
+    handlers of this process on first use.
 
-    Parameters:
-    error_message : str
-        A string containing information about the faulty URL and the encountered exception.
+    Returns:
+        multiprocessing.Queue: The queue, to be passed to setup_worker_logging in each worker process.
     """
+    global _WORKER_LOG_QUEUE, _WORKER_LOG_LISTENER
+    if _WORKER_LOG_QUEUE is None:
+        _WORKER_LOG_QUEUE = multiprocessing.get_context("spawn").Queue()
+        _WORKER_LOG_LISTENER = QueueListener(
+            _WORKER_LOG_QUEUE, *logging.getLogger().handlers, respect_handler_level=True
+        )
+        _WORKER_LOG_LISTENER.start()
+    return _WORKER_LOG_QUEUE
 
-    with open(ERROR_LOG, "a", encoding="utf-8") as log_file:
-        log_file.write("{}\n".format(error_message))
+
+def stop_worker_logging() -> None:
+    """Writes the log records still queued by the worker processes and stops forwarding them."""
+    global _WORKER_LOG_QUEUE, _WORKER_LOG_LISTENER
+    if _WORKER_LOG_LISTENER is not None:
+        _WORKER_LOG_LISTENER.stop()
+        _WORKER_LOG_QUEUE.close()
+        _WORKER_LOG_QUEUE = None
+        _WORKER_LOG_LISTENER = None
+
+
+def setup_worker_logging(log_queue: Any, level: str = "INFO") -> None:
+    """
+    Sends the log records of a worker process to the main process, which writes them to its own log.
+
+    Args:
+        log_queue (multiprocessing.Queue): The queue returned by get_worker_log_queue in the main process.
+        level (str): The minimum level of the logged records.
+    """
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(level)
@@ -0,0 +1,115 @@
+import ctypes
+import ctypes.util
+import gc
+import os
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Highest peak measured before the peak was last reset, see reset_peak_rss
+_PEAK_BEFORE_RESET_MB = 0.0
+_PEAK_LOCK = threading.Lock()
+
+
+def _get_status_mb(field: str) -> float:
+    """
+    Reads a memory field of /proc/self/status.
+
+    Args:
+        field (str): The name of the field, e.g. "VmHWM".
+
+    Returns:
+        float: Its value in megabytes, or 0.0 if it can't be read.
+    """
+    try:
+        with open("/proc/self/status", "r") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0.0
+
+
+def get_peak_rss_since_reset_mb() -> float:
+    """
+    Returns the peak resident set size of the current process since reset_peak_rss was last called.
+
+    Returns:
+        float: The peak resident memory in megabytes, since the process started if the peak can't be reset.
+    """
+    peak_rss = _get_status_mb("VmHWM")
+    if peak_rss:
+        return peak_rss
+    if resource is None:
+        return 0.0
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak_rss / (1024**2)
+    return peak_rss / 1024
+
+
+def get_peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of the current process.
+
+    Returns:
+        float: The peak resident memory in megabytes, or 0.0 if it can't be measured.
+    """
+    with _PEAK_LOCK:
+        return max(_PEAK_BEFORE_RESET_MB, get_peak_rss_since_reset_mb())
+
+
+def reset_peak_rss() -> bool:
+    """
+    Starts measuring the peak resident set size again from the current usage, e.g. to measure the peak of each
+    article. get_peak_rss_mb still returns the peak since the process started. Only supported on Linux.
+
+    Returns:
+        bool: Whether the peak was reset.
+    """
+    global _PEAK_BEFORE_RESET_MB
+    with _PEAK_LOCK:
+        peak_rss = get_peak_rss_since_reset_mb()
+        try:
+            # Writing 5 to clear_refs resets the VmHWM of the process
+            with open("/proc/self/clear_refs", "w") as clear_refs:
+                clear_refs.write("5")
+        except OSError:
+            return False
+        _PEAK_BEFORE_RESET_MB = max(_PEAK_BEFORE_RESET_MB, peak_rss)
+        return True
+
+
+def get_rss_mb() -> float:
+    """
+    Returns the current resident set size of the process.
+
+    Returns:
+        float: The resident memory in megabytes, falling back to the peak value when /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024**2)
+    except (OSError, ValueError, IndexError):
+        return get_peak_rss_mb()
+
+
+def release_memory() -> None:
+    """Collects garbage and returns the freed heap memory to the operating system, where glibc allows it."""
+    gc.collect()
+    library = ctypes.util.find_library("c")
+    if library is None:
+        return
+    try:
+        ctypes.CDLL(library).malloc_trim(0)
+    except (OSError, AttributeError):
+        # Not glibc, e.g. musl or macOS
+        pass
@@ -0,0 +1,406 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the buckets of the stage duration histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms of the bot, exportable as Prometheus text or JSON.
+
+    Every metric has one label, e.g. the stage of a duration or the result of a post, so a metric is a mapping of
+    label value to its counter or histogram.
+
+    Args:
+        prefix (str): The prefix of the metric names.
+    """
+
+    def __init__(self, prefix: str = "sumbot"):
+        self.prefix = prefix
+        self._counters: Dict[str, Dict[str, Any]] = {}
+        self._histograms: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def define_counter(self, name: str, label: str, description: str) -> None:
+        """
+        Declares a counter, so it is exported even before it is incremented.
+
+        Args:
+            name (str): The name of the counter, without prefix.
+            label (str): The name of its label.
+            description (str): What it counts.
+        """
+        with self._lock:
+            self._counters.setdefault(
+                name, {"label": label, "help": description, "values": {}}
+            )
+
+    def define_histogram(
+        self,
+        name: str,
+        label: str,
+        description: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """
+        Declares a histogram.
+
+        Args:
+            name (str): The name of the histogram, without prefix.
+            label (str): The name of its label.
+            description (str): What it measures.
+            buckets (list): The upper bounds of its buckets, in increasing order.
+        """
+        with self._lock:
+            self._histograms.setdefault(
+                name,
+                {
+                    "label": label,
+                    "help": description,
+                    "buckets": list(buckets),
+                    "values": {},
+                },
+            )
+
+    def increment(self, name: str, label_value: str, amount: float = 1) -> None:
+        """
+        Increments a counter.
+
+        Args:
+            name (str): The name of the counter.
+            label_value (str): The value of its label.
+            amount (float): How much to add.
+        """
+        with self._lock:
+            values = self._counters[name]["values"]
+            values[label_value] = values.get(label_value, 0) + amount
+
+    def observe(self, name: str, label_value: str, value: float) -> None:
+        """
+        Records a value in a histogram.
+
+        Args:
+            name (str): The name of the histogram.
+            label_value (str): The value of its label.
+            value (float): The value.
+        """
+        with self._lock:
+            histogram = self._histograms[name]
+            series = histogram["values"].setdefault(
+                label_value,
+                {"counts": [0] * len(histogram["buckets"]), "sum": 0.0, "count": 0},
+            )
+            for index, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, name: str, label_value: str) -> Iterator[None]:
+        """
+        Records the duration of the block in a histogram, also when it raises.
+
+        Args:
+            name (str): The name of the histogram.
+            label_value (str): The value of its label.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, label_value, time.perf_counter() - start)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the state of every metric, as exported to JSON.
+
+        Returns:
+            dict: The counters and histograms.
+        """
+        with self._lock:
+            return json.loads(
+                json.dumps({"counters": self._counters, "histograms": self._histograms})
+            )
+
+    def merge(self, state: Dict[str, Any]) -> None:
+        """
+        Adds the metrics recorded by another registry, e.g. in a worker process.
+
+        Args:
+            state (dict): The state returned by the other registry's to_dict.
+        """
+        for name, counter in state["counters"].items():
+            self.define_counter(name, counter["label"], counter["help"])
+            for label_value, amount in counter["values"].items():
+                self.increment(name, label_value, amount)
+
+        for name, histogram in state["histograms"].items():
+            self.define_histogram(
+                name, histogram["label"], histogram["help"], histogram["buckets"]
+            )
+            with self._lock:
+                values = self._histograms[name]["values"]
+                for label_value, other in histogram["values"].items():
+                    series = values.setdefault(
+                        label_value,
+                        {"counts": [0] * len(other["counts"]), "sum": 0.0, "count": 0},
+                    )
+                    series["counts"] = [
+                        mine + theirs
+                        for mine, theirs in zip(series["counts"], other["counts"])
+                    ]
+                    series["sum"] += other["sum"]
+                    series["count"] += other["count"]
+
+    def reset(self) -> None:
+        """Sets every counter and histogram back to zero, keeping their definitions."""
+        with self._lock:
+            for metric in list(self._counters.values()) + list(
+                self._histograms.values()
+            ):
+                metric["values"] = {}
+
+    def to_prometheus(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        state = self.to_dict()
+        lines: List[str] = []
+        for name, counter in state["counters"].items():
+            full_name = "{}_{}".format(self.prefix, name)
+            lines.append("# HELP {} {}".format(full_name, counter["help"]))
+            lines.append("# TYPE {} counter".format(full_name))
+            for label_value, value in sorted(counter["values"].items()):
+                lines.append(
+                    '{}{{{}="{}"}} {}'.format(
+                        full_name, counter["label"], label_value, value
+                    )
+                )
+
+        for name, histogram in state["histograms"].items():
+            full_name = "{}_{}".format(self.prefix, name)
+            lines.append("# HELP {} {}".format(full_name, histogram["help"]))
+            lines.append("# TYPE {} histogram".format(full_name))
+            for label_value, series in sorted(histogram["values"].items()):
+                label = '{}="{}"'.format(histogram["label"], label_value)
+                for bound, count in zip(histogram["buckets"], series["counts"]):
+                    lines.append(
+                        '{}_bucket{{{},le="{}"}} {}'.format(
+                            full_name, label, bound, count
+                        )
+                    )
+                lines.append(
+                    '{}_bucket{{{},le="+Inf"}} {}'.format(
+                        full_name, label, series["count"]
+                    )
+                )
+                lines.append("{}_sum{{{}}} {}".format(full_name, label, series["sum"]))
+                lines.append(
+                    "{}_count{{{}}} {}".format(full_name, label, series["count"])
+                )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, export_format: str = "prometheus") -> None:
+        """
+        Writes every metric to a file, replacing it atomically so readers never see a partial file.
+
+        Args:
+            path (str): The path of the file.
+            export_format (str): "prometheus" or "json".
+        """
+        if export_format == "json":
+            content = json.dumps(self.to_dict(), indent=2)
+        else:
+            content = self.to_prometheus()
+
+        temporary_path = "{}.tmp".format(path)
+        with open(temporary_path, "w", encoding="utf-8") as stream:
+            stream.write(content)
+        os.replace(temporary_path, path)
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.define_histogram(
+    "stage_seconds", "stage", "Time spent in each processing stage, in seconds."
+)
+REGISTRY.define_histogram(
+    "cycle_seconds",
+    "mode",
+    "Duration of each run of the bot, in seconds.",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+REGISTRY.define_histogram(
+    "import_seconds",
+    "modules",
+    "Time spent importing the bot (core) and, when there are articles to summarize, the NLP stack (nlp), in seconds.",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REGISTRY.define_histogram(
+    "peak_rss_mb",
+    "unit",
+    "Peak resident memory of the bot while processing an article (serial mode and daemon), a batch (batch mode) or "
+    "a run (pipeline mode), in MB.",
+    buckets=(128, 256, 384, 512, 768, 1024, 1536, 2048, 4096),
+)
+REGISTRY.define_counter(
+    "posts_total",
+    "result",
+    "Reddit posts seen, by result: processed (reply queued), cached (reply from the summary cache queued), "
+    "failed or skipped (not whitelisted, already processed or claimed by another instance).",
+)
+REGISTRY.define_counter(
+    "replies_total",
+    "result",
+    "Attempts at posting a reply, by result: sent, rate_limited (retried after the wait Reddit asks for), retried "
+    "(after another error) or dropped.",
+)
+
+
+def time_stage(stage: str):
+    """
+    Times a processing stage, to be used as a context manager.
+
+    Args:
+        stage (str): The name of the stage, e.g. "fetch", "parse", "clean", "embed", "rank", "keywords" or "reply".
+
+    Returns:
+        contextmanager: Records the duration of the block in the stage_seconds histogram.
+    """
+    return REGISTRY.time("stage_seconds", stage)
+
+
+def count_posts(result: str, amount: int = 1) -> None:
+    """
+    Counts Reddit posts by what happened to them.
+
+    Args:
+        result (str): "processed", "cached", "failed" or "skipped".
+        amount (int): The number of posts.
+    """
+    REGISTRY.increment("posts_total", result, amount)
+
+
+def log_summary() -> None:
+    """Logs the posts and the time spent in each stage since the metrics were last reset."""
+    state = REGISTRY.to_dict()
+    posts = state["counters"]["posts_total"]["values"]
+    stages = state["histograms"]["stage_seconds"]["values"]
+    logger.info(
+        "Run summary: {}; {}".format(
+            ", ".join(
+                "{} {:g}".format(result, count)
+                for result, count in sorted(posts.items())
+            )
+            or "no posts",
+            ", ".join(
+                "{} {:.2f}s".format(stage, series["sum"])
+                for stage, series in sorted(stages.items())
+            )
+            or "no stages",
+        ),
+        extra={
+            "posts": posts,
+            "stage_seconds": {stage: series["sum"] for stage, series in stages.items()},
+        },
+    )
+
+
+class MetricsExporter:
+    """
+    Writes the metrics to a file every few seconds from a background thread, and once more when stopped, e.g. for
+    the Prometheus node exporter textfile collector.
+
+    Args:
+        path (str): The path of the file.
+        export_format (str): "prometheus" or "json".
+        interval_seconds (float): The seconds between writes.
+        registry (MetricsRegistry): The metrics to write.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        export_format: str = "prometheus",
+        interval_seconds: float = 15,
+        registry: Optional[MetricsRegistry] = None,
+    ):
+        self.path = path
+        self.export_format = export_format
+        self.interval_seconds = interval_seconds
+        self.registry = registry or REGISTRY
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _write(self) -> None:
+        """Writes the metrics, logging instead of raising on failure."""
+        try:
+            self.registry.write(self.path, self.export_format)
+        except OSError as e:
+            logger.error("Failed to write metrics to {}: {!r}".format(self.path, e))
+
+    def _run(self) -> None:
+        """Writes the metrics until stopped."""
+        while not self._stop_event.wait(self.interval_seconds):
+            self._write()
+
+    def start(self) -> "MetricsExporter":
+        """
+        Starts writing the metrics in the background.
+
+        Returns:
+            MetricsExporter: The exporter itself.
+        """
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="metrics-exporter", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the background thread and writes the final metrics."""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self._write()
+
+
+_DEFAULT_EXPORTER: Optional[MetricsExporter] = None
+
+
+def get_metrics_exporter(
+    parameters: Optional[Dict] = None,
+) -> Optional[MetricsExporter]:
+    """
+    Returns the process-wide metrics exporter, creating it with the given settings on first use.
+
+    Args:
+        parameters (dict): The exporter settings, only used when the exporter is created.
+
+    Returns:
+        MetricsExporter: The shared exporter, or None if it is disabled or wasn't created.
+    """
+    global _DEFAULT_EXPORTER
+    if _DEFAULT_EXPORTER is None and parameters is not None:
+        if parameters.get("path") is None:
+            return None
+        _DEFAULT_EXPORTER = MetricsExporter(
+            parameters["path"],
+            parameters.get("format", "prometheus"),
+            parameters.get("interval_seconds", 15),
+        )
+    return _DEFAULT_EXPORTER
@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from memory import get_rss_mb, release_memory
+
+logger = logging.getLogger(__name__)
+
+# How a model runs on the CPU: "torch" as published, "quantized" with its linear layers converted to int8 by
+# PyTorch dynamic quantization, "onnx" as an ONNX export run by ONNX Runtime (needs sentence-transformers[onnx])
+BACKENDS = ("torch", "quantized", "onnx")
+
+# Loaded models and their load statistics, keyed by (model name, backend)
+_MODELS: Dict[Tuple[str, str], Any] = {}
+_LOAD_STATS: Dict[Tuple[str, str], Dict[str, float]] = {}
+# When each loaded model was last requested, from time.monotonic
+_LAST_USED: Dict[Tuple[str, str], float] = {}
+_LOCK = threading.Lock()
+
+
+def _create_model(model_name: str, backend: str) -> Any:
+    """
+    Creates a SentenceTransformer model that runs on the given backend.
+
+    Args:
+        model_name (str): The Hugging Face name or local path of the model.
+        backend (str): One of BACKENDS.
+
+    Returns:
+        SentenceTransformer: The model.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        # Exports the model to ONNX unless the repository already has an export
+        return SentenceTransformer(model_name, backend="onnx")
+
+    model = SentenceTransformer(model_name)
+    if backend == "quantized":
+        import torch
+
+        torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    return model
+
+
+def _load_model(model_name: str, backend: str = "torch") -> Any:
+    """
+    Loads a SentenceTransformer model and records how long it took and how much memory it uses.
+
+    Args:
+        model_name (str): The Hugging Face name or local path of the model.
+        backend (str): One of BACKENDS.
+
+    Returns:
+        SentenceTransformer: The loaded model.
+    """
+    rss_before = get_rss_mb()
+    start = time.perf_counter()
+    model = _create_model(model_name, backend)
+    load_seconds = time.perf_counter() - start
+    rss_after = get_rss_mb()
+
+    _LOAD_STATS[(model_name, backend)] = {
+        "load_seconds": load_seconds,
+        "model_rss_mb": rss_after - rss_before,
+        "process_rss_mb": rss_after,
+    }
+    logger.info(
+        "Loaded model {} ({}) in {:.2f}s (+{:.1f} MB, process RSS {:.1f} MB)".format(
+            model_name, backend, load_seconds, rss_after - rss_before, rss_after
+        )
+    )
+    return model
+
+
+def get_model(model_name: str, backend: str = "torch") -> Any:
+    """
+    Returns the SentenceTransformer model with the given name, loading it on first use.
+
+    Each model is loaded only once per process and backend, following calls return the same instance.
+
+    Args:
+        model_name (str): The Hugging Face name or local path of the model.
+        backend (str): One of BACKENDS.
+
+    Returns:
+        SentenceTransformer: The loaded model.
+    """
+    key = (model_name, backend)
+    _LAST_USED[key] = time.monotonic()
+    model = _MODELS.get(key)
+    if model is not None:
+        return model
+
+    if backend not in BACKENDS:
+        raise ValueError(
+            "Unknown encoder backend {!r}, expected one of {}".format(
+                backend, ", ".join(BACKENDS)
+            )
+        )
+
+    with _LOCK:
+        # Another thread may have loaded the model while we waited for the lock
+        if key not in _MODELS:
+            _MODELS[key] = _load_model(model_name, backend)
+        return _MODELS[key]
+
+
+def warm_up(model_names: Iterable[str], backend: str = "torch") -> None:
+    """
+    Loads the given models ahead of time so the first article doesn't pay the load cost.
+
+    Args:
+        model_names (iterable): The names of the models to load.
+        backend (str): One of BACKENDS.
+    """
+    for model_name in model_names:
+        get_model(model_name, backend)
+
+
+def unload_model(model_name: str, backend: str = "torch") -> bool:
+    """
+    Removes a model from the registry so its memory can be reclaimed.
+
+    Args:
+        model_name (str): The name of the model to unload.
+        backend (str): The backend it was loaded with.
+
+    Returns:
+        bool: True if the model was loaded and has been removed, False otherwise.
+    """
+    with _LOCK:
+        _LAST_USED.pop((model_name, backend), None)
+        return _MODELS.pop((model_name, backend), None) is not None
+
+
+def unload_idle_models(idle_seconds: float) -> List[Tuple[str, str]]:
+    """
+    Unloads the models that weren't used for idle_seconds and returns their memory to the operating system. They
+    are loaded again by get_model when they are next needed.
+
+    Args:
+        idle_seconds (float): How long a model has to be unused to be unloaded.
+
+    Returns:
+        list: The (model name, backend) of the unloaded models.
+    """
+    cutoff = time.monotonic() - idle_seconds
+    with _LOCK:
+        idle = [key for key in _MODELS if _LAST_USED.get(key, 0) < cutoff]
+        for key in idle:
+            del _MODELS[key]
+            _LAST_USED.pop(key, None)
+
+    if idle:
+        rss_before = get_rss_mb()
+        release_memory()
+        logger.info(
+            "Unloaded idle models {} (-{:.1f} MB, process RSS {:.1f} MB)".format(
+                ", ".join("{} ({})".format(*key) for key in idle),
+                rss_before - get_rss_mb(),
+                get_rss_mb(),
+            )
+        )
+    return idle
+
+
+class IdleModelUnloader:
+    """
+    Unloads the models left unused for idle_seconds from a background thread, e.g. so a long-running bot doesn't
+    keep the model in memory between bursts of posts.
+
+    Args:
+        idle_seconds (float): How long a model has to be unused to be unloaded.
+    """
+
+    def __init__(self, idle_seconds: float):
+        self.idle_seconds = idle_seconds
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        """Checks for idle models until stopped."""
+        while not self._stop_event.wait(min(60.0, self.idle_seconds / 2)):
+            unload_idle_models(self.idle_seconds)
+
+    def start(self) -> "IdleModelUnloader":
+        """
+        Starts checking for idle models in the background.
+
+        Returns:
+            IdleModelUnloader: The unloader itself.
+        """
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="idle-model-unloader", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the background thread."""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+
+def set_torch_threads(threads: Optional[int]) -> None:
+    """
+    Limits the threads torch uses to run a model on the CPU, by default one per core. Fewer threads use less memory
+    and leave cores to the other workers of the bot.
+
+    Args:
+        threads (int): The number of intra-op threads, None to keep the torch default.
+    """
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def get_load_stats() -> Dict[Tuple[str, str], Dict[str, float]]:
+    """
+    Returns the load time and memory usage of every model loaded by this process.
+
+    Returns:
+        dict: A mapping of (model name, backend) to its load statistics.
+    """
+    return {key: dict(stats) for key, stats in _LOAD_STATS.items()}
@@ -0,0 +1,110 @@
+import logging
+from functools import lru_cache
+from typing import FrozenSet, List, Optional
+
+import nltk
+from nltk.corpus import stopwords
+
+logger = logging.getLogger(__name__)
+
+CUSTOM_STOPWORDS = "./conf/pt_stopwords.txt"
+
+# NLTK packages used by the pipeline and the path where NLTK finds each one
+NLTK_RESOURCES = [
+    ("stopwords", "corpora/stopwords"),
+    ("punkt", "tokenizers/punkt"),
+    ("punkt_tab", "tokenizers/punkt_tab"),
+]
+
+
+def set_data_path(data_path: Optional[str]) -> None:
+    """
+    Makes NLTK look for its data in the given folder before its default locations.
+
+    Args:
+        data_path (str): The folder with the NLTK data, ignored if None.
+    """
+    if data_path and data_path not in nltk.data.path:
+        nltk.data.path.insert(0, data_path)
+
+
+def find_missing_resources() -> List[str]:
+    """
+    Checks which NLTK packages used by the pipeline are not installed.
+
+    Returns:
+        list: The names of the missing packages.
+    """
+    missing = []
+    for package, resource_path in NLTK_RESOURCES:
+        try:
+            nltk.data.find(resource_path)
+        except LookupError:
+            missing.append(package)
+    return missing
+
+
+def ensure_nltk_resources(
+    data_path: Optional[str] = None, download: bool = True
+) -> List[str]:
+    """
+    Verifies that the NLTK packages used by the pipeline are installed, downloading the missing ones if allowed.
+
+    Args:
+        data_path (str): The folder with the NLTK data, also where missing packages are downloaded to.
+        download (bool): Whether to download missing packages. Set to False on runners without network access.
+
+    Returns:
+        list: The names of the packages that are still missing.
+    """
+    set_data_path(data_path)
+
+    missing = find_missing_resources()
+    if missing and download:
+        for package in missing:
+            nltk.download(package, download_dir=data_path, quiet=True)
+        missing = find_missing_resources()
+
+    if missing:
+        logger.warning("Missing NLTK packages: {}".format(", ".join(missing)))
+    return missing
+
+
+@lru_cache(maxsize=None)
+def get_stopwords(
+    language: str = "portuguese", custom_path: str = CUSTOM_STOPWORDS
+) -> FrozenSet[str]:
+    """
+    Returns the NLTK stopwords of a language together with the custom stopwords, reading them only once.
+
+    Args:
+        language (str): The language of the NLTK stopwords.
+        custom_path (str): The file with the custom stopwords, one per line.
+
+    Returns:
+        frozenset: The stopwords.
+    """
+    try:
+        stop_words = set(stopwords.words(language))
+    except LookupError:
+        # Not preloaded, get the corpus now
+        ensure_nltk_resources()
+        stop_words = set(stopwords.words(language))
+
+    with open(custom_path, "r", encoding="utf-8") as file:
+        stop_words.update(file.read().splitlines())
+
+    return frozenset(stop_words)
+
+
+def preload(data_path: Optional[str] = None, download: bool = True) -> None:
+    """
+    Loads every NLTK resource and stopword list so processing an article does no I/O.
+
+    Args:
+        data_path (str): The folder with the NLTK data.
+        download (bool): Whether to download missing NLTK packages.
+    """
+    missing = ensure_nltk_resources(data_path, download)
+    if "stopwords" not in missing:
+        get_stopwords()
@@ -0,0 +1,254 @@
+import logging
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Put on a stage's queue to tell one of its workers to stop
+_STOP = object()
+
+
+def _call_in_worker(
+    function: Callable, data: Dict[str, Any]
+) -> Tuple[Optional[Dict[str, Any]], Optional[Exception], Dict[str, Any]]:
+    """
+    Runs a process stage in a worker process, also returning the metrics it recorded so the main process can add
+    them to its own, whether the stage succeeded or not.
+
+    Args:
+        function (callable): The function of the stage.
+        data (dict): The state of the job.
+
+    Returns:
+        tuple: The result of the function, or None if it raised, the exception it raised, or None, and the state of
+        the worker's metrics.
+    """
+    REGISTRY.reset()
+    try:
+        result, error = function(data), None
+    except Exception as e:
+        result, error = None, e
+    return result, error, REGISTRY.to_dict()
+
+
+class Job:
+    """
+    A submission going through the pipeline.
+
+    Args:
+        submission (praw.models.Submission): The submission. Stays in the main process.
+        data (dict): The picklable state of the job, the only part sent to process stages.
+    """
+
+    def __init__(self, submission: Any, data: Dict[str, Any]):
+        self.submission = submission
+        self.data = data
+        self.error: Optional[Exception] = None
+
+
+class Stage:
+    """
+    A step of the pipeline with its own pool of workers and bounded input queue.
+
+    Thread stages run function(jobs) in a worker thread, where jobs is a list of up to batch_size jobs that the
+    function updates in place, setting job.error to fail a single job. They suit network I/O and model inference.
+    Process stages run function(job.data) in a worker process and merge the returned dict into job.data, so
+    CPU-bound Python code doesn't hold the GIL of the main process. Their function must be picklable.
+
+    Args:
+        name (str): The name of the stage, used in logs.
+        function (callable): The work done by the stage.
+        workers (int): The number of jobs the stage works on at the same time.
+        queue_size (int): The maximum number of jobs waiting for the stage. When the queue is full the previous
+            stage waits, so a slow stage holds back the ones before it.
+        processes (bool): Whether the stage runs in worker processes.
+        batch_size (int): The maximum number of queued jobs a thread stage handles in one call.
+        initializer (callable): Called once in each worker process of a process stage, e.g. to load resources.
+        initargs (tuple): The arguments of the initializer.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable,
+        workers: int = 1,
+        queue_size: int = 16,
+        processes: bool = False,
+        batch_size: int = 1,
+        initializer: Optional[Callable] = None,
+        initargs: tuple = (),
+    ):
+        if processes and batch_size != 1:
+            raise ValueError("Process stages handle one job at a time")
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.queue_size = queue_size
+        self.processes = processes
+        self.batch_size = batch_size
+        self.initializer = initializer
+        self.initargs = initargs
+
+
+class Pipeline:
+    """
+    Runs jobs through a sequence of stages connected by bounded queues, each stage working on its own jobs at the
+    same time as the others.
+
+    Args:
+        stages (list): The stages, in order.
+        on_error (callable): Called with the job, the stage name and the exception when a job fails. Failed jobs
+            don't go on to the next stages.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        on_error: Optional[Callable[[Job, str, Exception], None]] = None,
+    ):
+        self.stages = stages
+        self.on_error = on_error
+        self._queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self._threads: List[List[threading.Thread]] = []
+        self._executors: Dict[int, ProcessPoolExecutor] = {}
+
+    def start(self) -> "Pipeline":
+        """
+        Starts the workers of every stage.
+
+        Returns:
+            Pipeline: The pipeline itself.
+        """
+        for index, stage in enumerate(self.stages):
+            if stage.processes:
+                # Spawned workers don't inherit locks held by the threads of this process
+                self._executors[index] = ProcessPoolExecutor(
+                    max_workers=stage.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=stage.initializer,
+                    initargs=stage.initargs,
+                )
+            threads = [
+                threading.Thread(
+                    target=self._work,
+                    args=(index,),
+                    name="{}-{}".format(stage.name, worker),
+                    daemon=True,
+                )
+                for worker in range(stage.workers)
+            ]
+            for thread in threads:
+                thread.start()
+            self._threads.append(threads)
+        return self
+
+    def submit(self, job: Job) -> None:
+        """
+        Adds a job to the pipeline, waiting while the first stage's queue is full.
+
+        Args:
+            job (Job): The job.
+        """
+        self._queues[0].put(job)
+
+    def _fail(self, job: Job, stage: Stage, error: Exception) -> None:
+        """
+        Reports a failed job.
+
+        Args:
+            job (Job): The job.
+            stage (Stage): The stage where it failed.
+            error (Exception): The exception raised by the stage.
+        """
+        logger.error("Stage {} failed: {!r}".format(stage.name, error))
+        if self.on_error is not None:
+            try:
+                self.on_error(job, stage.name, error)
+            except Exception as e:
+                logger.error("Error handler failed: {!r}".format(e))
+
+    def _run(self, index: int, jobs: List[Job]) -> None:
+        """
+        Runs a stage on a batch of jobs and passes the successful ones on to the next stage.
+
+        Args:
+            index (int): The position of the stage.
+            jobs (list): The jobs.
+        """
+        stage = self.stages[index]
+        try:
+            if stage.processes:
+                for job in jobs:
+                    result, error, metrics = (
+                        self._executors[index]
+                        .submit(_call_in_worker, stage.function, job.data)
+                        .result()
+                    )
+                    REGISTRY.merge(metrics)
+                    if error is not None:
+                        raise error
+                    job.data.update(result)
+            else:
+                stage.function(jobs)
+        except Exception as e:
+            for job in jobs:
+                job.error = job.error or e
+
+        for job in jobs:
+            if job.error is not None:
+                self._fail(job, stage, job.error)
+            elif index + 1 < len(self.stages):
+                self._queues[index + 1].put(job)
+
+    def _work(self, index: int) -> None:
+        """
+        Takes batches of jobs from a stage's queue and runs the stage on them until told to stop.
+
+        Args:
+            index (int): The position of the stage.
+        """
+        stage = self.stages[index]
+        input_queue = self._queues[index]
+        while True:
+            job = input_queue.get()
+            if job is _STOP:
+                return
+
+            jobs = [job]
+            stop = False
+            while len(jobs) < stage.batch_size:
+                try:
+                    job = input_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stop = True
+                    break
+                jobs.append(job)
+
+            self._run(index, jobs)
+            if stop:
+                return
+
+    def join(self) -> None:
+        """Waits for every submitted job to go through the pipeline and stops the workers."""
+        for index, threads in enumerate(self._threads):
+            for _ in threads:
+                self._queues[index].put(_STOP)
+            for thread in threads:
+                thread.join()
+            if index in self._executors:
+                self._executors[index].shutdown()
+        self._threads = []
+        self._executors = {}
+
+    def __enter__(self) -> "Pipeline":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.join()
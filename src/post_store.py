@@ -0,0 +1,277 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from logs_helper import POSTS_LOG
+
+logger = logging.getLogger(__name__)
+
+POSTS_DB = "./processed_posts.db"
+
+# SQLite limits the number of parameters of a query
+MAX_QUERY_PARAMETERS = 500
+
+
+class ProcessedPostStore:
+    """
+    Persistent set of processed Reddit post IDs, backed by an SQLite table with the post ID as primary key.
+
+    Lookups are index lookups, so their cost doesn't grow with the history. Writes can be batched, the database
+    is opened in WAL mode with a busy timeout so several bot processes can share it, and IDs older than the
+    retention period can be removed with compact. On first use the IDs of the old processed_posts.txt are imported.
+
+    The store also keeps, for each subreddit listing, the creation time up to which every post was handled, so the
+    next run stops listing there, see get_listing_mark.
+
+    Args:
+        path (str): The path of the SQLite database.
+        write_batch_size (int): Number of added IDs kept in memory before they are written to the database.
+        legacy_log (str): The old text file with one processed post ID per line, imported if the database is empty.
+    """
+
+    def __init__(
+        self,
+        path: str = POSTS_DB,
+        write_batch_size: int = 1,
+        legacy_log: Optional[str] = POSTS_LOG,
+    ):
+        self.path = path
+        self.write_batch_size = write_batch_size
+        self._pending: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+        self._connection = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS processed_posts ("
+            "post_id TEXT PRIMARY KEY, processed_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS processed_posts_processed_at "
+            "ON processed_posts (processed_at)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS listing_marks ("
+            "listing TEXT PRIMARY KEY, created_utc REAL NOT NULL) WITHOUT ROWID"
+        )
+
+        if legacy_log is not None:
+            self._import_legacy_log(legacy_log)
+
+    def _import_legacy_log(self, legacy_log: str) -> None:
+        """
+        Imports the IDs of the old text log into an empty database.
+
+        Args:
+            legacy_log (str): The path of the text log.
+        """
+        if not os.path.exists(legacy_log) or len(self) > 0:
+            return
+
+        with open(legacy_log, "r", encoding="utf-8") as log_file:
+            post_ids = [line.strip() for line in log_file if line.strip()]
+
+        self.add_many(post_ids)
+        self.flush()
+        logger.info(
+            "Imported {} processed posts from {}".format(len(post_ids), legacy_log)
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.flush()
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM processed_posts"
+            ).fetchone()[0]
+
+    def __contains__(self, post_id: str) -> bool:
+        with self._lock:
+            if post_id in self._pending:
+                return True
+            return (
+                self._connection.execute(
+                    "SELECT 1 FROM processed_posts WHERE post_id = ?", (post_id,)
+                ).fetchone()
+                is not None
+            )
+
+    def filter_unseen(self, post_ids: Iterable[str]) -> List[str]:
+        """
+        Returns the given post IDs that haven't been processed, with a single query per few hundred IDs.
+
+        Args:
+            post_ids (iterable): The IDs to check.
+
+        Returns:
+            list: The unprocessed IDs, in the given order.
+        """
+        post_ids = list(post_ids)
+        seen = set()
+        with self._lock:
+            for start in range(0, len(post_ids), MAX_QUERY_PARAMETERS):
+                chunk = post_ids[start : start + MAX_QUERY_PARAMETERS]
+                rows = self._connection.execute(
+                    "SELECT post_id FROM processed_posts WHERE post_id IN ({})".format(
+                        ",".join("?" * len(chunk))
+                    ),
+                    chunk,
+                )
+                seen.update(row[0] for row in rows)
+            seen.update(self._pending)
+
+        return [post_id for post_id in post_ids if post_id not in seen]
+
+    def add(self, post_id: str) -> None:
+        """
+        Marks a post as processed. The ID is written once write_batch_size IDs are pending.
+
+        Args:
+            post_id (str): The ID of the Reddit post.
+        """
+        self.add_many([post_id])
+
+    def add_many(self, post_ids: Iterable[str]) -> None:
+        """
+        Marks several posts as processed.
+
+        Args:
+            post_ids (iterable): The IDs of the Reddit posts.
+        """
+        now = time.time()
+        with self._lock:
+            for post_id in post_ids:
+                self._pending.setdefault(post_id, now)
+            if len(self._pending) >= self.write_batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        """Writes the pending IDs to the database in a single transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+            with self._transaction():
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO processed_posts (post_id, processed_at) "
+                    "VALUES (?, ?)",
+                    self._pending.items(),
+                )
+            self._pending.clear()
+
+    def get_listing_mark(self, listing: str) -> Optional[float]:
+        """
+        Returns the creation time up to which every post of a listing was handled.
+
+        Args:
+            listing (str): The listing, e.g. the subreddit names joined by "+".
+
+        Returns:
+            float: The creation time, as a UTC timestamp, or None if the listing was never marked.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT created_utc FROM listing_marks WHERE listing = ?", (listing,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def set_listing_mark(self, listing: str, created_utc: float) -> None:
+        """
+        Records the creation time up to which every post of a listing was handled.
+
+        Args:
+            listing (str): The listing, e.g. the subreddit names joined by "+".
+            created_utc (float): The creation time, as a UTC timestamp.
+        """
+        with self._lock, self._transaction():
+            self._connection.execute(
+                "INSERT OR REPLACE INTO listing_marks (listing, created_utc) VALUES (?, ?)",
+                (listing, created_utc),
+            )
+
+    def compact(self, retention_days: float) -> int:
+        """
+        Removes the IDs processed more than retention_days ago. Those posts are long gone from the subreddits'
+        "new" listings, so they will not be seen again.
+
+        Args:
+            retention_days (float): The number of days an ID is kept.
+
+        Returns:
+            int: The number of removed IDs.
+        """
+        cutoff = time.time() - retention_days * 24 * 60 * 60
+        with self._lock:
+            self.flush()
+            with self._transaction():
+                removed = self._connection.execute(
+                    "DELETE FROM processed_posts WHERE processed_at < ?", (cutoff,)
+                ).rowcount
+        if removed:
+            logger.info("Removed {} expired processed posts".format(removed))
+        return removed
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Runs the statements of the block in an immediate transaction, committed on success and rolled back on error.
+
+        Yields:
+            sqlite3.Connection: The database connection.
+        """
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def close(self) -> None:
+        """Writes the pending IDs and closes the database."""
+        with self._lock:
+            self.flush()
+            self._connection.close()
+
+    def __enter__(self) -> "ProcessedPostStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+_DEFAULT_STORE: Optional[ProcessedPostStore] = None
+
+
+def get_post_store(parameters: Optional[Dict] = None) -> ProcessedPostStore:
+    """
+    Returns the process-wide processed post store, opening it with the given settings on first use.
+
+    Args:
+        parameters (dict): The store settings, only used when the store is opened. "retention_days" is used to
+            compact the store when it is opened.
+
+    Returns:
+        ProcessedPostStore: The shared store.
+    """
+    global _DEFAULT_STORE
+    if _DEFAULT_STORE is None:
+        parameters = dict(parameters or {})
+        retention_days = parameters.pop("retention_days", None)
+        _DEFAULT_STORE = ProcessedPostStore(**parameters)
+        if retention_days:
+            _DEFAULT_STORE.compact(retention_days)
+    return _DEFAULT_STORE
+
+
+def close_post_store() -> None:
+    """Writes the pending IDs and closes the process-wide store, the next get_post_store opens it again."""
+    global _DEFAULT_STORE
+    if _DEFAULT_STORE is not None:
+        _DEFAULT_STORE.close()
+        _DEFAULT_STORE = None
@@ -1,46 +1,206 @@
 import re
+from functools import cached_property, lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+import yaml
+from nltk.tokenize import sent_tokenize, word_tokenize
 
+from nlp_resources import get_stopwords
 
-def remove_unwanted_words(string: str) -> str:
+CLEANING_PATTERNS = "./conf/cleaning_patterns.yml"
+
+
+def _literal_finder(literal: str, ignore_case: bool) -> Callable[[str], bool]:
+    """
+    Creates a cheap check of whether a literal is present in a text.
+
+    Args:
+        literal (str): The literal to look for.
+        ignore_case (bool): Whether the check is case insensitive.
+
+    Returns:
+        callable: A function that receives a text and returns True if the literal is in it.
+    """
+    if ignore_case:
+        search = re.compile(re.escape(literal), re.IGNORECASE).search
+        return lambda text: search(text) is not None
+    return lambda text: literal in text
+
+
+def _can_merge_markers(markers: List[str]) -> bool:
+    """
+    Checks if consecutive "cut_after" markers can be searched for at once without changing the result.
+
+    Cutting the text at each marker in turn is the same as cutting it at the earliest marker as long as no marker
+    contains another, no marker ends where another one starts and no marker ends with whitespace.
+
+    Args:
+        markers (list): The markers, in the order they are applied.
+
+    Returns:
+        bool: True if the markers can be merged.
+    """
+    lowered = [marker.lower() for marker in markers]
+    for i, first in enumerate(lowered):
+        if first != first.rstrip():
+            return False
+        for j, second in enumerate(lowered):
+            if i == j:
+                continue
+            if first in second:
+                return False
+            if any(second.endswith(first[:k]) for k in range(1, len(first))):
+                return False
+    return True
+
+
+class TextCleaner:
+    """
+    Removes boilerplate from article text with precompiled rules, see conf/cleaning_patterns.yml.
+
+    Substitution patterns are only run when their prefilter literals are in the text, truncation markers are found
+    with plain literal searches instead of backtracking patterns, and consecutive "cut_after" markers are searched
+    for in a single pass.
+
+    Args:
+        rules (list): The cleaning rules, in the order they are applied.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = rules
+        self._steps: Dict[Optional[str], List[Tuple]] = {}
+
+    @classmethod
+    def from_config(cls, path: str = CLEANING_PATTERNS) -> "TextCleaner":
+        """
+        Creates a cleaner with the rules of a configuration file.
+
+        Args:
+            path (str): The path of the YAML file with the cleaning rules.
+
+        Returns:
+            TextCleaner: The cleaner.
+        """
+        with open(path, "r", encoding="utf-8") as stream:
+            return cls(yaml.safe_load(stream)["rules"])
+
+    def _compile(self, outlet: Optional[str]) -> List[Tuple]:
+        """
+        Compiles the rules used for an outlet into cleaning steps.
+
+        Args:
+            outlet (str): The outlet of the article, or None to use every rule.
+
+        Returns:
+            list: A list of (type, matcher, prefilters) steps.
+        """
+        rules = [
+            rule
+            for rule in self.rules
+            if outlet is None or outlet in rule.get("outlets", [outlet])
+        ]
+
+        steps = []
+        index = 0
+        while index < len(rules):
+            rule = rules[index]
+            flags = re.IGNORECASE if rule.get("ignore_case", False) else 0
+
+            if rule["type"] == "substitute":
+                prefilters = [
+                    _literal_finder(literal, bool(flags))
+                    for literal in rule.get("prefilter", [])
+                ]
+                steps.append(
+                    ("substitute", re.compile(rule["pattern"], flags), prefilters)
+                )
+                index += 1
+
+            elif rule["type"] == "cut_after":
+                # Group the following "cut_after" rules that can be searched for together
+                markers = [rule["marker"]]
+                index += 1
+                while (
+                    index < len(rules)
+                    and rules[index]["type"] == "cut_after"
+                    and rules[index].get("ignore_case", False) == bool(flags)
+                    and _can_merge_markers(markers + [rules[index]["marker"]])
+                ):
+                    markers.append(rules[index]["marker"])
+                    index += 1
+                pattern = "|".join(re.escape(marker) for marker in markers)
+                steps.append(("cut_after", re.compile(pattern, flags), []))
+
+            elif rule["type"] == "cut_before":
+                # Anchored at the start, so the text is scanned only once
+                pattern = r"[\s\S]*" + re.escape(rule["marker"])
+                steps.append(("cut_before", re.compile(pattern, flags), []))
+                index += 1
+
+            else:
+                raise ValueError("Unknown cleaning rule type: {}".format(rule["type"]))
+
+        return steps
+
+    def clean(self, text: str, outlet: Optional[str] = None) -> str:
+        """
+        Removes the boilerplate from the given text.
+
+        Args:
+            text (str): The text to clean.
+            outlet (str): The outlet of the article, or None to use every rule.
+
+        Returns:
+            str: The cleaned text.
+        """
+        if outlet not in self._steps:
+            self._steps[outlet] = self._compile(outlet)
+
+        for step_type, matcher, prefilters in self._steps[outlet]:
+            if step_type == "substitute":
+                if all(prefilter(text) for prefilter in prefilters):
+                    text = matcher.sub(" ", text)
+            elif step_type == "cut_after":
+                match = matcher.search(text)
+                if match:
+                    text = text[: match.start()] + " "
+            else:
+                match = matcher.match(text)
+                if match:
+                    text = " " + text[match.end() :]
+
+        return text
+
+
+@lru_cache(maxsize=None)
+def get_text_cleaner(path: str = CLEANING_PATTERNS) -> TextCleaner:
+    """
+    Returns the cleaner with the rules of the given configuration file, loading it only once.
+
+    Args:
+        path (str): The path of the YAML file with the cleaning rules.
+
+    Returns:
+        TextCleaner: The cleaner.
+    """
+    return TextCleaner.from_config(path)
+
+
+def remove_unwanted_words(string: str, outlet: Optional[str] = None) -> str:
     """
     Removes unwanted words or patterns from the given string.
 
     Args:
         string (str): The input string to clean.
+        outlet (str): The outlet of the article, used to select its cleaning rules. All rules are used if None.
 
     Returns:
         str: The cleaned string.
     """
     string = string.replace("\xa0", " ")
 
-    unwanted_patterns = [
-        "(?i)(?<=\.).*?Subscreva as newsletters.*?\.",
-        "(?i)Leia Também[\s\S]*",
-        "(?i)Ver Twitter",
-        "(?i)PartilharPartilhar no FacebookTwitterEmailWhatsappPartilhar[\s\S]*",
-        "\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b",  # remove emails
-        "(?i)(?<=\.).*?FacebookTwitterWhatsAppE-mailPartilharComentar",
-        "(?i)FecharSubscrever newsletter[\s\S]*?Subscrever",
-        "(?i)Partilhar este artigoFacebookTwitterWhatsAppE-mailPartilharComentários[\s\S]*",
-        "(?i)Para continuar a ler[\s\S]*",
-        "(?i)Os leitores são a força e a vida do jornal[\s\S]*",
-        "(?i)(?<=\.).*?FacebookTwitterPartilharComentar",
-        "(?:(?<=\.)|^)*[\s\S]*FacebookTwitterPartilharComentar",
-        "\(\.\.\.\)",
-        "(?i)\bpub\b",
-        "(?i)Enviar Comentário[\s\S]*",
-        "(?:(?<=\.)|^)*[\s\S]*LogoutEm Destaque",
-    ]
     # Remove the matching substrings
-    cleaned_string = string
-    for pattern in unwanted_patterns:
-        cleaned_string = re.sub(pattern, " ", cleaned_string)
-
-    return cleaned_string
+    return get_text_cleaner().clean(string, outlet)
 
 
 def remove_stopwords(text: str) -> str:
@@ -53,17 +213,8 @@ def remove_stopwords(text: str) -> str:
     Returns:
         str: The text with stopwords removed.
     """
-    # Download stopwords if not already downloaded
-    nltk.download("stopwords")
-
-    # Get the list of stopwords for English
-    stop_words = set(stopwords.words("portuguese"))
-
-    # Read the custom stopwords from the text file
-    with open("./conf/pt_stopwords.txt", "r") as file:
-        custom_stopwords = file.read().splitlines()
-
-    stop_words.update(custom_stopwords)
+    # Get the Portuguese and custom stopwords, loaded once per process
+    stop_words = get_stopwords()
 
     # Tokenize the text into individual words
     words = word_tokenize(text)
@@ -75,3 +226,69 @@ def remove_stopwords(text: str) -> str:
     filtered_text = " ".join(filtered_words)
 
     return filtered_text
+
+
+class Document:
+    """
+    The analysis of an article shared by summarization and keyword extraction. The text is cleaned of boilerplate,
+    split into sentences and tokenized into words once, each part computed on first use.
+
+    Very long articles can be capped, to bound the memory and time spent on them: only the first max_chars
+    characters of the text and its first max_sentences sentences are used.
+
+    Args:
+        text (str): The text of the article.
+        outlet (str): The outlet of the article, used to select its cleaning rules. All rules are used if None.
+        max_chars (int): The characters of the text that are used, None for all.
+        max_sentences (int): The sentences of the text that are used, None for all.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        outlet: Optional[str] = None,
+        max_chars: Optional[int] = None,
+        max_sentences: Optional[int] = None,
+    ):
+        self.truncated = max_chars is not None and len(text) > max_chars
+        if self.truncated:
+            text = text[:max_chars]
+        self.text = remove_unwanted_words(text, outlet)
+        self.max_sentences = max_sentences
+
+    @cached_property
+    def sentences(self) -> List[str]:
+        """The sentences of the cleaned text."""
+        sentences = sent_tokenize(self.text)
+        # The last sentence of a truncated text is cut short
+        if self.truncated and len(sentences) > 1:
+            sentences.pop()
+        return sentences[: self.max_sentences]
+
+    @cached_property
+    def words(self) -> List[str]:
+        """The words of the cleaned text, tokenized sentence by sentence instead of splitting the text again."""
+        return [
+            word
+            for sentence in self.sentences
+            for word in word_tokenize(sentence, preserve_line=True)
+        ]
+
+    @cached_property
+    def keyword_text(self) -> str:
+        """The words of the cleaned text without stopwords, the input of keyword extraction."""
+        stop_words = get_stopwords()
+        return " ".join(
+            word for word in self.words if word.casefold() not in stop_words
+        )
+
+    def analyze(self) -> "Document":
+        """
+        Computes every part of the analysis, e.g. before the document is sent to another process.
+
+        Returns:
+            Document: The document itself.
+        """
+        # The keyword text is built from the words, which are tokenized from the sentences
+        self.keyword_text
+        return self
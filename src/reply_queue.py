@@ -0,0 +1,442 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from praw.exceptions import RedditAPIException
+from prawcore.exceptions import TooManyRequests
+
+from claims import get_instance_id
+from logs_helper import log_error
+from metrics import REGISTRY, time_stage
+
+logger = logging.getLogger(__name__)
+
+REPLY_QUEUE_DB = "./reply_queue.db"
+
+# Wait asked by Reddit in RATELIMIT errors, e.g. "Take a break for 9 minutes before trying again."
+RATELIMIT_PATTERN = re.compile(r"([0-9]+) (milliseconds?|seconds?|minutes?)")
+
+# Seconds to wait after a RATELIMIT error whose message has no wait
+DEFAULT_RATELIMIT_SECONDS = 60
+
+# Seconds before retrying a reply that failed for another reason, doubled after each attempt
+RETRY_BACKOFF_SECONDS = 30
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Returns how long Reddit asks to wait before retrying a request that was rate limited.
+
+    Args:
+        error (Exception): The exception raised by PRAW.
+
+    Returns:
+        float: The seconds to wait, or None if the error isn't a rate limit.
+    """
+    if isinstance(error, TooManyRequests):
+        try:
+            return float(error.retry_after)
+        except (TypeError, ValueError):
+            return DEFAULT_RATELIMIT_SECONDS
+
+    if isinstance(error, RedditAPIException):
+        for item in error.items:
+            if item.error_type != "RATELIMIT":
+                continue
+            match = RATELIMIT_PATTERN.search(item.message or "")
+            if match is None:
+                return DEFAULT_RATELIMIT_SECONDS
+            seconds = int(match.group(1))
+            if match.group(2).startswith("minute"):
+                return seconds * 60
+            if match.group(2).startswith("millisecond"):
+                return seconds / 1000
+            return seconds
+    return None
+
+
+def get_budget_wait(reddit: Any) -> float:
+    """
+    Returns how long to wait for the API budget to reset, from the X-Ratelimit headers of the last response, which
+    PRAW keeps in reddit.auth.limits.
+
+    Args:
+        reddit (praw.Reddit): The Reddit instance.
+
+    Returns:
+        float: The seconds until the budget resets if it is used up, otherwise 0.
+    """
+    auth = getattr(reddit, "auth", None)
+    limits = getattr(auth, "limits", None) or {}
+    remaining, reset_timestamp = limits.get("remaining"), limits.get("reset_timestamp")
+    if remaining is None or reset_timestamp is None or remaining >= 1:
+        return 0.0
+    return max(0.0, reset_timestamp - time.time())
+
+
+class ReplyQueue:
+    """
+    Persistent queue of the replies waiting to be posted, backed by an SQLite table with the submission ID as
+    primary key, so finished summaries survive rate limits and restarts.
+
+    Instances of the bot on the same machine share the queue. An instance takes a reply before posting it, which
+    gives it a lease on the reply for lease_seconds, so no other instance posts it at the same time. A reply whose
+    lease expired was being posted by an instance that crashed or hung, and may already be on Reddit.
+
+    Args:
+        path (str): The path of the SQLite database.
+        max_attempts (int): The attempts at posting a reply before it is dropped.
+        owner (str): The ID of this instance, by default claims.get_instance_id().
+        lease_seconds (float): How long a reply is held while it is posted.
+    """
+
+    def __init__(
+        self,
+        path: str = REPLY_QUEUE_DB,
+        max_attempts: int = 5,
+        owner: Optional[str] = None,
+        lease_seconds: float = 300,
+    ):
+        self.max_attempts = max_attempts
+        self.owner = owner or get_instance_id()
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS replies ("
+                "submission_id TEXT PRIMARY KEY, body TEXT NOT NULL, queued_at REAL NOT NULL, "
+                "not_before REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS replies_not_before ON replies (not_before)"
+            )
+            # Queues created before replies had owners
+            columns = [
+                row[1] for row in self._connection.execute("PRAGMA table_info(replies)")
+            ]
+            if "owner" not in columns:
+                self._connection.execute("ALTER TABLE replies ADD COLUMN owner TEXT")
+                self._connection.execute(
+                    "ALTER TABLE replies ADD COLUMN lease_until REAL"
+                )
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._connection.execute("SELECT COUNT(*) FROM replies").fetchone()
+        return row[0]
+
+    def put(self, submission_id: str, body: str) -> None:
+        """
+        Queues a reply, to be posted right away. A reply already queued for the submission is kept.
+
+        Args:
+            submission_id (str): The ID of the submission to reply to.
+            body (str): The text of the reply.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO replies (submission_id, body, queued_at, not_before) "
+                "VALUES (?, ?, ?, ?)",
+                (submission_id, body, now, now),
+            )
+
+    def next_due(self) -> Optional[Tuple[str, str, float, int, bool]]:
+        """
+        Returns the reply that can be posted the soonest, leaving out the ones another instance is posting.
+
+        Returns:
+            tuple: The (submission_id, body, not_before, attempts, orphaned) of the reply, or None if there is none.
+            orphaned is True if the reply's lease expired while it was being posted.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT submission_id, body, not_before, attempts, owner FROM replies "
+                "WHERE owner IS NULL OR lease_until < ? "
+                "ORDER BY not_before, queued_at LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[:4] + (row[4] is not None,)
+
+    def take(self, submission_id: str) -> bool:
+        """
+        Takes a reply before posting it, unless another instance holds an unexpired lease on it.
+
+        Args:
+            submission_id (str): The ID of the submission.
+
+        Returns:
+            bool: Whether this instance should post the reply.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            return (
+                self._connection.execute(
+                    "UPDATE replies SET owner = ?, lease_until = ? "
+                    "WHERE submission_id = ? AND (owner IS NULL OR lease_until < ?)",
+                    (self.owner, now + self.lease_seconds, submission_id, now),
+                ).rowcount
+                == 1
+            )
+
+    def remove(self, submission_id: str) -> None:
+        """
+        Removes a reply, once it was posted or dropped.
+
+        Args:
+            submission_id (str): The ID of the submission.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM replies WHERE submission_id = ?", (submission_id,)
+            )
+
+    def defer(
+        self, submission_id: str, seconds: float, error: Exception, attempt: bool = True
+    ) -> None:
+        """
+        Postpones a reply that couldn't be posted and gives back its lease.
+
+        Args:
+            submission_id (str): The ID of the submission.
+            seconds (float): The seconds to wait before the next attempt.
+            error (Exception): Why the reply couldn't be posted.
+            attempt (bool): Whether the failure counts towards max_attempts. Rate limits don't.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE replies SET not_before = ?, attempts = attempts + ?, last_error = ?, "
+                "owner = NULL, lease_until = NULL WHERE submission_id = ?",
+                (time.time() + seconds, int(attempt), repr(error), submission_id),
+            )
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            self._connection.close()
+
+
+class ReplySender:
+    """
+    Posts the replies of a ReplyQueue from a background thread, at the pace the Reddit API allows.
+
+    Before each reply the sender waits for the API budget reported in Reddit's rate limit headers to reset if it is
+    used up. Rate limited replies are retried after the wait Reddit asks for, other failures with an exponential
+    backoff, and replies Reddit refuses (e.g. to a locked or deleted post) are dropped and logged in error.log, as
+    are replies left taken by an instance that stopped while posting them.
+    When stopped the sender keeps posting the replies due within max_wait_seconds, the ones due later stay queued
+    for the next run.
+
+    Args:
+        reddit (praw.Reddit): The Reddit instance, used for replies queued by earlier runs.
+        reply_queue (ReplyQueue): The queue.
+        lock (threading.Lock): Held while calling Reddit, since PRAW instances are not thread safe.
+        max_wait_seconds (float): The longest wait for a rate limit when the sender is stopped.
+    """
+
+    def __init__(
+        self,
+        reddit: Any,
+        reply_queue: ReplyQueue,
+        lock: Optional[threading.Lock] = None,
+        max_wait_seconds: float = 120,
+    ):
+        self.reddit = reddit
+        self.queue = reply_queue
+        self.lock = lock or threading.Lock()
+        self.max_wait_seconds = max_wait_seconds
+        # Listed submissions, replied to directly instead of through a new object
+        self._submissions: Dict[str, Any] = {}
+        self._wake = threading.Event()
+        self._stop_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, submission: Any, body: str) -> None:
+        """
+        Queues a reply to a submission.
+
+        Args:
+            submission (praw.models.Submission): The submission, as listed.
+            body (str): The text of the reply.
+        """
+        self._submissions[submission.id] = submission
+        self.queue.put(submission.id, body)
+        self._wake.set()
+
+    def _send(self, submission_id: str, body: str, attempts: int) -> None:
+        """
+        Posts a reply and removes it from the queue, or postpones or drops it if it fails.
+
+        Args:
+            submission_id (str): The ID of the submission.
+            body (str): The text of the reply.
+            attempts (int): The failed attempts at posting it so far, rate limits excluded.
+        """
+        submission = self._submissions.get(submission_id)
+        try:
+            with self.lock, time_stage("reply"):
+                if submission is None:
+                    submission = self.reddit.submission(submission_id)
+                submission.reply(body)
+        except Exception as e:
+            retry_after = get_retry_after(e)
+            if retry_after is not None:
+                logger.warning(
+                    "Rate limited, retrying the reply to {} in {:.0f}s".format(
+                        submission_id, retry_after
+                    ),
+                    extra={"submission_id": submission_id},
+                )
+                self.queue.defer(submission_id, retry_after, e, attempt=False)
+                REGISTRY.increment("replies_total", "rate_limited")
+                return
+
+            # Errors returned by Reddit, like a locked or deleted post, won't go away by retrying
+            if (
+                isinstance(e, RedditAPIException)
+                or attempts + 1 >= self.queue.max_attempts
+            ):
+                self._drop(submission_id, e)
+            else:
+                self.queue.defer(submission_id, RETRY_BACKOFF_SECONDS * 2**attempts, e)
+                logger.warning(
+                    "Reply to {} failed ({!r}), retrying later".format(
+                        submission_id, e
+                    ),
+                    extra={"submission_id": submission_id},
+                )
+                REGISTRY.increment("replies_total", "retried")
+            return
+
+        self.queue.remove(submission_id)
+        self._submissions.pop(submission_id, None)
+        REGISTRY.increment("replies_total", "sent")
+        logger.info(
+            ">> Submitted reply to post with id: {}".format(submission_id),
+            extra={"submission_id": submission_id},
+        )
+
+    def _drop(self, submission_id: str, error: Exception) -> None:
+        """
+        Gives up on a reply.
+
+        Args:
+            submission_id (str): The ID of the submission.
+            error (Exception): Why the reply couldn't be posted.
+        """
+        self.queue.remove(submission_id)
+        self._submissions.pop(submission_id, None)
+        REGISTRY.increment("replies_total", "dropped")
+        log_error("{},{}".format(submission_id, error))
+        logger.error(
+            "Reply to {} dropped ({!r})".format(submission_id, error),
+            extra={"submission_id": submission_id},
+        )
+
+    def send_due(self) -> Optional[float]:
+        """
+        Posts the queued replies that are due.
+
+        Returns:
+            float: The seconds until the next reply can be posted, or None if the queue is empty.
+        """
+        while True:
+            entry = self.queue.next_due()
+            if entry is None:
+                return None
+            submission_id, body, not_before, attempts, orphaned = entry
+            if not orphaned:
+                wait = max(not_before - time.time(), get_budget_wait(self.reddit))
+                if wait > 0:
+                    return wait
+            # Another instance sharing the queue may have taken the reply since it was read
+            if not self.queue.take(submission_id):
+                continue
+            if orphaned:
+                # Posting it again could duplicate the comment
+                self._drop(
+                    submission_id,
+                    RuntimeError(
+                        "the instance posting the reply stopped, it may be posted"
+                    ),
+                )
+                continue
+            self._send(submission_id, body, attempts)
+
+    def _run(self) -> None:
+        """Posts the replies as they become due, until stopped."""
+        while True:
+            self._wake.clear()
+            wait = self.send_due()
+            if self._stop_at is not None and (
+                wait is None or time.time() + wait > self._stop_at
+            ):
+                return
+            self._wake.wait(wait)
+
+    def start(self) -> "ReplySender":
+        """
+        Starts posting the queued replies in the background, starting with the ones left by earlier runs.
+
+        Returns:
+            ReplySender: The sender itself.
+        """
+        if self._thread is None:
+            self._stop_at = None
+            self._thread = threading.Thread(
+                target=self._run, name="reply-sender", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Posts the replies due within max_wait_seconds and stops the background thread."""
+        if self._thread is not None:
+            self._stop_at = time.time() + self.max_wait_seconds
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+        remaining = len(self.queue)
+        if remaining:
+            logger.info(
+                "{} replies left in the queue for the next run".format(remaining)
+            )
+
+
+_DEFAULT_QUEUE: Optional[ReplyQueue] = None
+
+
+def get_reply_queue(parameters: Optional[Dict] = None) -> ReplyQueue:
+    """
+    Returns the process-wide reply queue, opening it with the given settings on first use.
+
+    Args:
+        parameters (dict): The queue settings, only used when the queue is opened. "owner" is the ID of this
+            instance, None to create one. "max_wait_seconds" is a setting of the ReplySender and is ignored.
+
+    Returns:
+        ReplyQueue: The shared queue.
+    """
+    global _DEFAULT_QUEUE
+    if _DEFAULT_QUEUE is None:
+        parameters = dict(parameters or {})
+        parameters.pop("max_wait_seconds", None)
+        _DEFAULT_QUEUE = ReplyQueue(**parameters)
+    return _DEFAULT_QUEUE
+
+
+def close_reply_queue() -> None:
+    """Closes the process-wide reply queue, the next get_reply_queue opens it again."""
+    global _DEFAULT_QUEUE
+    if _DEFAULT_QUEUE is not None:
+        _DEFAULT_QUEUE.close()
+        _DEFAULT_QUEUE = None
@@ -1,9 +1,202 @@
+import html
 import logging
 import re
-from typing import Tuple
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
 
-import requests
-from bs4 import BeautifulSoup
+import yaml
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+from bs4.dammit import UnicodeDammit
+
+from fetcher import fetch_html
+from metrics import time_stage
+
+OUTLET_SELECTORS = "./conf/outlet_selectors.yml"
+
+# The title is read from the raw html, so the parser only has to build the article blocks
+TITLE_PATTERN = re.compile(r"<title\b[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+
+# A period followed by a capital letter or quote, missing the space between sentences
+MISSING_SPACE_PATTERN = re.compile(r"\.(?=[A-Z\"])")
+
+
+class ArticleExtractor:
+    """
+    Extracts the title and text of news articles from their html, see conf/outlet_selectors.yml.
+
+    The outlet is picked from the URL of the article before parsing, so only the classes of that outlet are looked
+    for. The page is parsed with lxml when it is installed, and only the article blocks are built into a tree.
+
+    This changes the text of some real pages: the original scraper searched the classes of every outlet on every
+    page, so a block with another outlet's class, e.g. a sidebar with sapo_24's generic "content" class, was added
+    to the body. Such blocks are now left out. Pages of websites that aren't listed are still searched with the
+    classes of every outlet, like before.
+
+    Args:
+        outlets (dict): The domains and article classes of each outlet.
+        excluding_classes (list): The classes of the blocks inside the article that aren't part of its text.
+        parser (str): The BeautifulSoup tree builder, by default lxml if it is installed and html.parser otherwise.
+    """
+
+    def __init__(
+        self,
+        outlets: Dict[str, Dict[str, List[str]]],
+        excluding_classes: List[str],
+        parser: Optional[str] = None,
+    ):
+        self.outlets = outlets
+        self.excluding_classes = excluding_classes
+        if parser is None:
+            parser = "lxml" if builder_registry.lookup("lxml") else "html.parser"
+        self.parser = parser
+
+        # The classes of every outlet, for pages of other websites
+        self.all_classes = list(
+            dict.fromkeys(
+                class_name
+                for selectors in outlets.values()
+                for class_name in selectors["classes"]
+            )
+        )
+        self._strainers: Dict[Optional[str], SoupStrainer] = {}
+
+    @classmethod
+    def from_config(
+        cls, path: str = OUTLET_SELECTORS, **kwargs: Any
+    ) -> "ArticleExtractor":
+        """
+        Creates an extractor with the selectors of a configuration file.
+
+        Args:
+            path (str): The path of the YAML file with the outlet selectors.
+            **kwargs: Other arguments of the extractor.
+
+        Returns:
+            ArticleExtractor: The extractor.
+        """
+        with open(path, "r", encoding="utf-8") as stream:
+            config = yaml.safe_load(stream)
+        return cls(config["outlets"], config["excluding_classes"], **kwargs)
+
+    def get_outlet(self, url: Optional[str]) -> Optional[str]:
+        """
+        Finds the outlet that published an article.
+
+        Args:
+            url (str): The URL of the article.
+
+        Returns:
+            str: The name of the outlet, or None if the website isn't a known outlet.
+        """
+        if not url:
+            return None
+        host = urlsplit(url).netloc.lower()
+        for outlet, selectors in self.outlets.items():
+            for domain in selectors["domains"]:
+                if host == domain or host.endswith("." + domain):
+                    return outlet
+        return None
+
+    def get_classes(self, outlet: Optional[str]) -> List[str]:
+        """
+        Returns the classes of the lead and body blocks of an outlet's articles.
+
+        Args:
+            outlet (str): The name of the outlet, or None for every outlet.
+
+        Returns:
+            list: The classes.
+        """
+        if outlet is None:
+            return self.all_classes
+        return self.outlets[outlet]["classes"]
+
+    def _get_strainer(self, outlet: Optional[str]) -> SoupStrainer:
+        """
+        Returns the filter that limits parsing to the article and excluded blocks of an outlet's pages.
+
+        Excluded blocks are kept so the article blocks nested in them can still be removed.
+
+        Args:
+            outlet (str): The name of the outlet, or None for every outlet.
+
+        Returns:
+            SoupStrainer: The filter.
+        """
+        if outlet not in self._strainers:
+            self._strainers[outlet] = SoupStrainer(
+                ["p", "div", "aside", "footer"],
+                class_=self.get_classes(outlet) + self.excluding_classes,
+            )
+        return self._strainers[outlet]
+
+    def extract(
+        self, html_content: Union[str, bytes], url: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """
+        Extracts the title, lead text (if available), and main body text from the HTML content of an article.
+
+        Args:
+            html_content (str or bytes): The HTML of the article page.
+            url (str): The URL of the article, used to pick the outlet's selectors.
+
+        Returns:
+            Tuple[str, str]: A tuple containing the extracted title and the concatenated lead text and main body text.
+        """
+        if isinstance(html_content, bytes):
+            html_content = UnicodeDammit(html_content, is_html=True).unicode_markup
+
+        # Get article title
+        title_match = TITLE_PATTERN.search(html_content)
+        if title_match is None:
+            raise ValueError("The page has no title")
+        title = html.unescape(title_match.group(1))
+
+        outlet = self.get_outlet(url)
+        classes = self.get_classes(outlet)
+        soup = BeautifulSoup(
+            html_content, self.parser, parse_only=self._get_strainer(outlet)
+        )
+
+        # Get lead text if it exists
+        lead_paragraph = soup.find("p", class_=classes)
+        news_lead = ""
+        if lead_paragraph is not None:
+            news_lead = "".join(element.get_text() for element in lead_paragraph)
+
+        # Remove the blocks that are in the article but are not relevant to its body
+        for block in soup.find_all(
+            ["div", "aside", "footer"], class_=self.excluding_classes
+        ):
+            block.decompose()
+
+        # Get main body text
+        news_text = "".join(
+            element.get_text().strip()
+            for element in soup.find_all("div", class_=classes)
+        )
+        soup.decompose()
+
+        news_body = news_lead + news_text
+        # Add space between period and capital letters of next sentence if it doesnt exist
+        news_body = MISSING_SPACE_PATTERN.sub(". ", news_body).strip()
+        return title, news_body
+
+
+@lru_cache(maxsize=None)
+def get_article_extractor(path: str = OUTLET_SELECTORS) -> ArticleExtractor:
+    """
+    Returns the extractor with the selectors of the given configuration file, loading it only once.
+
+    Args:
+        path (str): The path of the YAML file with the outlet selectors.
+
+    Returns:
+        ArticleExtractor: The extractor.
+    """
+    return ArticleExtractor.from_config(path)
 
 
 def scraper_html(url: str) -> Tuple[str, str]:
@@ -21,85 +214,27 @@ def scraper_html(url: str) -> Tuple[str, str]:
     logger.info("Getting article text from URL")
 
     # Get html from url
-    response = requests.get(url)
-    html_content = response.content
-
-    # Init scraper
-    soup = BeautifulSoup(html_content, "html.parser")
-
-    # Get article title
-    title_element = soup.title
-    title = title_element.get_text()
-
-    class_types = {
-        "cnn_portugal": "article-conteudo",
-        "sic_noticias_lead": "g-article-lead lead",
-        "sic_noticias": "full-article-fragment full-article-body first full-article-body-legacy",
-        "observador": "article-body-content",
-        "noticias_ao_minuto": "news-main-text content",
-        "publico_lead": "story__blurb lead",
-        "publico": "story__body",
-        "dn": "t-af1-content-1",
-        "dinheiro_vivo": "t-article-body-1",
-        "dineheiro_vivo_lead": "t-ah-desc",
-        "jn": "t-article-content-inner",
-        "dnoticias": "article--body",
-        "dnoticias_lead": "article--header",
-        "rr": "slab-400",
-        "rr_lead": "rr-lead",
-        "jornalnegocios": "texto paywall",
-        "sapo_24": "content",
-        "tsf_lead": "t-ah-desc",
-    }
-    # Exclude classes that are in the article but are not relevant to article body
-    excluding_classes = [
-        "relacionados-no-texto",
-        "t-content-responsive-1",
-        "article--footer",
-        "relatedLink",
-        "related-article",
-        "t-a-subscribe-1 js-contentcollapse-root",
-        "t-grp-title-5",
-        "t-a-info-share",
-        "t-abc-footer",
-        "t-a-multimedia-1",
-        "t-a-info-authoring",
-        "t-a-info-share-comment",
-        "t-a-audioplayer-1",
-        "t-af-share-2",
-        "t-af-comments-1",
-        "t-af-callout-5 js-contentcollapse-root newslettercapping",
-        "t-af-multimedia-1",
-        "t-af1-c1-sb js-a-content-sb-elm-ref",
-    ]
-
-    # Get lead text if it exists
-    try:
-        lead_paragraph = soup.find("p", class_=class_types.values())
-        news_lead = ""
-        for element in lead_paragraph:
-            news_lead += element.get_text()
-    except BaseException:
-        pass
-
-    # Find and remove the <div class="unwanted_classes"> elements
-    related_link_divs = soup.find_all(
-        ["div", "aside", "footer"], class_=excluding_classes
-    )
-    for div in related_link_divs:
-        div.decompose()
-
-    # Get main body text:
-    news_elements = soup.find_all("div", class_=class_types.values())
-
-    news_text = ""
-    for element in news_elements:
-        news_text += element.get_text().strip()
-
-    news_body = news_lead + news_text
-    # Add space between period and capital letters of next sentence if it doesnt exist
-    news_body = re.sub(r"\.(?=[A-Z\"])", ". ", news_body).strip()
-    return title, news_body
+    html_content = fetch_html(url)
+
+    return parse_html(html_content, url)
+
+
+def parse_html(
+    html_content: Union[str, bytes], url: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Extracts the title, lead text (if available), and main body text from the HTML content of an article.
+
+    Args:
+        html_content (str or bytes): The HTML of the article page.
+        url (str): The URL of the article, used to pick the outlet's selectors. The selectors of every outlet are
+            used if None.
+
+    Returns:
+        Tuple[str, str]: A tuple containing the extracted title and the concatenated lead text and main body text.
+    """
+    with time_stage("parse"):
+        return get_article_extractor().extract(html_content, url)
 
 
 if __name__ == "__main__":
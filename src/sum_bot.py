@@ -1,55 +1,839 @@
+import argparse
+import itertools
 import logging
 import os
+import threading
+import time
 from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 
-import praw
-import tldextract
-import yaml
+# Start of the import of the bot's dependencies, to report how long it took
+IMPORT_START = time.perf_counter()
 
-from logs_helper import load_log, log_error, update_log
-from scraper import scraper_html
-from summarizer import generate_extractive_summary, get_relevant_keywords
+import praw  # noqa: E402
 
-logging.basicConfig(
-    filename="status.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
+from claims import close_claim_store, get_claim_store  # noqa: E402
+from config import PARAMETERS, load_globals, load_template  # noqa: E402
+from fetcher import (  # noqa: E402
+    close_fetcher,
+    fetch_all_html,
+    get_domain,
+    get_fetcher,
 )
+from html_cache import close_html_cache, get_html_cache  # noqa: E402
+from listener import SubmissionListener  # noqa: E402
+from logs_helper import (  # noqa: E402
+    get_worker_log_queue,
+    log_error,
+    setup_logging,
+    setup_worker_logging,
+    stop_worker_logging,
+)
+from memory import get_peak_rss_since_reset_mb, reset_peak_rss  # noqa: E402
+from metrics import (  # noqa: E402
+    REGISTRY,
+    count_posts,
+    get_metrics_exporter,
+    log_summary,
+)
+from pipeline import Job, Pipeline, Stage  # noqa: E402
+from post_store import (  # noqa: E402
+    ProcessedPostStore,
+    close_post_store,
+    get_post_store,
+)
+from reply_queue import (  # noqa: E402
+    ReplySender,
+    close_reply_queue,
+    get_reply_queue,
+)
+from summary_cache import close_summary_cache, get_summary_cache  # noqa: E402
+
+# The scraper, summarizer and the NLP libraries they use are imported by the functions that need them, once
+# there is an article to summarize, see init_nlp_resources
+
+setup_logging(**PARAMETERS["logging"])
+load_globals()
+
+# Templates.
+TEMPLATE = load_template()
+
+# Serializes the calls to the shared Reddit instance, which PRAW doesn't make thread safe: the listing, the daemon's
+# submission stream and the reply sender all hold it while calling Reddit
+REDDIT_LOCK = threading.Lock()
+
+# Posts the queued replies while the bot runs, see start_reply_sender
+_REPLY_SENDER: Optional[ReplySender] = None
+
+# Whether init_nlp_resources already ran
+_NLP_LOCK = threading.Lock()
+_NLP_LOADED = False
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
+REGISTRY.observe("import_seconds", "core", IMPORT_SECONDS)
+
+
+def build_post_message(
+    article_title: str, clean_url: str, keywords: List[str], summary: str
+) -> str:
+    """
+    Fills the post template with the article information.
 
-with open("./conf/parameters.yml", "r") as stream:
-    PARAMETERS = yaml.safe_load(stream)
-
-try:
-    with open("./conf/local/globals.yml", "r") as stream:
-        globals_config = yaml.safe_load(stream)
-    # Set environment variables from the globals_config dictionary
-    for key, value in globals_config.items():
-        os.environ[key] = value
-except FileNotFoundError:
-    print(
-        "No globals.yml file found. Continuing without setting environment variables."
+    Args:
+        article_title (str): The title of the article.
+        clean_url (str): The URL of the article.
+        keywords (list): The relevant keywords of the article.
+        summary (str): The extractive summary of the article.
+
+    Returns:
+        str: The message to post as a comment.
+    """
+    top_words = ""
+    for index, word in enumerate(keywords):
+        top_words += "{}^{} ".format(word, index + 1)
+
+    return TEMPLATE.format(
+        article_title,
+        clean_url,
+        datetime.now().date(),
+        top_words,
+        summary,
     )
 
 
-TEMPLATE = open("./conf/post_template.txt", "r", encoding="utf-8").read()
+def get_whitelisted_url(submission: Any) -> Optional[str]:
+    """
+    Returns the clean URL of the article a submission links to, if the article is from a whitelisted website.
 
+    Args:
+        submission (praw.models.Submission): The submission.
 
-# Templates.
-TEMPLATE = open("./conf/post_template.txt", "r", encoding="utf-8").read()
+    Returns:
+        str: The URL without the "amp." prefix, or None if the website isn't whitelisted.
+    """
+    clean_url = submission.url.replace("amp.", "")
+    if get_domain(clean_url) in PARAMETERS["whitelist"]:
+        return clean_url
+    return None
 
 
-HEADERS = {"User-Agent": "Sumarizador de Notícias"}
+def get_new_submissions(
+    reddit: praw.Reddit, processed_posts: ProcessedPostStore
+) -> Tuple[List[Any], Optional[float]]:
+    """
+    Lists the newest submissions of all the subreddits with a single combined listing, newest first.
 
+    Paging stops at the listing mark, the creation time up to which every post was handled by earlier runs, so a
+    run with few new posts makes a single listing request while a post left unprocessed, e.g. by an instance that
+    crashed, is listed again until it is handled.
 
-def sum_bot_init() -> None:
-    """Initializes the Summarization bot. Starts a Reddit instance using PRAW, obtains the latest posts, checking if they have already been processed. If they haven't then perform summarization and
-    comment on the posts with the generated summary"""
+    Args:
+        reddit (praw.Reddit): The Reddit instance.
+        processed_posts (ProcessedPostStore): The IDs of the posts that have already been processed.
+
+    Returns:
+        tuple: The submissions that haven't been processed, and the creation time of the newest submission listed,
+        None if there were none.
+    """
+    subreddits = PARAMETERS["subreddits"]
+    mark = processed_posts.get_listing_mark("+".join(subreddits))
+    with REDDIT_LOCK:
+        listing = list(
+            itertools.takewhile(
+                lambda submission: mark is None or submission.created_utc >= mark,
+                reddit.subreddit("+".join(subreddits)).new(
+                    limit=PARAMETERS["num_posts"] * len(subreddits)
+                ),
+            )
+        )
+
+    newest = max((submission.created_utc for submission in listing), default=None)
+    unseen = set(processed_posts.filter_unseen(submission.id for submission in listing))
+    return [submission for submission in listing if submission.id in unseen], newest
 
+
+def get_pending_submissions(
+    reddit: praw.Reddit, processed_posts: ProcessedPostStore
+) -> List[Tuple[Any, str]]:
+    """
+    Collects the latest submissions of every subreddit that link to a whitelisted website and haven't been processed,
+    and claims them, so other instances of the bot leave them alone.
+
+    Args:
+        reddit (praw.Reddit): The Reddit instance.
+        processed_posts (ProcessedPostStore): The IDs of the posts that have already been processed.
+
+    Returns:
+        list: A list of (submission, clean_url) tuples, oldest first, so a run that is interrupted leaves the
+        newest submissions unprocessed.
+    """
     logger = logging.getLogger(__name__)
-    logger.info(">>> Initializing Sumarization Bot")
+
+    submissions, newest = get_new_submissions(reddit, processed_posts)
+    pending = []
+    not_whitelisted = []
+    for submission in reversed(submissions):
+        clean_url = get_whitelisted_url(submission)
+        if clean_url is not None:
+            pending.append((submission, clean_url))
+        else:
+            not_whitelisted.append(submission.id)
+    # Posts of other websites are recorded like processed ones, so they are only counted once
+    if not_whitelisted:
+        processed_posts.add_many(not_whitelisted)
+        count_posts("skipped", len(not_whitelisted))
+
+    # Keep the posts no other instance is processing, up to max_claims_per_run
+    max_claims = PARAMETERS["claims"]["max_claims_per_run"]
+    claims = get_claim_store()
+    claimed = []
+    finished = set()
+    for submission, clean_url in pending:
+        if (max_claims is None or len(claimed) < max_claims) and claims.claim(
+            submission.id
+        ):
+            claimed.append((submission, clean_url))
+        else:
+            if claims.is_finished(submission.id):
+                finished.add(submission.id)
+            count_posts("skipped")
+    # Posts another instance already answered are recorded like processed ones, so they aren't listed again
+    if finished:
+        processed_posts.add_many(finished)
+
+    # The next run lists down to the oldest post that may still need a reply, the older ones are all handled
+    waiting = [
+        submission.created_utc
+        for submission, _ in pending
+        if submission.id not in finished
+    ]
+    mark = min(waiting, default=newest)
+    if mark is not None:
+        processed_posts.set_listing_mark("+".join(PARAMETERS["subreddits"]), mark)
+    pending = claimed
+
+    if not pending:
+        logger.info(
+            "No new posts to process in /r/{}.".format(
+                "+".join(PARAMETERS["subreddits"])
+            )
+        )
+    return pending
+
+
+def handle_failure(submission: Any, clean_url: str, error: Exception) -> None:
+    """
+    Records a failed submission so it isn't retried on the next run.
+
+    Args:
+        submission (praw.models.Submission): The submission that failed.
+        clean_url (str): The URL of the article.
+        error (Exception): The exception raised while processing the submission.
+    """
+    logger = logging.getLogger(__name__)
+    log_error("{},{}".format(clean_url, error))
+    get_post_store().add(submission.id)
+    get_claim_store().fail(submission.id)
+    count_posts("failed")
+    logger.error(
+        "Submission Failed: {} ({!r})".format(submission.id, error),
+        extra={"submission_id": submission.id, "url": clean_url},
+    )
+
+
+def report_peak_rss(unit: str, submission_id: Optional[str] = None) -> None:
+    """
+    Records the peak memory of the bot since memory.reset_peak_rss was called, and warns if it is over the
+    memory budget. With several daemon workers the peak covers the articles processed at the same time.
+
+    Args:
+        unit (str): What was processed since the reset: "article", "batch" (the summaries of a batch) or
+            "pipeline" (a whole run).
+        submission_id (str): The ID of the post, if a single article was processed.
+    """
+    logger = logging.getLogger(__name__)
+    peak_rss = get_peak_rss_since_reset_mb()
+    REGISTRY.observe("peak_rss_mb", unit, peak_rss)
+
+    budget = PARAMETERS["memory"]["budget_mb"]
+    message = "Peak RSS of the {} {:.1f} MB".format(
+        unit if submission_id is None else "{} {}".format(unit, submission_id),
+        peak_rss,
+    )
+    extra = {"submission_id": submission_id, "peak_rss_mb": peak_rss}
+    if budget is not None and peak_rss > budget:
+        logger.warning("{}, over the {} MB budget".format(message, budget), extra=extra)
+    else:
+        logger.info(message, extra=extra)
+
+
+def get_cached_by_url(clean_url: str) -> Optional[Tuple[str, str, List[str]]]:
+    """
+    Looks up the summary of an article in the summary cache by its URL.
+
+    Args:
+        clean_url (str): The URL of the article.
+
+    Returns:
+        tuple: The cached (title, summary, keywords), or None if the article isn't cached or the cache is disabled.
+    """
+    cache = get_summary_cache()
+    return cache.get_by_url(clean_url) if cache is not None else None
+
+
+def get_cached_by_body(
+    clean_url: str, article_title: str, article_body: str
+) -> Optional[Tuple[str, str, List[str]]]:
+    """
+    Looks up the summary of an article in the summary cache by its text, so the same article under another URL is
+    answered from the cache. A hit is also stored under the new URL.
+
+    Args:
+        clean_url (str): The URL of the article.
+        article_title (str): The title of the article.
+        article_body (str): The text of the article.
+
+    Returns:
+        tuple: The (title, summary, keywords), or None if the article isn't cached or the cache is disabled.
+    """
+    cache = get_summary_cache()
+    if cache is None:
+        return None
+
+    cached = cache.get_by_body(article_body)
+    if cached is None:
+        return None
+
+    _, summary, keywords = cached
+    cache.put(clean_url, article_body, article_title, summary, keywords)
+    return article_title, summary, keywords
+
+
+def cache_summary(
+    clean_url: str,
+    article_title: str,
+    article_body: str,
+    summary: str,
+    keywords: List[str],
+) -> None:
+    """
+    Stores the summary of an article in the summary cache, if it is enabled.
+
+    Args:
+        clean_url (str): The URL of the article.
+        article_title (str): The title of the article.
+        article_body (str): The text of the article.
+        summary (str): The extractive summary of the article.
+        keywords (list): The relevant keywords of the article.
+    """
+    cache = get_summary_cache()
+    if cache is not None and summary:
+        cache.put(clean_url, article_body, article_title, summary, keywords)
+
+
+def reply_with_summary(
+    submission: Any,
+    clean_url: str,
+    article_title: str,
+    summary: str,
+    keywords: List[str],
+    cached: bool = False,
+) -> None:
+    """
+    Queues the reply with the summary of its article to the submission. The reply is posted by the reply sender,
+    at the pace the Reddit API allows.
+
+    Args:
+        submission (praw.models.Submission): The submission to reply to.
+        clean_url (str): The URL of the article.
+        article_title (str): The title of the article.
+        summary (str): The extractive summary of the article.
+        keywords (list): The relevant keywords of the article.
+        cached (bool): Whether the summary came from the summary cache, counted in the metrics.
+    """
+    logger = logging.getLogger(__name__)
+
+    if not summary:
+        raise ValueError("No sentences found in article text")
+
+    # Another instance took over the post if this one held it for longer than its lease
+    if not get_claim_store().complete(submission.id):
+        count_posts("skipped")
+        return
+
+    post_message = build_post_message(article_title, clean_url, keywords, summary)
+    # The queue is persistent, so the post is processed even if Reddit rate limits the reply
+    _REPLY_SENDER.submit(submission, post_message)
+    get_post_store().add(submission.id)
+    count_posts("cached" if cached else "processed")
+    logger.info(
+        ">> Queued reply to post with id: {}".format(submission.id),
+        extra={"submission_id": submission.id, "url": clean_url},
+    )
+
+
+def process_submission(submission: Any, clean_url: str) -> None:
+    """
+    Scrapes, summarizes and replies to a single submission.
+
+    Args:
+        submission (praw.models.Submission): The submission to process.
+        clean_url (str): The URL of the article.
+    """
+    from scraper import scraper_html
+    from summarizer import (
+        analyze_document,
+        generate_extractive_summary,
+        get_relevant_keywords,
+    )
+
+    logger = logging.getLogger(__name__)
+    reset_peak_rss()
     try:
-        reddit = praw.Reddit(
+        logger.info(">> Start summarizer for post with id: {}".format(submission.id))
+        cached = get_cached_by_url(clean_url)
+        if cached is None:
+            # Scrape html and get article text
+            article_title, article_body = scraper_html(clean_url)
+            cached = get_cached_by_body(clean_url, article_title, article_body)
+
+        from_cache = cached is not None
+        if from_cache:
+            article_title, summary, keywords = cached
+        else:
+            # Clean and tokenize the article text once for the summary and the keywords
+            document = analyze_document(article_body)
+            summary = generate_extractive_summary(
+                document,
+                PARAMETERS["num_sentences"],
+                PARAMETERS["summary_in_article_order"],
+            )
+            keywords = get_relevant_keywords(document)
+            cache_summary(clean_url, article_title, article_body, summary, keywords)
+
+        reply_with_summary(
+            submission, clean_url, article_title, summary, keywords, from_cache
+        )
+
+    except Exception as e:
+        handle_failure(submission, clean_url, e)
+    finally:
+        report_peak_rss("article", submission.id)
+
+
+def find_cached(
+    pending: List[Tuple[Any, str]],
+) -> Tuple[List[Tuple[Any, ...]], List[Tuple[Any, str]]]:
+    """
+    Looks up the summary of every pending submission's article in the summary cache by its URL.
+
+    Args:
+        pending (list): A list of (submission, clean_url) tuples.
+
+    Returns:
+        tuple: The submissions ready to be answered, as (submission, clean_url, title, summary, keywords, cached)
+        tuples, and the (submission, clean_url) tuples whose article must be downloaded.
+    """
+    logger = logging.getLogger(__name__)
+    ready = []
+    to_fetch = []
+    for submission, clean_url in pending:
+        logger.info(">> Start summarizer for post with id: {}".format(submission.id))
+        cached = get_cached_by_url(clean_url)
+        if cached is not None:
+            ready.append((submission, clean_url) + cached + (True,))
+        else:
+            to_fetch.append((submission, clean_url))
+    return ready, to_fetch
+
+
+def parse_articles(
+    to_fetch: List[Tuple[Any, str]], ready: List[Tuple[Any, ...]]
+) -> List[Tuple[Any, ...]]:
+    """
+    Downloads the articles of the submissions at the same time and extracts and tokenizes their text. Articles found
+    in the summary cache by their text are added to ready, failures are recorded.
+
+    Args:
+        to_fetch (list): A list of (submission, clean_url) tuples.
+        ready (list): The submissions ready to be answered, extended in place.
+
+    Returns:
+        list: The articles to summarize, as (submission, clean_url, title, body, document) tuples.
+    """
+    from scraper import parse_html
+    from summarizer import analyze_document
+
+    # Download the html of every article concurrently
+    html_contents = fetch_all_html([clean_url for _, clean_url in to_fetch])
+
+    # Get article text of every submission
+    articles = []
+    for submission, clean_url in to_fetch:
+        reset_peak_rss()
+        try:
+            html_content = html_contents[clean_url]
+            if isinstance(html_content, Exception):
+                raise html_content
+            article_title, article_body = parse_html(html_content, clean_url)
+            cached = get_cached_by_body(clean_url, article_title, article_body)
+            if cached is not None:
+                ready.append((submission, clean_url) + cached + (True,))
+            else:
+                articles.append(
+                    (
+                        submission,
+                        clean_url,
+                        article_title,
+                        article_body,
+                        analyze_document(article_body),
+                    )
+                )
+        except Exception as e:
+            handle_failure(submission, clean_url, e)
+        finally:
+            report_peak_rss("article", submission.id)
+    return articles
+
+
+def summarize_articles(
+    articles: List[Tuple[Any, ...]], ready: List[Tuple[Any, ...]]
+) -> None:
+    """
+    Summarizes the text of all articles with one batched encoder call, falling back to one article at a time if the
+    batch fails, and extracts their keywords. Summarized articles are added to ready, failures are recorded.
+
+    Args:
+        articles (list): The articles, as (submission, clean_url, title, body, document) tuples.
+        ready (list): The submissions ready to be answered, extended in place.
+    """
+    from summarizer import (
+        generate_extractive_summaries,
+        generate_extractive_summary,
+        get_relevant_keywords,
+    )
+
+    logger = logging.getLogger(__name__)
+    if not articles:
+        return
+
+    summaries = None
+    try:
+        summaries = generate_extractive_summaries(
+            [document for _, _, _, _, document in articles],
+            PARAMETERS["num_sentences"],
+            PARAMETERS["embedding_batch_size"],
+            PARAMETERS["summary_in_article_order"],
+        )
+    except Exception as e:
+        logger.error(
+            "Batched summarization failed ({}), summarizing articles one by one.".format(
+                e
+            )
+        )
+
+    for index, (
+        submission,
+        clean_url,
+        article_title,
+        article_body,
+        document,
+    ) in enumerate(articles):
+        try:
+            if summaries is None:
+                summary = generate_extractive_summary(
+                    document,
+                    PARAMETERS["num_sentences"],
+                    PARAMETERS["summary_in_article_order"],
+                )
+            else:
+                summary = summaries[index]
+
+            keywords = get_relevant_keywords(document)
+            cache_summary(clean_url, article_title, article_body, summary, keywords)
+            ready.append(
+                (submission, clean_url, article_title, summary, keywords, False)
+            )
+        except Exception as e:
+            handle_failure(submission, clean_url, e)
+
+
+def process_batch(pending: List[Tuple[Any, str]]) -> None:
+    """
+    Downloads the articles of every pending submission at the same time, summarizes all of them with one batched
+    encoder call and replies to each submission. Articles in the summary cache are neither downloaded nor summarized.
+
+    Args:
+        pending (list): A list of (submission, clean_url) tuples.
+    """
+    if not pending:
+        return
+
+    # Submissions ready to be answered, as (submission, clean_url, title, summary, keywords, cached) tuples
+    ready, to_fetch = find_cached(pending)
+    # The peak of each article is reported while it is parsed, the batched encoder call is shared by all of them
+    articles = parse_articles(to_fetch, ready)
+    reset_peak_rss()
+    summarize_articles(articles, ready)
+
+    for submission, clean_url, article_title, summary, keywords, cached in ready:
+        try:
+            reply_with_summary(
+                submission, clean_url, article_title, summary, keywords, cached
+            )
+        except Exception as e:
+            handle_failure(submission, clean_url, e)
+    report_peak_rss("batch")
+
+
+def fetch_stage(jobs: List[Job]) -> None:
+    """
+    Pipeline stage that downloads the html of each article, unless its summary is in the summary cache.
+
+    Args:
+        jobs (list): The pipeline jobs.
+    """
+    logger = logging.getLogger(__name__)
+    for job in jobs:
+        logger.info(
+            ">> Start summarizer for post with id: {}".format(job.submission.id)
+        )
+        cached = get_cached_by_url(job.data["clean_url"])
+        if cached is not None:
+            job.data.update(zip(("title", "summary", "keywords"), cached), cached=True)
+            continue
+        try:
+            job.data["html"] = get_fetcher().fetch(job.data["clean_url"])
+        except Exception as e:
+            job.error = e
+
+
+def parse_stage(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pipeline stage, run in a worker process, that gets the article title and text from its html, and cleans and
+    tokenizes the text for the summarize and keywords stages.
+
+    Args:
+        data (dict): The state of the pipeline job.
+
+    Returns:
+        dict: The title, body and document analysis of the article.
+    """
+    from scraper import parse_html
+    from summarizer import analyze_document
+
+    if data.get("cached"):
+        return {}
+    article_title, article_body = parse_html(data["html"], data["clean_url"])
+    return {
+        "title": article_title,
+        "body": article_body,
+        "document": analyze_document(article_body),
+        "html": None,
+    }
+
+
+def summarize_stage(jobs: List[Job]) -> None:
+    """
+    Pipeline stage that summarizes a batch of articles with one encoder call, unless their summary is in the summary
+    cache.
+
+    Args:
+        jobs (list): The pipeline jobs.
+    """
+    from summarizer import generate_extractive_summaries, generate_extractive_summary
+
+    logger = logging.getLogger(__name__)
+
+    to_summarize = []
+    for job in jobs:
+        if job.data.get("cached"):
+            continue
+        cached = get_cached_by_body(
+            job.data["clean_url"], job.data["title"], job.data["body"]
+        )
+        if cached is not None:
+            job.data.update(zip(("title", "summary", "keywords"), cached), cached=True)
+        else:
+            to_summarize.append(job)
+
+    if not to_summarize:
+        return
+
+    try:
+        summaries = generate_extractive_summaries(
+            [job.data["document"] for job in to_summarize],
+            PARAMETERS["num_sentences"],
+            PARAMETERS["embedding_batch_size"],
+            PARAMETERS["summary_in_article_order"],
+        )
+    except Exception as e:
+        logger.error(
+            "Batched summarization failed ({}), summarizing articles one by one.".format(
+                e
+            )
+        )
+        summaries = []
+        for job in to_summarize:
+            try:
+                summaries.append(
+                    generate_extractive_summary(
+                        job.data["document"],
+                        PARAMETERS["num_sentences"],
+                        PARAMETERS["summary_in_article_order"],
+                    )
+                )
+            except Exception as e:
+                job.error = e
+                summaries.append("")
+
+    for job, summary in zip(to_summarize, summaries):
+        job.data["summary"] = summary
+
+
+def keywords_stage(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pipeline stage, run in a worker process, that extracts the keywords of an article.
+
+    Args:
+        data (dict): The state of the pipeline job.
+
+    Returns:
+        dict: The keywords of the article.
+    """
+    from summarizer import get_relevant_keywords
+
+    if data.get("cached"):
+        return {}
+    return {"keywords": get_relevant_keywords(data["document"])}
+
+
+def preload_worker(
+    data_path: Optional[str], download: bool, log_queue: Any, log_level: str
+) -> None:
+    """
+    Initializer of the pipeline worker processes, sends their logs to the main process and loads the NLTK corpora
+    and stopwords.
+
+    Args:
+        data_path (str): The folder with the NLTK data, None for the NLTK default locations.
+        download (bool): Whether to download missing NLTK packages.
+        log_queue (multiprocessing.Queue): The queue of logs_helper.get_worker_log_queue.
+        log_level (str): The minimum level of the logged records.
+    """
+    from nlp_resources import preload
+
+    setup_worker_logging(log_queue, log_level)
+    preload(data_path, download)
+
+
+def reply_stage(jobs: List[Job]) -> None:
+    """
+    Pipeline stage that stores each new summary in the summary cache and replies to the submission.
+
+    Args:
+        jobs (list): The pipeline jobs.
+    """
+    for job in jobs:
+        data = job.data
+        try:
+            if not data.get("cached"):
+                cache_summary(
+                    data["clean_url"],
+                    data["title"],
+                    data["body"],
+                    data["summary"],
+                    data["keywords"],
+                )
+            reply_with_summary(
+                job.submission,
+                data["clean_url"],
+                data["title"],
+                data["summary"],
+                data["keywords"],
+                data.get("cached", False),
+            )
+        except Exception as e:
+            job.error = e
+
+
+def build_pipeline() -> Pipeline:
+    """
+    Creates the pipeline that fetches, parses, summarizes, extracts the keywords of and replies to submissions, with
+    the concurrency of each stage set in the "pipeline" section of conf/parameters.yml.
+
+    Returns:
+        Pipeline: The pipeline, not started.
+    """
+    settings = PARAMETERS["pipeline"]
+    # Worker processes load the NLTK resources themselves and log through the main process
+    worker_args = (
+        PARAMETERS["nltk"]["data_path"],
+        PARAMETERS["nltk"]["download"],
+        get_worker_log_queue(),
+        PARAMETERS["logging"]["level"],
+    )
+
+    stages = [
+        Stage("fetch", fetch_stage, **settings["fetch"]),
+        Stage(
+            "parse",
+            parse_stage,
+            processes=True,
+            initializer=preload_worker,
+            initargs=worker_args,
+            **settings["parse"]
+        ),
+        Stage(
+            "summarize",
+            summarize_stage,
+            batch_size=PARAMETERS["embedding_batch_size"],
+            **settings["summarize"]
+        ),
+        Stage(
+            "keywords",
+            keywords_stage,
+            processes=True,
+            initializer=preload_worker,
+            initargs=worker_args,
+            **settings["keywords"]
+        ),
+        Stage("reply", reply_stage, **settings["reply"]),
+    ]
+
+    def on_error(job: Job, stage_name: str, error: Exception) -> None:
+        handle_failure(job.submission, job.data["clean_url"], error)
+
+    return Pipeline(stages, on_error)
+
+
+def process_pipeline(pending: List[Tuple[Any, str]]) -> None:
+    """
+    Runs every pending submission through the staged pipeline. The stages process several articles at the same
+    time, so the peak memory is reported for the whole run instead of for each article.
+
+    Args:
+        pending (list): A list of (submission, clean_url) tuples.
+    """
+    if not pending:
+        return
+    reset_peak_rss()
+    with build_pipeline() as pipeline:
+        for submission, clean_url in pending:
+            pipeline.submit(Job(submission, {"clean_url": clean_url}))
+    report_peak_rss("pipeline")
+
+
+def create_reddit() -> praw.Reddit:
+    """
+    Starts a Reddit instance using PRAW with the credentials in the environment variables.
+
+    Returns:
+        praw.Reddit: The Reddit instance.
+    """
+    logger = logging.getLogger(__name__)
+    try:
+        return praw.Reddit(
             client_id=os.environ["APP_ID"],
             client_secret=os.environ["APP_SECRET"],
             user_agent=os.environ["USER_AGENT"],
@@ -58,63 +842,285 @@ def sum_bot_init() -> None:
         )
     except KeyError:
         logger.error("Reddit API information is invalid or missing.")
+        raise
 
-    new_post_found = False
-    processed_posts = load_log()
-    for subreddit in PARAMETERS["subreddits"]:
-        for submission in reddit.subreddit(subreddit).new(
-            limit=PARAMETERS["num_posts"]
-        ):
-            if submission.id not in processed_posts:
-                clean_url = submission.url.replace("amp.", "")
-                ext = tldextract.extract(clean_url)
-                domain = "{}.{}".format(ext.domain, ext.suffix)
-
-                if domain in PARAMETERS["whitelist"]:
-                    new_post_found = True
-                    try:
-                        logger.info(
-                            ">> Start summarizer for post with id: {}".format(
-                                submission.id
-                            )
-                        )
-                        # Scrape html and get article text
-                        article_title, article_body = scraper_html(clean_url)
-
-                        # Perform summarization on article text
-                        summary = generate_extractive_summary(
-                            article_body, PARAMETERS["num_sentences"]
-                        )
-
-                        keywords = get_relevant_keywords(article_body)
-
-                        top_words = ""
-                        for index, word in enumerate(keywords):
-                            top_words += "{}^{} ".format(word, index + 1)
-
-                        post_message = TEMPLATE.format(
-                            article_title,
-                            clean_url,
-                            datetime.now().date(),
-                            top_words,
-                            summary,
-                        )
-                        reddit.submission(submission.id).reply(post_message)
-                        update_log(submission.id)
-                        logger.info(
-                            ">> Submitted reply to post with id: {}".format(
-                                submission.id
-                            )
-                        )
-
-                    except Exception as e:
-                        log_error("{},{}".format(clean_url, e))
-                        update_log(submission.id)
-                        logger.error("Submission Failed:", submission.id)
-                        continue
-        if not new_post_found:
-            logger.info("No new posts to process in /r/{}.".format(subreddit))
+
+def get_cache_namespace() -> str:
+    """
+    Identifies the summarization settings, so cached summaries made with other settings are not used.
+
+    Returns:
+        str: The summary cache namespace.
+    """
+    parts = [PARAMETERS["sentence_transfomer"], str(PARAMETERS["num_sentences"])]
+    # Settings left at their default don't change the namespace, so existing entries stay valid
+    if PARAMETERS["summary_in_article_order"]:
+        parts.append("article_order")
+    if PARAMETERS["encoder_backend"] != "torch":
+        parts.append(PARAMETERS["encoder_backend"])
+    limits = PARAMETERS["memory"]
+    if limits["max_article_chars"] is not None:
+        parts.append("max_chars={}".format(limits["max_article_chars"]))
+    if limits["max_sentences"] is not None:
+        parts.append("max_sentences={}".format(limits["max_sentences"]))
+    if limits["embedding_dtype"] != "float32":
+        parts.append(limits["embedding_dtype"])
+    return "|".join(parts)
+
+
+def init_resources() -> None:
+    """
+    Opens the resources needed to find new posts. The summarization resources are loaded by init_nlp_resources,
+    only when there is an article to summarize.
+    """
+
+    # Share one connection pool per news website for the whole run, keeping the downloaded pages
+    get_fetcher(PARAMETERS.get("fetch"), get_html_cache(PARAMETERS["html_cache"]))
+
+    get_summary_cache(
+        dict(PARAMETERS["summary_cache"], namespace=get_cache_namespace())
+    )
+    get_post_store(PARAMETERS["processed_posts"])
+    # Coordinates with the other instances of the bot
+    get_claim_store(PARAMETERS["claims"])
+
+    # Export the metrics while the bot runs
+    metrics_exporter = get_metrics_exporter(PARAMETERS["metrics"])
+    if metrics_exporter is not None:
+        metrics_exporter.start()
+
+
+def init_nlp_resources() -> None:
+    """
+    Imports the scraper, the summarizer and their NLP libraries and loads the NLTK data, the encoder and the
+    embedding cache, so the first article doesn't pay for it. Runs once per process; runs that find no new posts
+    never call it and exit without importing the NLP stack.
+    """
+    global _NLP_LOADED
+    logger = logging.getLogger(__name__)
+
+    with _NLP_LOCK:
+        if _NLP_LOADED:
+            return
+
+        start = time.perf_counter()
+        import scraper  # noqa: F401
+        import summarizer  # noqa: F401
+        from embedding_cache import get_embedding_cache
+        from model_registry import set_torch_threads, warm_up
+        from nlp_resources import preload
+
+        import_seconds = time.perf_counter() - start
+        REGISTRY.observe("import_seconds", "nlp", import_seconds)
+        logger.info("Imported the NLP stack in {:.2f}s".format(import_seconds))
+
+        # Load the NLTK corpora and stopwords before processing any article
+        preload(PARAMETERS["nltk"]["data_path"], PARAMETERS["nltk"]["download"])
+
+        set_torch_threads(PARAMETERS["memory"]["torch_threads"])
+
+        # Load the encoder once, before the first article is processed
+        if PARAMETERS.get("warm_up_model", True):
+            warm_up([PARAMETERS["sentence_transfomer"]], PARAMETERS["encoder_backend"])
+
+        get_embedding_cache(
+            dict(
+                PARAMETERS["embedding_cache"],
+                dtype=PARAMETERS["memory"]["embedding_dtype"],
+                namespace="{}|{}".format(
+                    PARAMETERS["sentence_transfomer"], PARAMETERS["encoder_backend"]
+                ),
+            )
+        )
+        _NLP_LOADED = True
+
+
+def start_reply_sender(reddit: praw.Reddit) -> None:
+    """
+    Starts posting the queued replies in the background, starting with the ones left by earlier runs.
+
+    Args:
+        reddit (praw.Reddit): The Reddit instance.
+    """
+    global _REPLY_SENDER
+    settings = PARAMETERS["reply_queue"]
+    _REPLY_SENDER = ReplySender(
+        reddit,
+        # Take the replies under the same ID as the claims
+        get_reply_queue(dict(settings, owner=get_claim_store().owner)),
+        REDDIT_LOCK,
+        settings["max_wait_seconds"],
+    ).start()
+
+
+def stop_reply_sender() -> None:
+    """Posts the replies due soon and stops the reply sender, the others are posted by the next run."""
+    global _REPLY_SENDER
+    if _REPLY_SENDER is not None:
+        _REPLY_SENDER.stop()
+        _REPLY_SENDER = None
+
+
+def close_resources() -> None:
+    """Writes the state kept in memory, logs the statistics of the run and closes the stores opened by
+    init_resources."""
+    stop_reply_sender()
+    close_reply_queue()
+
+    # Write the IDs still pending in the batch
+    close_post_store()
+    # Let other instances take the posts this run didn't finish
+    close_claim_store()
+
+    summary_cache = get_summary_cache()
+    if summary_cache is not None:
+        summary_cache.log_stats()
+    close_summary_cache()
+
+    html_cache = get_html_cache()
+    if html_cache is not None:
+        html_cache.log_stats()
+    # The fetcher keeps the HTML cache, so both are opened again by the next init_resources
+    close_fetcher()
+    close_html_cache()
+
+    if _NLP_LOADED:
+        from embedding_cache import get_embedding_cache
+
+        embedding_cache = get_embedding_cache()
+        if embedding_cache is not None:
+            embedding_cache.flush()
+            embedding_cache.log_stats()
+
+    log_summary()
+    stop_worker_logging()
+    metrics_exporter = get_metrics_exporter()
+    if metrics_exporter is not None:
+        metrics_exporter.stop()
+
+
+def sum_bot_init(reddit: Optional[praw.Reddit] = None) -> None:
+    """Initializes the Summarization bot. Starts a Reddit instance using PRAW, obtains the latest posts, checking if they have already been processed. If they haven't then perform summarization and
+    comment on the posts with the generated summary
+
+    Args:
+        reddit (praw.Reddit): The Reddit instance to use instead of creating one, e.g. the FakeReddit of tests/fake_reddit.py.
+    """
+
+    logger = logging.getLogger(__name__)
+    logger.info(">>> Initializing Sumarization Bot")
+    logger.info("Imported the bot in {:.2f}s".format(IMPORT_SECONDS))
+    if reddit is None:
+        reddit = create_reddit()
+
+    init_resources()
+    start_reply_sender(reddit)
+    try:
+        with REGISTRY.time("cycle_seconds", PARAMETERS["mode"]):
+            pending = get_pending_submissions(reddit, get_post_store())
+            if pending:
+                init_nlp_resources()
+
+            if PARAMETERS["mode"] == "pipeline":
+                process_pipeline(pending)
+            elif PARAMETERS["mode"] == "batch":
+                process_batch(pending)
+            else:
+                for submission, clean_url in pending:
+                    process_submission(submission, clean_url)
+    finally:
+        close_resources()
+
+
+def sum_bot_daemon(
+    reddit: Optional[praw.Reddit] = None, max_submissions: Optional[int] = None
+) -> None:
+    """Runs the Summarization bot as a long-running process. Listens to the submission stream of every subreddit and replies
+    to new posts of whitelisted websites as soon as they are submitted, paying the startup cost only once.
+
+    Args:
+        reddit (praw.Reddit): The Reddit instance to use instead of creating one, e.g. the FakeReddit of tests/fake_reddit.py.
+        max_submissions (int): Stop after this many submissions. None to run until interrupted.
+    """
+    logger = logging.getLogger(__name__)
+    logger.info(">>> Initializing Sumarization Bot daemon")
+    logger.info("Imported the bot in {:.2f}s".format(IMPORT_SECONDS))
+    if reddit is None:
+        reddit = create_reddit()
+
+    init_resources()
+    start_reply_sender(reddit)
+    processed_posts = get_post_store()
+
+    # Free the model's memory between bursts of posts
+    model_unloader = None
+    if PARAMETERS["memory"]["model_idle_seconds"]:
+        from model_registry import IdleModelUnloader
+
+        model_unloader = IdleModelUnloader(
+            PARAMETERS["memory"]["model_idle_seconds"]
+        ).start()
+
+    def select(submission: Any) -> Optional[str]:
+        clean_url = None
+        if submission.id not in processed_posts:
+            clean_url = get_whitelisted_url(submission)
+        if clean_url is not None and not get_claim_store().claim(submission.id):
+            # Answered by another instance
+            if get_claim_store().is_finished(submission.id):
+                processed_posts.add(submission.id)
+            clean_url = None
+        if clean_url is None:
+            count_posts("skipped")
+        return clean_url
+
+    pipeline = None
+    if PARAMETERS["mode"] == "pipeline":
+        # The listener only feeds the pipeline, which has its own workers
+        pipeline = build_pipeline().start()
+        num_workers = 1
+
+        def process(submission: Any, clean_url: str) -> None:
+            init_nlp_resources()
+            pipeline.submit(Job(submission, {"clean_url": clean_url}))
+
+    else:
+        num_workers = PARAMETERS["daemon"]["workers"]
+
+        def process(submission: Any, clean_url: str) -> None:
+            init_nlp_resources()
+            process_submission(submission, clean_url)
+
+    listener = SubmissionListener(
+        reddit,
+        PARAMETERS["subreddits"],
+        select,
+        process,
+        num_workers=num_workers,
+        queue_size=PARAMETERS["daemon"]["queue_size"],
+        poll_seconds=PARAMETERS["daemon"]["poll_seconds"],
+        lock=REDDIT_LOCK,
+    )
+    try:
+        listener.run(max_submissions)
+    finally:
+        if pipeline is not None:
+            pipeline.join()
+        if model_unloader is not None:
+            model_unloader.stop()
+        close_resources()
 
 
 if __name__ == "__main__":
-    sum_bot_init()
+    parser = argparse.ArgumentParser(description="Reddit news summarization bot")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and reply to new posts as they are submitted",
+    )
+    args = parser.parse_args()
+
+    if args.daemon:
+        sum_bot_daemon()
+    else:
+        sum_bot_init()
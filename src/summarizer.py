@@ -1,21 +1,41 @@
 import logging
-from typing import List
+from functools import lru_cache
+from typing import List, Union
 
-import nltk
 import numpy as np
 import yake
-import yaml
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 
-from preprocess import remove_stopwords, remove_unwanted_words
-
-with open("./conf/parameters.yml", "r") as stream:
-    PARAMETERS = yaml.safe_load(stream)
+from config import PARAMETERS
+from embedding_cache import get_embedding_cache
+from metrics import time_stage
+from model_registry import get_model
+from preprocess import Document
 
 logger = logging.getLogger(__name__)
 
 
+def analyze_document(document: Union[str, Document]) -> Document:
+    """
+    Cleans, splits into sentences and tokenizes a document once, for both summarization and keyword extraction,
+    capped to the max_article_chars and max_sentences of the "memory" parameters.
+
+    Args:
+        document (str or Document): The text of the document, or its analysis, which is returned as is.
+
+    Returns:
+        Document: The analysis of the document.
+    """
+    if isinstance(document, Document):
+        return document
+    limits = PARAMETERS["memory"]
+    with time_stage("clean"):
+        return Document(
+            document,
+            max_chars=limits["max_article_chars"],
+            max_sentences=limits["max_sentences"],
+        ).analyze()
+
+
 def preprocess_text(text: str) -> List[str]:
     """
     Preprocesses the given text by removing unwanted words and tokenizes it into sentences.
@@ -26,11 +46,18 @@ def preprocess_text(text: str) -> List[str]:
     Returns:
         list: A list of tokenized sentences.
     """
-    text = remove_unwanted_words(text)
-    # Tokenize the text into sentences using nltk.tokenize.sent_tokenize
-    sentences = nltk.sent_tokenize(text)
-    # Perform text cleaning and preprocessing
-    return sentences
+    return analyze_document(text).sentences
+
+
+def get_embedding_dtype() -> np.dtype:
+    """
+    Returns the type the sentence embeddings are kept as until they are ranked, the embedding_dtype of the "memory"
+    parameters.
+
+    Returns:
+        numpy.dtype: The type.
+    """
+    return np.dtype(PARAMETERS["memory"]["embedding_dtype"])
 
 
 def generate_sentence_embeddings(sentences: List[str]) -> np.ndarray:
@@ -41,13 +68,97 @@ def generate_sentence_embeddings(sentences: List[str]) -> np.ndarray:
         sentences (list): A list of sentences for which embeddings need to be generated.
 
     Returns:
-        numpy.ndarray: An array of sentence embeddings.
+        numpy.ndarray: An array of sentence embeddings, of the embedding type.
     """
-    model = SentenceTransformer(PARAMETERS["sentence_transfomer"])
-    embeddings = model.encode(sentences)
+    model = get_model(PARAMETERS["sentence_transfomer"], PARAMETERS["encoder_backend"])
+    embedding_cache = get_embedding_cache()
+    with time_stage("embed"):
+        if embedding_cache is None:
+            embeddings = model.encode(sentences)
+        else:
+            # Only the sentences that weren't seen before are encoded
+            embeddings = embedding_cache.encode(sentences, model.encode)
+    return np.asarray(embeddings, get_embedding_dtype())
+
+
+def encode_sorted_by_length(sentences: List[str], batch_size: int = 32) -> np.ndarray:
+    """
+    Encodes sentences sorted by length, so each batch holds sentences of similar size and wastes little padding.
+
+    Args:
+        sentences (list): The sentences.
+        batch_size (int): The number of sentences encoded at a time.
+
+    Returns:
+        numpy.ndarray: The embedding of each sentence, in the given order.
+    """
+    # Encode the longest sentences first
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]), reverse=True)
+    model = get_model(PARAMETERS["sentence_transfomer"], PARAMETERS["encoder_backend"])
+    sorted_embeddings = model.encode(
+        [sentences[i] for i in order], batch_size=batch_size
+    )
+
+    # Restore the original sentence order
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
     return embeddings
 
 
+def generate_batch_sentence_embeddings(
+    sentence_lists: List[List[str]], batch_size: int = 32
+) -> List[np.ndarray]:
+    """
+    Generates the sentence embeddings of several documents with a single encoder call.
+
+    The sentences of all documents are sorted by length before encoding so each batch holds sentences of similar
+    size and wastes little padding, the embeddings are then put back in their original order and split per document.
+    Sentences in the embedding cache are not encoded again.
+
+    Args:
+        sentence_lists (list): A list with the list of sentences of each document.
+        batch_size (int): The number of sentences encoded at a time.
+
+    Returns:
+        list: A list with the array of sentence embeddings of each document, of the embedding type.
+    """
+    all_sentences = [sentence for sentences in sentence_lists for sentence in sentences]
+    if not all_sentences:
+        return [np.empty((0, 0), dtype=np.float32) for _ in sentence_lists]
+
+    embedding_cache = get_embedding_cache()
+    with time_stage("embed"):
+        if embedding_cache is None:
+            embeddings = encode_sorted_by_length(all_sentences, batch_size)
+        else:
+            embeddings = embedding_cache.encode(
+                all_sentences,
+                lambda sentences: encode_sorted_by_length(sentences, batch_size),
+            )
+
+    # Split the embeddings per document
+    embeddings = np.asarray(embeddings, get_embedding_dtype())
+    offsets = np.cumsum([len(sentences) for sentences in sentence_lists])[:-1]
+    return np.split(embeddings, offsets)
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Scales sentence embeddings to unit length, leaving all-zero embeddings as they are.
+
+    Args:
+        embeddings (numpy.ndarray): An array of sentence embeddings.
+
+    Returns:
+        numpy.ndarray: The normalized embeddings, as float32.
+    """
+    # float16 embeddings are ranked in float32, their squared norms can overflow float16
+    embeddings = np.asarray(embeddings, np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
 def calculate_similarity_scores(embeddings: np.ndarray) -> np.ndarray:
     """
     Calculates similarity scores between sentence embeddings using cosine similarity.
@@ -58,12 +169,92 @@ def calculate_similarity_scores(embeddings: np.ndarray) -> np.ndarray:
     Returns:
         numpy.ndarray: A similarity matrix representing the pairwise cosine similarities between sentences.
     """
-    similarity_matrix = cosine_similarity(embeddings, embeddings)
+    normalized = normalize_embeddings(embeddings)
+    similarity_matrix = normalized @ normalized.T
     return similarity_matrix
 
 
+def calculate_centrality_scores(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Calculates the importance score of each sentence, the sum of its cosine similarities with every sentence.
+
+    This is the row sum of the similarity matrix, computed as the dot product of each normalized embedding with the
+    sum of all of them, in linear instead of quadratic time and memory.
+
+    Args:
+        embeddings (numpy.ndarray): An array of sentence embeddings.
+
+    Returns:
+        numpy.ndarray: The score of each sentence.
+    """
+    normalized = normalize_embeddings(embeddings)
+    return normalized @ normalized.sum(axis=0)
+
+
+def select_top_indices(
+    scores: np.ndarray, num_sentences: int, original_order: bool = False
+) -> np.ndarray:
+    """
+    Selects the positions of the highest scores without sorting all of them.
+
+    Of sentences with the same score the earliest one is ranked first, so the selection is deterministic.
+
+    Args:
+        scores (numpy.ndarray): The score of each sentence.
+        num_sentences (int): The number of positions to select.
+        original_order (bool): Whether to return the positions in increasing order instead of by score.
+
+    Returns:
+        numpy.ndarray: The selected positions, highest score first unless original_order is True.
+    """
+    count = len(scores)
+    num_sentences = max(0, min(num_sentences, count))
+    if num_sentences < count:
+        # The lowest score that makes the cut, found in linear time
+        threshold = np.partition(scores, count - num_sentences)[count - num_sentences]
+        above = np.flatnonzero(scores > threshold)
+        tied = np.flatnonzero(scores == threshold)[: num_sentences - len(above)]
+        selected = np.concatenate([above, tied])
+    else:
+        selected = np.arange(count)
+
+    if original_order:
+        return np.sort(selected)
+    return selected[np.lexsort((selected, -scores[selected]))]
+
+
+def rank_sentences(
+    sentences: List[str],
+    embeddings: np.ndarray,
+    num_sentences: int,
+    original_order: bool = False,
+) -> List[str]:
+    """
+    Extracts the most central sentences of a document from their embeddings.
+
+    Args:
+        sentences (list): A list of sentences.
+        embeddings (numpy.ndarray): The embedding of each sentence.
+        num_sentences (int): The number of top sentences to extract.
+        original_order (bool): Whether to return the sentences in the order they appear in the document instead
+            of by importance.
+
+    Returns:
+        list: A list of the top-scoring sentences for the summary.
+    """
+    with time_stage("rank"):
+        scores = calculate_centrality_scores(embeddings)
+        return [
+            sentences[i]
+            for i in select_top_indices(scores, num_sentences, original_order)
+        ]
+
+
 def extract_top_sentences(
-    sentences: List[str], similarity_matrix: np.ndarray, num_sentences: int
+    sentences: List[str],
+    similarity_matrix: np.ndarray,
+    num_sentences: int,
+    original_order: bool = False,
 ) -> List[str]:
     """
     Extracts the top-scoring sentences from a similarity matrix based on their importance scores.
@@ -72,28 +263,33 @@ def extract_top_sentences(
         sentences (list): A list of sentences.
         similarity_matrix (numpy.ndarray): A similarity matrix representing the pairwise cosine similarities between sentences.
         num_sentences (int): The number of top sentences to extract.
+        original_order (bool): Whether to return the sentences in the order they appear in the document instead
+            of by importance.
 
     Returns:
         list: A list of the top-scoring sentences for the summary.
     """
     # Calculate importance scores based on similarity matrix
     scores = similarity_matrix.sum(axis=1)
-    # Sort sentences based on scores
-    ranked_sentences = sorted(
-        ((scores[i], s) for i, s in enumerate(sentences)), reverse=True
-    )
     # Select top sentences for the summary
-    top_sentences = [sentence for _, sentence in ranked_sentences[:num_sentences]]
-    return top_sentences
+    return [
+        sentences[i] for i in select_top_indices(scores, num_sentences, original_order)
+    ]
 
 
-def generate_extractive_summary(document_text: str, num_sentences: int) -> str:
+def generate_extractive_summary(
+    document_text: Union[str, Document],
+    num_sentences: int,
+    original_order: bool = False,
+) -> str:
     """
     Generates an extractive summary from the given document text.
 
     Args:
-        document_text (str): The input document text.
+        document_text (str or Document): The input document text, or its analysis.
         num_sentences (int): The desired number of sentences in the summary.
+        original_order (bool): Whether the summary keeps the order of the sentences in the document instead of
+            starting with the most important one.
 
     Returns:
         str: The generated extractive summary.
@@ -101,17 +297,14 @@ def generate_extractive_summary(document_text: str, num_sentences: int) -> str:
     logger.info("Generating summary...")
 
     # Preprocess the text and tokenize into sentences
-    sentences = preprocess_text(document_text)
+    sentences = analyze_document(document_text).sentences
 
     # Generate sentence embeddings
     embeddings = generate_sentence_embeddings(sentences)
 
-    # Calculate similarity scores
-    similarity_matrix = calculate_similarity_scores(embeddings)
-
     # Extract top sentences for the summary
-    summary_sentences = extract_top_sentences(
-        sentences, similarity_matrix, num_sentences
+    summary_sentences = rank_sentences(
+        sentences, embeddings, num_sentences, original_order
     )
 
     # Concatenate summary sentences
@@ -120,22 +313,76 @@ def generate_extractive_summary(document_text: str, num_sentences: int) -> str:
     return summary
 
 
-def get_relevant_keywords(text: str) -> List[str]:
+def generate_extractive_summaries(
+    documents: List[Union[str, Document]],
+    num_sentences: int,
+    batch_size: int = 32,
+    original_order: bool = False,
+) -> List[str]:
+    """
+    Generates the extractive summaries of several documents, encoding the sentences of all of them in one batched call.
+
+    Args:
+        documents (list): The input document texts, or their analysis.
+        num_sentences (int): The desired number of sentences in each summary.
+        batch_size (int): The number of sentences encoded at a time.
+        original_order (bool): Whether the summaries keep the order of the sentences in the documents instead of
+            starting with the most important one.
+
+    Returns:
+        list: The generated extractive summary of each document, empty for documents without sentences.
+    """
+    logger.info("Generating summaries for {} articles...".format(len(documents)))
+
+    # Preprocess the texts and tokenize into sentences
+    sentence_lists = [
+        analyze_document(document_text).sentences for document_text in documents
+    ]
+
+    # Generate sentence embeddings of all documents at once
+    embedding_lists = generate_batch_sentence_embeddings(sentence_lists, batch_size)
+
+    summaries = []
+    for sentences, embeddings in zip(sentence_lists, embedding_lists):
+        if not sentences:
+            summaries.append("")
+            continue
+
+        summary_sentences = rank_sentences(
+            sentences, embeddings, num_sentences, original_order
+        )
+        summaries.append(" ".join(summary_sentences))
+
+    return summaries
+
+
+@lru_cache(maxsize=None)
+def get_keyword_extractor() -> yake.KeywordExtractor:
+    """
+    Returns the YAKE keyword extractor, created once per process.
+
+    Returns:
+        yake.KeywordExtractor: The extractor.
+    """
+    return yake.KeywordExtractor(n=1, top=5, dedupLim=0.9, dedupFunc="seqm")
+
+
+def get_relevant_keywords(text: Union[str, Document]) -> List[str]:
     """
-    Extracts relevant keywords from the given text.
+    Extracts relevant keywords from the cleaned text of the given document, without its stopwords.
 
     Args:
-        text (str): The input text.
+        text (str or Document): The input text, or its analysis.
 
     Returns:
         list: A list of relevant keywords extracted from the text.
     """
     logger.info("Extracting keywords...")
 
-    document_text = remove_stopwords(text)
-    # Extract relevant keywords
-    kw_extractor = yake.KeywordExtractor(n=1, top=5, dedupLim=0.9, dedupFunc="seqm")
-    keywords = kw_extractor.extract_keywords(document_text)
+    document = analyze_document(text)
+    with time_stage("keywords"):
+        # Extract relevant keywords
+        keywords = get_keyword_extractor().extract_keywords(document.keyword_text)
 
     relevant_keywords = []
     for kw in keywords:
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CACHE_DB = "./summary_cache.db"
+
+# Query parameters that only track where a link was shared
+TRACKING_PARAMETERS = {"fbclid", "gclid", "ocid", "ref"}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes an article URL so links to the same article share one cache entry.
+
+    Lowercases the scheme and host, drops "www." and "amp." prefixes, tracking query parameters, the fragment
+    and trailing slashes.
+
+    Args:
+        url (str): The URL of the article.
+
+    Returns:
+        str: The normalized URL.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ("www.", "amp."):
+        if host.startswith(prefix):
+            host = host[len(prefix) :]
+
+    query = urlencode(
+        [
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not key.lower().startswith("utm_")
+            and key.lower() not in TRACKING_PARAMETERS
+        ]
+    )
+    return urlunsplit(("https", host, parts.path.rstrip("/"), query, ""))
+
+
+def hash_body(article_body: str) -> str:
+    """
+    Hashes the text of an article.
+
+    Args:
+        article_body (str): The text of the article.
+
+    Returns:
+        str: The SHA-256 hex digest of the text.
+    """
+    return hashlib.sha256(article_body.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """
+    Persistent cache of article summaries, looked up by normalized URL or by a hash of the article text.
+
+    Entries expire after ttl_hours and the least recently used ones are evicted once there are more than
+    max_entries. The namespace identifies the summarization settings, entries created with other settings are
+    never returned.
+
+    Args:
+        path (str): The path of the SQLite database.
+        namespace (str): The summarization settings the summaries were created with, e.g. the model name.
+        ttl_hours (float): The hours an entry is kept.
+        max_entries (int): The maximum number of entries.
+    """
+
+    def __init__(
+        self,
+        path: str = SUMMARY_CACHE_DB,
+        namespace: str = "",
+        ttl_hours: float = 72,
+        max_entries: int = 5000,
+    ):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_hours * 60 * 60
+        self.max_entries = max_entries
+        self.stats = {"url_hits": 0, "body_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "url_key TEXT PRIMARY KEY, body_key TEXT NOT NULL, title TEXT NOT NULL, "
+                "summary TEXT NOT NULL, keywords TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS summaries_body_key ON summaries (body_key)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS summaries_accessed_at ON summaries (accessed_at)"
+            )
+
+    def _key(self, value: str) -> str:
+        """
+        Prefixes a URL or body hash with the namespace.
+
+        Args:
+            value (str): The normalized URL or body hash.
+
+        Returns:
+            str: The cache key.
+        """
+        return "{}|{}".format(self.namespace, value)
+
+    def _get(self, column: str, key: str) -> Optional[Tuple[str, str, List[str]]]:
+        """
+        Returns the most recent live entry with the given key and marks it as used.
+
+        Args:
+            column (str): The key column, "url_key" or "body_key".
+            key (str): The cache key.
+
+        Returns:
+            tuple: The (title, summary, keywords) of the entry, or None if there is none.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT url_key, title, summary, keywords FROM summaries "
+                "WHERE {} = ? AND created_at >= ? ORDER BY created_at DESC LIMIT 1".format(
+                    column
+                ),
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE summaries SET accessed_at = ? WHERE url_key = ?", (now, row[0])
+            )
+        return row[1], row[2], json.loads(row[3])
+
+    def get_by_url(self, url: str) -> Optional[Tuple[str, str, List[str]]]:
+        """
+        Looks up the summary of an article by its URL.
+
+        Args:
+            url (str): The URL of the article.
+
+        Returns:
+            tuple: The cached (title, summary, keywords), or None if there is none.
+        """
+        entry = self._get("url_key", self._key(normalize_url(url)))
+        if entry is not None:
+            self.stats["url_hits"] += 1
+        return entry
+
+    def get_by_body(self, article_body: str) -> Optional[Tuple[str, str, List[str]]]:
+        """
+        Looks up the summary of an article by its text, for the same article published under another URL.
+
+        Args:
+            article_body (str): The text of the article.
+
+        Returns:
+            tuple: The cached (title, summary, keywords), or None if there is none.
+        """
+        entry = self._get("body_key", self._key(hash_body(article_body)))
+        if entry is not None:
+            self.stats["body_hits"] += 1
+        else:
+            self.stats["misses"] += 1
+        return entry
+
+    def put(
+        self,
+        url: str,
+        article_body: str,
+        title: str,
+        summary: str,
+        keywords: List[str],
+    ) -> None:
+        """
+        Stores the summary of an article and evicts expired and least recently used entries.
+
+        Args:
+            url (str): The URL of the article.
+            article_body (str): The text of the article.
+            title (str): The title of the article.
+            summary (str): The summary of the article.
+            keywords (list): The keywords of the article.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._key(normalize_url(url)),
+                    self._key(hash_body(article_body)),
+                    title,
+                    summary,
+                    json.dumps(keywords, ensure_ascii=False),
+                    now,
+                    now,
+                ),
+            )
+            self._connection.execute(
+                "DELETE FROM summaries WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._connection.execute(
+                "DELETE FROM summaries WHERE url_key IN ("
+                "SELECT url_key FROM summaries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def hit_rate(self) -> float:
+        """
+        Returns the share of articles answered from the cache since it was opened.
+
+        Returns:
+            float: The hit rate, between 0 and 1.
+        """
+        hits = self.stats["url_hits"] + self.stats["body_hits"]
+        lookups = hits + self.stats["misses"]
+        return hits / lookups if lookups else 0.0
+
+    def log_stats(self) -> None:
+        """Logs the hits and misses of the cache."""
+        logger.info(
+            "Summary cache: {} URL hits, {} text hits, {} misses ({:.0%} hit rate)".format(
+                self.stats["url_hits"],
+                self.stats["body_hits"],
+                self.stats["misses"],
+                self.hit_rate(),
+            )
+        )
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            self._connection.close()
+
+
+_DEFAULT_CACHE: Optional[SummaryCache] = None
+
+
+def get_summary_cache(parameters: Optional[Dict] = None) -> Optional[SummaryCache]:
+    """
+    Returns the process-wide summary cache, opening it with the given settings on first use.
+
+    Args:
+        parameters (dict): The cache settings, only used when the cache is opened.
+
+    Returns:
+        SummaryCache: The shared cache, or None if it is disabled.
+    """
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None and parameters is not None:
+        parameters = dict(parameters)
+        if not parameters.pop("enabled", True):
+            return None
+        _DEFAULT_CACHE = SummaryCache(**parameters)
+    return _DEFAULT_CACHE
+
+
+def close_summary_cache() -> None:
+    """Closes the process-wide summary cache, the next get_summary_cache opens it again."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is not None:
+        _DEFAULT_CACHE.close()
+        _DEFAULT_CACHE = None
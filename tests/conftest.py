@@ -0,0 +1,197 @@
+import hashlib
+import os
+import re
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+# The bot reads its configuration and template relative to the repository root
+os.chdir(ROOT)
+
+from config import PARAMETERS  # noqa: E402
+
+# Keep the tests out of the bot's log, sum_bot sets up logging when it is imported
+PARAMETERS["logging"]["path"] = os.path.join(tempfile.mkdtemp(), "status.log")
+
+import fetcher  # noqa: E402
+import logs_helper  # noqa: E402
+import model_registry  # noqa: E402
+from nlp_resources import find_missing_resources  # noqa: E402
+from scraper import get_article_extractor  # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT, "benchmarks", "fixtures", "html")
+
+# Name under which the hashing encoder stands in for the sentence transformer
+FAKE_ENCODER = "hashing-encoder"
+
+# Article URLs containing this are never downloaded
+BROKEN = "broken"
+
+
+class HashingEncoder:
+    """
+    A local stand-in for a SentenceTransformer, so the tests don't download a model. A sentence is embedded as the
+    hashed counts of its words.
+
+    Args:
+        dimensions (int): The size of the embeddings.
+    """
+
+    def __init__(self, dimensions: int = 64):
+        self.dimensions = dimensions
+
+    def encode(
+        self, sentences: List[str], batch_size: int = 32, **kwargs: Any
+    ) -> np.ndarray:
+        embeddings = np.zeros((len(sentences), self.dimensions), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            for word in re.findall(r"\w+", sentence.lower()):
+                digest = hashlib.md5(word.encode("utf-8")).digest()
+                embeddings[
+                    row, int.from_bytes(digest[:4], "big") % self.dimensions
+                ] += 1
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+
+class FixtureFetcher:
+    """Serves the saved page of an article's outlet instead of downloading it, and fails the broken URLs."""
+
+    def __init__(self):
+        self.extractor = get_article_extractor()
+
+    def fetch(self, url: str) -> bytes:
+        if BROKEN in url:
+            raise IOError("Could not download {}".format(url))
+        with open(
+            os.path.join(FIXTURES_DIR, self.extractor.get_outlet(url) + ".html"), "rb"
+        ) as fixture:
+            return fixture.read()
+
+    def fetch_all(self, urls: List[str]) -> Dict[str, Any]:
+        html_contents = {}
+        for url in urls:
+            try:
+                html_contents[url] = self.fetch(url)
+            except IOError as error:
+                html_contents[url] = error
+        return html_contents
+
+    def close(self) -> None:
+        pass
+
+
+class FakeClock:
+    """
+    Stands in for the time module of the module under test, so leases, expiry and backoff are tested without
+    waiting.
+
+    Args:
+        now (float): The starting time, as a UTC timestamp.
+    """
+
+    def __init__(self, now: float = 1700000000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def article_url(outlet: str, name: str) -> str:
+    """
+    Builds an article URL on the website of an outlet.
+
+    Args:
+        outlet (str): The outlet name, as in benchmarks/fixtures/html.
+        name (str): The name of the article.
+
+    Returns:
+        str: The URL.
+    """
+    domain = get_article_extractor().outlets[outlet]["domains"][0]
+    return "https://{}/{}.html".format(domain, name)
+
+
+@pytest.fixture
+def clock():
+    """
+    Returns:
+        FakeClock: A clock to patch over the time module of the module under test.
+    """
+    return FakeClock()
+
+
+@pytest.fixture
+def error_log(tmp_path, monkeypatch):
+    """
+    Points error.log at the scratch folder.
+
+    Returns:
+        str: The path of the error log.
+    """
+    path = str(tmp_path / "error.log")
+    monkeypatch.setattr(logs_helper, "ERROR_LOG", path)
+    return path
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch, error_log):
+    """
+    Points the bot at the saved pages, the hashing encoder and a scratch folder for its databases. Every parameter
+    is restored after the test.
+
+    Returns:
+        dict: The bot parameters, which the test can change further.
+    """
+    if find_missing_resources():
+        pytest.skip("the NLTK data isn't installed")
+
+    def store(name: str) -> str:
+        return str(tmp_path / name)
+
+    settings = {
+        "subreddits": ["test"],
+        "whitelist": sorted(
+            {
+                fetcher.get_domain(article_url(outlet, "article"))
+                for outlet in ["noticias_ao_minuto", "tsf", "rr"]
+            }
+        ),
+        "sentence_transfomer": FAKE_ENCODER,
+        "encoder_backend": "torch",
+        "nltk": dict(PARAMETERS["nltk"], download=False),
+        "processed_posts": {"path": store("processed_posts.db"), "legacy_log": None},
+        "summary_cache": dict(
+            PARAMETERS["summary_cache"], path=store("summary_cache.db")
+        ),
+        "html_cache": dict(PARAMETERS["html_cache"], enabled=False),
+        "embedding_cache": dict(PARAMETERS["embedding_cache"], path=None),
+        "claims": dict(PARAMETERS["claims"], backend="sqlite", path=store("claims.db")),
+        "reply_queue": dict(
+            PARAMETERS["reply_queue"], path=store("reply_queue.db"), max_wait_seconds=5
+        ),
+        "metrics": dict(PARAMETERS["metrics"], path=None),
+        "daemon": dict(PARAMETERS["daemon"], poll_seconds=0.1),
+    }
+    for key, value in settings.items():
+        monkeypatch.setitem(PARAMETERS, key, value)
+    monkeypatch.setitem(
+        model_registry._MODELS, (FAKE_ENCODER, "torch"), HashingEncoder()
+    )
+    return PARAMETERS
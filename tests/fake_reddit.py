@@ -0,0 +1,206 @@
+import itertools
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+
+class FakeComment:
+    """
+    A comment posted on a fake submission.
+
+    Args:
+        submission (FakeSubmission): The submission that was replied to.
+        body (str): The text of the comment.
+    """
+
+    def __init__(self, submission: "FakeSubmission", body: str):
+        self.submission = submission
+        self.body = body
+
+
+class FakeSubmission:
+    """
+    A local stand-in for praw.models.Submission.
+
+    Args:
+        id (str): The ID of the submission.
+        url (str): The URL the submission links to.
+        subreddit (str): The name of the subreddit it was posted to.
+        title (str): The title of the submission.
+    """
+
+    def __init__(self, id: str, url: str, subreddit: str, title: str = ""):
+        self.id = id
+        self.url = url
+        self.subreddit = subreddit
+        self.title = title
+        self.created_utc = time.time()
+        self.reddit: Optional["FakeReddit"] = None
+
+    def reply(self, body: str) -> FakeComment:
+        """
+        Records a reply instead of posting it.
+
+        Args:
+            body (str): The text of the comment.
+
+        Returns:
+            FakeComment: The recorded comment.
+        """
+        comment = FakeComment(self, body)
+        if self.reddit is not None:
+            with self.reddit.lock:
+                self.reddit.replies.append(comment)
+        return comment
+
+
+class _FakeStream:
+    """A local stand-in for praw.models.reddit.subreddit.SubredditStream."""
+
+    def __init__(self, subreddit: "FakeSubreddit"):
+        self.subreddit = subreddit
+
+    def submissions(
+        self, skip_existing: bool = False, pause_after: Optional[int] = None
+    ) -> Iterator[Optional[FakeSubmission]]:
+        """
+        Yields the submissions of the subreddit, oldest first, including the ones added while streaming.
+
+        The stream ends once every submission was yielded, unless the FakeReddit was created with stream_forever,
+        in which case it keeps waiting for new ones.
+
+        Args:
+            skip_existing (bool): Whether to skip the submissions that exist when the stream starts.
+            pause_after (int): When not None, None is yielded whenever there are no new submissions.
+
+        Yields:
+            FakeSubmission: The next submission, or None.
+        """
+        reddit = self.subreddit.reddit
+        seen = set()
+        if skip_existing:
+            seen.update(submission.id for submission in self.subreddit.submissions())
+
+        while True:
+            new_submissions = [
+                submission
+                for submission in reversed(self.subreddit.submissions())
+                if submission.id not in seen
+            ]
+            for submission in new_submissions:
+                seen.add(submission.id)
+                yield submission
+
+            if not new_submissions:
+                if not reddit.stream_forever:
+                    return
+                if pause_after is not None:
+                    yield None
+                time.sleep(reddit.poll_interval)
+
+
+class FakeSubreddit:
+    """
+    A local stand-in for praw.models.Subreddit. Names joined by "+" stand for several subreddits, like in PRAW.
+
+    Args:
+        reddit (FakeReddit): The fake Reddit instance.
+        display_name (str): The name of the subreddit.
+    """
+
+    def __init__(self, reddit: "FakeReddit", display_name: str):
+        self.reddit = reddit
+        self.display_name = display_name
+        self.stream = _FakeStream(self)
+
+    def submissions(self) -> List[FakeSubmission]:
+        """
+        Returns the submissions of the subreddit, newest first.
+
+        Returns:
+            list: The submissions.
+        """
+        names = set(self.display_name.lower().split("+"))
+        with self.reddit.lock:
+            return [
+                submission
+                for submission in reversed(self.reddit.all_submissions)
+                if submission.subreddit.lower() in names
+            ]
+
+    def new(self, limit: Optional[int] = 100) -> Iterator[FakeSubmission]:
+        """
+        Returns the newest submissions of the subreddit.
+
+        Args:
+            limit (int): The maximum number of submissions, None for all of them.
+
+        Returns:
+            iterator: The submissions, newest first.
+        """
+        return itertools.islice(iter(self.submissions()), limit)
+
+
+class FakeReddit:
+    """
+    A local stand-in for praw.Reddit, so the bot can run without network access or Reddit credentials.
+
+    Submissions are added with add_submission and the bot's replies are recorded in the replies list.
+
+    Args:
+        submissions (list): The initial submissions, oldest first.
+        stream_forever (bool): Whether submission streams wait for new submissions instead of ending.
+        poll_interval (float): Seconds between checks for new submissions of a stream that waits forever.
+    """
+
+    def __init__(
+        self,
+        submissions: Optional[List[FakeSubmission]] = None,
+        stream_forever: bool = False,
+        poll_interval: float = 0.1,
+    ):
+        self.stream_forever = stream_forever
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.all_submissions: List[FakeSubmission] = []
+        self.replies: List[FakeComment] = []
+        self._by_id: Dict[str, FakeSubmission] = {}
+        for submission in submissions or []:
+            self.add_submission(submission)
+
+    def add_submission(self, submission: FakeSubmission) -> None:
+        """
+        Posts a submission.
+
+        Args:
+            submission (FakeSubmission): The submission.
+        """
+        submission.reddit = self
+        with self.lock:
+            self.all_submissions.append(submission)
+            self._by_id[submission.id] = submission
+
+    def subreddit(self, display_name: str) -> FakeSubreddit:
+        """
+        Returns a subreddit, or several joined by "+".
+
+        Args:
+            display_name (str): The name of the subreddit.
+
+        Returns:
+            FakeSubreddit: The subreddit.
+        """
+        return FakeSubreddit(self, display_name)
+
+    def submission(self, id: str) -> FakeSubmission:
+        """
+        Returns a submission by its ID.
+
+        Args:
+            id (str): The ID of the submission.
+
+        Returns:
+            FakeSubmission: The submission.
+        """
+        with self.lock:
+            return self._by_id[id]
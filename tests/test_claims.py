@@ -0,0 +1,91 @@
+import pytest
+
+import claims
+from claims import KeyValueClaimStore, MemoryKeyValueClient, SQLiteClaimStore
+
+LEASE_SECONDS = 60
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def make_store(request, tmp_path, monkeypatch, clock):
+    """
+    Returns:
+        callable: Opens the claim store of an instance, sharing its claims with the other instances of the test.
+    """
+    monkeypatch.setattr(claims, "time", clock)
+    client = MemoryKeyValueClient()
+    stores = []
+
+    def make(owner):
+        if request.param == "sqlite":
+            store = SQLiteClaimStore(
+                str(tmp_path / "claims.db"), owner, lease_seconds=LEASE_SECONDS
+            )
+        else:
+            store = KeyValueClaimStore(client, owner, lease_seconds=LEASE_SECONDS)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def test_a_held_post_is_not_claimed_by_another_instance(make_store):
+    first, second = make_store("first"), make_store("second")
+
+    assert first.claim("p1")
+    assert not second.claim("p1")
+    # Claiming again renews the lease of the holder
+    assert first.claim("p1")
+
+
+def test_an_expired_lease_is_taken_over(make_store, clock):
+    first, second = make_store("first"), make_store("second")
+    assert first.claim("p1")
+
+    clock.advance(LEASE_SECONDS + 1)
+    assert second.claim("p1")
+
+    # The instance that lost the lease must not reply
+    assert not first.complete("p1")
+    assert second.complete("p1")
+
+
+def test_a_finished_post_is_never_claimed_again(make_store, clock):
+    first, second = make_store("first"), make_store("second")
+    assert first.claim("p1")
+    assert not second.is_finished("p1")
+
+    assert first.fail("p1")
+    clock.advance(LEASE_SECONDS + 1)
+
+    assert second.is_finished("p1")
+    assert not second.claim("p1")
+    assert not first.claim("p1")
+
+
+def test_released_claims_are_taken_right_away(make_store):
+    first, second = make_store("first"), make_store("second")
+    assert first.claim_many(["p1", "p2"]) == ["p1", "p2"]
+
+    first.release_all()
+
+    assert second.claim_many(["p1", "p2"]) == ["p1", "p2"]
+    assert not second.is_finished("p1")
+
+
+def test_compact_removes_old_finished_posts(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(claims, "time", clock)
+    store = SQLiteClaimStore(str(tmp_path / "claims.db"), "first")
+    store.claim("old")
+    store.complete("old")
+    clock.advance(2 * 24 * 60 * 60)
+    store.claim("new")
+    store.complete("new")
+    store.claim("held")
+
+    assert store.compact(retention_days=1) == 1
+    assert not store.is_finished("old")
+    assert store.is_finished("new")
+    store.close()
@@ -0,0 +1,71 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+class CountingEncoder:
+    """Embeds a sentence as its length, counting the sentences it encoded."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, sentences):
+        self.encoded.extend(sentences)
+        return np.array([[len(sentence), 1.0] for sentence in sentences], np.float32)
+
+
+def test_only_new_sentences_are_encoded():
+    cache = EmbeddingCache("model")
+    encoder = CountingEncoder()
+
+    first = cache.encode(["a", "bb", "a"], encoder)
+    second = cache.encode(["bb", "ccc"], encoder)
+
+    assert encoder.encoded == ["a", "bb", "ccc"]
+    np.testing.assert_array_equal(first, [[1, 1], [2, 1], [1, 1]])
+    np.testing.assert_array_equal(second, [[2, 1], [3, 1]])
+    assert cache.stats["memory_hits"] == 1
+    assert cache.stats["misses"] == 3
+
+
+def test_the_least_recently_used_sentence_is_evicted():
+    cache = EmbeddingCache("model", max_entries=2)
+    encoder = CountingEncoder()
+    cache.encode(["a", "bb"], encoder)
+    cache.encode(["a"], encoder)
+
+    cache.encode(["ccc"], encoder)
+    cache.encode(["a", "bb"], encoder)
+
+    assert encoder.encoded == ["a", "bb", "ccc", "bb"]
+
+
+def test_embeddings_are_kept_as_float16_and_returned_as_float32():
+    cache = EmbeddingCache("model", dtype="float16")
+    embeddings = cache.encode(["a"], CountingEncoder())
+
+    assert embeddings.dtype == np.float32
+    assert next(iter(cache._memory.values())).dtype == np.float16
+
+
+def test_embeddings_are_kept_on_disk_between_runs(tmp_path):
+    encoder = CountingEncoder()
+    cache = EmbeddingCache("model", path=str(tmp_path), max_disk_entries=2)
+    cache.encode(["a", "bb", "ccc"], encoder)
+    cache.close()
+
+    # The disk store is a ring of max_disk_entries rows, the oldest sentence was overwritten
+    cache = EmbeddingCache("model", path=str(tmp_path), max_disk_entries=2)
+    embeddings = cache.encode(["a", "bb", "ccc"], encoder)
+    cache.close()
+
+    assert encoder.encoded == ["a", "bb", "ccc", "a"]
+    assert cache.stats["disk_hits"] == 2
+    np.testing.assert_array_equal(embeddings, [[1, 1], [2, 1], [3, 1]])
+
+    # Another model doesn't use the embeddings
+    other = EmbeddingCache("other model", path=str(tmp_path))
+    other.encode(["a"], encoder)
+    other.close()
+    assert encoder.encoded[-1] == "a"
+    assert other.stats["disk_hits"] == 0
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+import html_cache
+from html_cache import HtmlCache
+
+# Random pages don't compress, so each takes about its own size in the cache
+PAGE_BYTES = 400 * 1024
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(html_cache, "time", clock)
+    cache = HtmlCache(
+        str(tmp_path / "html_cache.db"), max_megabytes=1, fresh_minutes=10
+    )
+    yield cache
+    cache.close()
+
+
+def test_pages_are_stored_with_their_validators(cache):
+    cache.put("https://www.example.pt/a", b"<html>a</html>", '"v1"', "Mon, 01 Jan")
+
+    page = cache.get("https://example.pt/a")
+    assert page.content == b"<html>a</html>"
+    assert (page.etag, page.last_modified) == ('"v1"', "Mon, 01 Jan")
+    assert cache.get("https://example.pt/b") is None
+
+
+def test_pages_are_fresh_until_revalidated(cache, clock):
+    cache.put("https://example.pt/a", b"<html>a</html>")
+    assert cache.is_fresh(cache.get("https://example.pt/a"))
+
+    clock.advance(10 * 60 + 1)
+    assert not cache.is_fresh(cache.get("https://example.pt/a"))
+
+    cache.touch("https://example.pt/a")
+    assert cache.is_fresh(cache.get("https://example.pt/a"))
+
+
+def test_the_least_recently_used_pages_are_evicted_above_the_size_limit(cache, clock):
+    cache.put("https://example.pt/a", os.urandom(PAGE_BYTES))
+    clock.advance(1)
+    cache.put("https://example.pt/b", os.urandom(PAGE_BYTES))
+    clock.advance(1)
+    assert cache.get("https://example.pt/a") is not None
+    clock.advance(1)
+
+    cache.put("https://example.pt/c", os.urandom(PAGE_BYTES))
+
+    assert cache.urls() == ["https://example.pt/a", "https://example.pt/c"]
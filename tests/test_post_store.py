@@ -0,0 +1,57 @@
+import post_store
+from post_store import ProcessedPostStore
+
+
+def test_batched_ids_are_seen_before_they_are_written(tmp_path):
+    path = str(tmp_path / "processed_posts.db")
+    store = ProcessedPostStore(path, write_batch_size=10, legacy_log=None)
+    store.add_many(["p1", "p2"])
+
+    assert "p1" in store
+    assert store.filter_unseen(["p3", "p1", "p2", "p4"]) == ["p3", "p4"]
+    store.close()
+
+    # Closing the store writes the pending IDs
+    with ProcessedPostStore(path, legacy_log=None) as store:
+        assert len(store) == 2
+
+
+def test_the_listing_mark_is_kept_between_runs(tmp_path):
+    path = str(tmp_path / "processed_posts.db")
+    with ProcessedPostStore(path, legacy_log=None) as store:
+        assert store.get_listing_mark("a+b") is None
+        store.set_listing_mark("a+b", 100.0)
+        store.set_listing_mark("a+b", 150.5)
+        store.set_listing_mark("c", 10.0)
+
+    with ProcessedPostStore(path, legacy_log=None) as store:
+        assert store.get_listing_mark("a+b") == 150.5
+        assert store.get_listing_mark("c") == 10.0
+
+
+def test_compact_removes_old_ids(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(post_store, "time", clock)
+    with ProcessedPostStore(
+        str(tmp_path / "processed_posts.db"), legacy_log=None
+    ) as store:
+        store.add("old")
+        clock.advance(3 * 24 * 60 * 60)
+        store.add("new")
+
+        assert store.compact(retention_days=2) == 1
+        assert "old" not in store
+        assert "new" in store
+
+
+def test_the_legacy_log_is_imported_into_an_empty_store(tmp_path):
+    legacy_log = tmp_path / "processed_posts.txt"
+    legacy_log.write_text("p1\np2\n\n", encoding="utf-8")
+    path = str(tmp_path / "processed_posts.db")
+
+    with ProcessedPostStore(path, legacy_log=str(legacy_log)) as store:
+        assert store.filter_unseen(["p1", "p2", "p3"]) == ["p3"]
+
+    # Not imported again once the store has IDs
+    legacy_log.write_text("p4\n", encoding="utf-8")
+    with ProcessedPostStore(path, legacy_log=str(legacy_log)) as store:
+        assert "p4" not in store
@@ -0,0 +1,180 @@
+from types import SimpleNamespace
+
+import pytest
+from praw.exceptions import RedditAPIException
+from prawcore.exceptions import TooManyRequests
+
+import reply_queue
+from reply_queue import (
+    RETRY_BACKOFF_SECONDS,
+    ReplyQueue,
+    ReplySender,
+    get_budget_wait,
+    get_retry_after,
+)
+
+
+def rate_limit_error(message):
+    return RedditAPIException([["RATELIMIT", message, "ratelimit"]])
+
+
+class FlakySubmission:
+    """
+    A submission whose replies fail with the given errors before they succeed.
+
+    Args:
+        id (str): The ID of the submission.
+        errors (list): The exceptions raised by the first replies.
+    """
+
+    def __init__(self, id, errors=()):
+        self.id = id
+        self.errors = list(errors)
+        self.replies = []
+
+    def reply(self, body):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.replies.append(body)
+
+
+class SubmissionsReddit:
+    """
+    A Reddit instance that only returns the given submissions.
+
+    Args:
+        submissions (list): The submissions.
+    """
+
+    def __init__(self, submissions):
+        self.submissions = {submission.id: submission for submission in submissions}
+
+    def submission(self, id):
+        return self.submissions[id]
+
+
+@pytest.fixture
+def make_sender(tmp_path, monkeypatch, clock, error_log):
+    """
+    Returns:
+        callable: Creates the sender of an instance, with a queue in a database shared by the instances of the
+        test.
+    """
+    monkeypatch.setattr(reply_queue, "time", clock)
+    queues = []
+
+    def make(submissions, owner="first"):
+        queue = ReplyQueue(
+            str(tmp_path / "reply_queue.db"),
+            max_attempts=3,
+            owner=owner,
+            lease_seconds=60,
+        )
+        queues.append(queue)
+        return ReplySender(SubmissionsReddit(submissions), queue)
+
+    yield make
+    for queue in queues:
+        queue.close()
+
+
+def test_get_retry_after():
+    assert get_retry_after(rate_limit_error("Take a break for 9 minutes.")) == 540
+    assert get_retry_after(rate_limit_error("Try again in 30 seconds.")) == 30
+    default = reply_queue.DEFAULT_RATELIMIT_SECONDS
+    assert get_retry_after(rate_limit_error("Wait.")) == default
+    response = SimpleNamespace(headers={"retry-after": "12"}, status_code=429, text="")
+    assert get_retry_after(TooManyRequests(response)) == 12
+    assert get_retry_after(ValueError("other")) is None
+
+
+def test_get_budget_wait(monkeypatch, clock):
+    monkeypatch.setattr(reply_queue, "time", clock)
+    reddit = SimpleNamespace(
+        auth=SimpleNamespace(
+            limits={"remaining": 0, "reset_timestamp": clock.time() + 30}
+        )
+    )
+    assert get_budget_wait(reddit) == 30
+
+    reddit.auth.limits["remaining"] = 5
+    assert get_budget_wait(reddit) == 0
+
+
+def test_a_rate_limited_reply_waits_without_using_an_attempt(make_sender, clock):
+    submission = FlakySubmission(
+        "p1", [rate_limit_error("Take a break for 2 minutes.")] * 5
+    )
+    sender = make_sender([submission])
+    sender.submit(submission, "summary")
+
+    for _ in range(5):
+        assert sender.send_due() == 120
+        clock.advance(120)
+
+    assert sender.send_due() is None
+    assert submission.replies == ["summary"]
+    assert len(sender.queue) == 0
+
+
+def test_a_failed_reply_is_retried_with_backoff_and_then_dropped(
+    make_sender, clock, error_log
+):
+    submission = FlakySubmission("p1", [ValueError("timeout")] * 3)
+    sender = make_sender([submission])
+    sender.submit(submission, "summary")
+
+    assert sender.send_due() == RETRY_BACKOFF_SECONDS
+    clock.advance(RETRY_BACKOFF_SECONDS)
+    assert sender.send_due() == 2 * RETRY_BACKOFF_SECONDS
+    clock.advance(2 * RETRY_BACKOFF_SECONDS)
+
+    # The third failure uses the last of max_attempts
+    assert sender.send_due() is None
+    assert submission.replies == []
+    assert len(sender.queue) == 0
+    with open(error_log, encoding="utf-8") as log_file:
+        assert "p1" in log_file.read()
+
+
+def test_a_reply_reddit_refuses_is_dropped_right_away(make_sender):
+    error = RedditAPIException([["THREAD_LOCKED", "Comments are locked.", None]])
+    submission = FlakySubmission("p1", [error])
+    sender = make_sender([submission])
+    sender.submit(submission, "summary")
+
+    assert sender.send_due() is None
+    assert len(sender.queue) == 0
+
+
+def test_replies_left_by_an_earlier_run_are_posted(make_sender):
+    submission = FlakySubmission("p1")
+    make_sender([]).queue.put("p1", "summary")
+
+    sender = make_sender([submission], owner="second")
+    assert sender.send_due() is None
+    assert submission.replies == ["summary"]
+
+
+def test_a_reply_taken_by_another_instance_is_left_to_it(make_sender):
+    first = make_sender([])
+    second = make_sender([], owner="second")
+    first.queue.put("p1", "summary")
+
+    assert first.queue.take("p1")
+    assert second.queue.next_due() is None
+    assert not second.queue.take("p1")
+
+
+def test_a_reply_whose_instance_stopped_while_posting_it_is_dropped(make_sender, clock):
+    submission = FlakySubmission("p1")
+    first = make_sender([submission])
+    first.queue.put("p1", "summary")
+    assert first.queue.take("p1")
+
+    # The first instance crashed before removing the reply, it may already be on Reddit
+    clock.advance(61)
+    second = make_sender([submission], owner="second")
+    assert second.send_due() is None
+    assert submission.replies == []
+    assert len(second.queue) == 0
@@ -0,0 +1,20 @@
+from scraper import get_article_extractor
+
+PAGE = """<html><head><title>Título</title></head><body>
+<div class="news-main-text content"><p>Texto do artigo.</p></div>
+<div class="content"><p>Mais lidas.</p></div>
+</body></html>"""
+
+
+def test_only_the_outlets_classes_are_searched():
+    # The sidebar has sapo_24's class, which the original scraper added to every outlet's body
+    title, body = get_article_extractor().extract(
+        PAGE, "https://www.noticiasaominuto.com/artigo.html"
+    )
+    assert title == "Título"
+    assert body == "Texto do artigo."
+
+
+def test_other_websites_are_searched_with_every_outlets_classes():
+    _, body = get_article_extractor().extract(PAGE, "https://example.com/artigo.html")
+    assert body == "Texto do artigo. Mais lidas."
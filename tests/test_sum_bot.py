@@ -0,0 +1,104 @@
+from typing import List
+
+import pytest
+
+import fetcher
+import sum_bot
+from claims import SQLiteClaimStore
+from conftest import BROKEN, FixtureFetcher, article_url
+from fake_reddit import FakeReddit, FakeSubmission
+from post_store import ProcessedPostStore
+
+
+def make_submissions() -> List[FakeSubmission]:
+    """
+    Builds the posts of a run: three articles, a cross-post of one of them, an article that can't be downloaded and
+    a website that isn't whitelisted.
+
+    Returns:
+        list: The submissions, oldest first.
+    """
+    return [
+        FakeSubmission("a1", article_url("noticias_ao_minuto", "a1"), "test"),
+        FakeSubmission("a2", article_url("tsf", "a2"), "test"),
+        FakeSubmission("a3", article_url("rr", "a3"), "test"),
+        FakeSubmission("a4", article_url("noticias_ao_minuto", "a1"), "test"),
+        FakeSubmission("a5", article_url("tsf", BROKEN), "test"),
+        FakeSubmission("a6", "https://example.com/a6.html", "test"),
+    ]
+
+
+def replied_ids(reddit: FakeReddit) -> List[str]:
+    return sorted(comment.submission.id for comment in reddit.replies)
+
+
+def run_bot(reddit: FakeReddit) -> None:
+    fetcher.set_fetcher(FixtureFetcher())
+    sum_bot.sum_bot_init(reddit)
+
+
+@pytest.mark.parametrize("mode", ["serial", "batch", "pipeline"])
+def test_replies_once_to_each_whitelisted_post(bot, mode):
+    bot["mode"] = mode
+    reddit = FakeReddit(make_submissions())
+
+    run_bot(reddit)
+
+    assert replied_ids(reddit) == ["a1", "a2", "a3", "a4"]
+    for comment in reddit.replies:
+        assert comment.submission.url in comment.body
+
+    # The failed post is recorded so it isn't retried on every run
+    store = ProcessedPostStore(bot["processed_posts"]["path"], legacy_log=None)
+    try:
+        assert "a5" in store
+    finally:
+        store.close()
+
+    # Nothing is left to answer on the next run
+    run_bot(reddit)
+    assert replied_ids(reddit) == ["a1", "a2", "a3", "a4"]
+
+
+@pytest.mark.parametrize("mode", ["serial", "pipeline"])
+def test_replies_once_to_each_new_post(bot, mode):
+    bot["mode"] = mode
+    reddit = FakeReddit(make_submissions())
+
+    run_bot(reddit)
+    reddit.add_submission(FakeSubmission("b1", article_url("rr", "b1"), "test"))
+    run_bot(reddit)
+
+    assert replied_ids(reddit) == ["a1", "a2", "a3", "a4", "b1"]
+
+
+@pytest.mark.parametrize("mode", ["batch", "pipeline"])
+def test_daemon_replies_to_streamed_posts(bot, mode):
+    bot["mode"] = mode
+    reddit = FakeReddit(make_submissions())
+
+    fetcher.set_fetcher(FixtureFetcher())
+    sum_bot.sum_bot_daemon(reddit)
+
+    assert replied_ids(reddit) == ["a1", "a2", "a3", "a4"]
+
+
+def test_posts_answered_by_another_instance_are_recorded(bot):
+    bot["mode"] = "serial"
+    submissions = make_submissions()[:2]
+    reddit = FakeReddit(submissions)
+    other = SQLiteClaimStore(bot["claims"]["path"], "other")
+    other.claim("a1")
+    other.complete("a1")
+    other.close()
+
+    run_bot(reddit)
+
+    assert replied_ids(reddit) == ["a2"]
+    store = ProcessedPostStore(bot["processed_posts"]["path"], legacy_log=None)
+    try:
+        assert "a1" in store
+        # Every listed post is handled, the next run stops at the newest one
+        assert store.get_listing_mark("test") == submissions[-1].created_utc
+    finally:
+        store.close()
@@ -0,0 +1,66 @@
+import pytest
+
+import summary_cache
+from summary_cache import SummaryCache, normalize_url
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(summary_cache, "time", clock)
+    cache = SummaryCache(
+        str(tmp_path / "summary_cache.db"), "model|3", ttl_hours=1, max_entries=2
+    )
+    yield cache
+    cache.close()
+
+
+def test_normalize_url():
+    url = "http://www.Example.pt/artigo/?utm_source=x&id=1&fbclid=y#top"
+    assert normalize_url(url) == "https://example.pt/artigo?id=1"
+
+
+def test_cross_posts_are_found_by_url_and_by_text(cache):
+    cache.put("https://www.example.pt/a", "body", "Title", "Summary.", ["news"])
+
+    assert cache.get_by_url("https://example.pt/a/?utm_medium=social") == (
+        "Title",
+        "Summary.",
+        ["news"],
+    )
+    assert cache.get_by_body("body") == ("Title", "Summary.", ["news"])
+    assert cache.get_by_body("other body") is None
+    assert cache.stats == {"url_hits": 1, "body_hits": 1, "misses": 1}
+
+
+def test_entries_expire(cache, clock):
+    cache.put("https://example.pt/a", "body", "Title", "Summary.", [])
+    clock.advance(60 * 60 + 1)
+
+    assert cache.get_by_url("https://example.pt/a") is None
+    assert cache.get_by_body("body") is None
+
+
+def test_the_least_recently_used_entry_is_evicted(cache, clock):
+    cache.put("https://example.pt/a", "a", "A", "A.", [])
+    clock.advance(1)
+    cache.put("https://example.pt/b", "b", "B", "B.", [])
+    clock.advance(1)
+    assert cache.get_by_url("https://example.pt/a") is not None
+    clock.advance(1)
+
+    cache.put("https://example.pt/c", "c", "C", "C.", [])
+
+    assert cache.get_by_url("https://example.pt/a") is not None
+    assert cache.get_by_url("https://example.pt/b") is None
+    assert cache.get_by_url("https://example.pt/c") is not None
+
+
+def test_entries_of_other_settings_are_not_used(cache, tmp_path):
+    cache.put("https://example.pt/a", "body", "Title", "Summary.", [])
+
+    other = SummaryCache(str(tmp_path / "summary_cache.db"), "model|5")
+    try:
+        assert other.get_by_url("https://example.pt/a") is None
+        assert other.get_by_body("body") is None
+    finally:
+        other.close()